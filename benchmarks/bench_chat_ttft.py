@@ -0,0 +1,197 @@
+"""Time-to-first-token of a chat answer: the old sequential flow versus the pipelined process_question.
+
+A stub Ollama server (embeddings and streamed chat, with configurable latencies) runs in-process,
+so no model is needed. The sequential flow retrieves, decrypts every retrieved full-size screenshot
+to a temp file and only then calls the LLM, as process_question used to. The answer cache is cleared
+before every request.
+
+Usage:
+    python -m benchmarks.bench_chat_ttft --activities 200 --repeats 10 --first-token-ms 150
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DIMENSIONS = 64
+
+def fake_embedding(text):
+    digest = hashlib.sha256(" ".join(text.lower().split()).encode()).digest()
+    return [(digest[index % len(digest)] - 128) / 128 for index in range(DIMENSIONS)]
+
+def make_handler(embed_ms, first_token_ms, token_ms, tokens):
+    class StubOllama(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, body):
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            self._json({"status": "Ollama is running"})
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if self.path == "/api/embeddings":
+                time.sleep(embed_ms / 1000)
+                self._json({"embedding": fake_embedding(request["prompt"])})
+            elif self.path == "/api/embed":
+                time.sleep(embed_ms / 1000)
+                self._json({"embeddings": [fake_embedding(text) for text in request["input"]]})
+            elif self.path == "/api/chat":
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                time.sleep(first_token_ms / 1000)
+                try:
+                    for index in range(tokens + 1):
+                        done = index == tokens
+                        line = json.dumps({
+                            "model": request["model"],
+                            "created_at": datetime.now(timezone.utc).isoformat(),
+                            "message": {"role": "assistant", "content": "" if done else f"word{index} "},
+                            "done": done,
+                        }).encode() + b"\n"
+                        self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                        self.wfile.flush()
+                        if not done:
+                            time.sleep(token_ms / 1000)
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The benchmark stops reading after the first token
+                    self.close_connection = True
+            else:
+                self.send_error(404)
+    return StubOllama
+
+def populate(chat, activities, width, height):
+    """Store `activities` processed captures with encrypted full-size screenshots and thumbnails."""
+    from PIL import Image
+    from src.localrecall.data_manager import STATUS_PROCESSED
+    from src.localrecall.frame_encoder import FrameEncoder, PngCodec
+    from src.localrecall.previews import shared_preview_loader
+
+    encoder = FrameEncoder(shared_preview_loader().encryption_manager, PngCodec())
+    frame = Image.effect_noise((width, height), 40).convert("RGB")
+    data_manager = chat.searcher.data_manager
+    conn = data_manager._connection()
+    now = datetime.now(timezone.utc)
+    rows = []
+    os.makedirs("screenshots", exist_ok=True)
+    for index in range(activities):
+        created_at = now - timedelta(minutes=index)
+        window = {"title": f"Project notes {index % 7}", "process_name": "code.exe"}
+        path = os.path.abspath(os.path.join("screenshots", f"screenshot_{index:05d}.png.encrypted"))
+        # Encoding every frame is slow; most activities share the first few screenshots
+        if index < 10:
+            encoder.encode(frame, path)
+        else:
+            path = os.path.abspath(os.path.join("screenshots", f"screenshot_{index % 10:05d}.png.encrypted"))
+        rows.append({
+            "timestamp": f"bench_{index:05d}",
+            "created_at": created_at.isoformat(),
+            "screenshot_path": path,
+            "active_window": window,
+            "analysis": f"Current Activity Title: {window['title']}\nThe user is editing notes about topic {index % 13}.",
+        })
+    conn.executemany('''
+        INSERT INTO activities (created_at, timestamp, screenshot_path, active_window, user_apps, analysis, processed,
+                                created_ts, process_name, title)
+        VALUES (?, ?, ?, ?, '[]', ?, ?, ?, ?, ?)
+    ''', [(row["created_at"], row["timestamp"], row["screenshot_path"], json.dumps(row["active_window"]), row["analysis"],
+           STATUS_PROCESSED, datetime.fromisoformat(row["created_at"]).timestamp(), "code.exe", row["active_window"]["title"])
+          for row in rows])
+    chat.vector_data_manager.add_activities(rows)
+    encoder.shutdown()
+
+async def sequential_ttft(chat, question):
+    """The flow before pipelining: search, decrypt every full screenshot, then start the LLM."""
+    from src.localrecall.previews import shared_preview_loader
+    from src.localrecall.utils import run_blocking
+
+    started = time.perf_counter()
+    related_documents, context = await chat.process_prompt(question, None, [])
+    encryption_manager = shared_preview_loader().encryption_manager
+    paths = await asyncio.gather(*[run_blocking(encryption_manager.decrypt_file, document["metadata"]["screenshot_path"])
+                                   for document in related_documents])
+    try:
+        async for _ in chat.generate_answer(context.history, context.prompt):
+            return time.perf_counter() - started
+    finally:
+        for path in paths:
+            os.remove(path)
+
+async def pipelined_ttft(chat, question):
+    from src.localrecall.chat_events import EVENT_TOKEN
+
+    started = time.perf_counter()
+    ttft = None
+    async for event in chat.process_question(question, [], None):
+        if ttft is None and event.type == EVENT_TOKEN:
+            ttft = time.perf_counter() - started
+    return ttft
+
+async def measure(chat, function, repeats):
+    samples = []
+    for repeat in range(repeats):
+        chat.answer_cache.clear()
+        # A new question each time, so neither flow gets the other's cached embeddings
+        samples.append(await function(chat, f"What was I writing in my project notes? ({function.__name__} {repeat})"))
+    return 1000 * statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat time-to-first-token benchmark")
+    parser.add_argument("--activities", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--embed-ms", type=float, default=20)
+    parser.add_argument("--first-token-ms", type=float, default=150)
+    parser.add_argument("--token-ms", type=float, default=10)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--width", type=int, default=2560)
+    parser.add_argument("--height", type=int, default=1440)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(args.embed_ms, args.first_token_ms, args.token_ms, args.tokens))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ.setdefault("ENCRYPTION_PASSWORD", "benchmark")
+    # Databases, vectors and screenshots all live under the working directory
+    os.chdir(tempfile.mkdtemp(prefix="localrecall_bench_"))
+
+    from src.localrecall.chat import LocalModelChat
+    chat = LocalModelChat()
+    populate(chat, args.activities, args.width, args.height)
+
+    async def run():
+        # One untimed request each so connections and caches are warm
+        await sequential_ttft(chat, "warm up")
+        await pipelined_ttft(chat, "warm up")
+        sequential = await measure(chat, sequential_ttft, args.repeats)
+        pipelined = await measure(chat, pipelined_ttft, args.repeats)
+        await chat.aclose()
+        return sequential, pipelined
+
+    sequential, pipelined = asyncio.run(run())
+    print(f"stub LLM first token after {args.first_token_ms:.0f} ms, {args.width}x{args.height} screenshots")
+    print(f"{'flow':<12}{'median TTFT ms':>16}")
+    print(f"{'sequential':<12}{sequential:>16.1f}")
+    print(f"{'pipelined':<12}{pipelined:>16.1f}")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Micro-benchmark for DataManager writes and backlog reads.
+
+Usage:
+    python -m benchmarks.bench_data_manager --rows 100000
+"""
+import argparse
+import itertools
+import sqlite3
+import tempfile
+import time
+from src.localrecall.data_manager import DataManager, STATUS_PROCESSED
+
+class BenchDataManager(DataManager):
+    """Timestamps are second-resolution primary keys; generate unique ones instead."""
+    _counter = itertools.count()
+
+    def _new_timestamp(self, suffix=""):
+        return f"bench_{next(self._counter):09d}{suffix}"
+
+class LegacyDataManager(BenchDataManager):
+    """Connection-per-call, rollback journal and no indexes, like the original DataManager."""
+
+    def _connection(self):
+        return sqlite3.connect(self.db_path, isolation_level=None)
+
+    def _create_db(self):
+        super()._create_db()
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode = DELETE')
+        conn.execute('DROP INDEX IF EXISTS idx_activities_processed_created_at')
+        conn.execute('DROP INDEX IF EXISTS idx_activities_created_at')
+        conn.close()
+
+def bench_save(manager, rows):
+    window = {"title": "Benchmark - Visual Studio Code", "process_name": "Code.exe"}
+    apps = [window] * 5
+    start = time.perf_counter()
+    for _ in range(rows):
+        manager.save_activity("screenshots/screenshot.png.encrypted", window, apps)
+    return rows / (time.perf_counter() - start)
+
+def bench_fetch(manager, repeats, limit):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        manager.get_unprocessed_activities(limit=limit)
+    return repeats / (time.perf_counter() - start)
+
+def fill_history(manager, rows, pending):
+    """Bulk-load `rows` activities, all processed except the newest `pending` ones."""
+    conn = sqlite3.connect(manager.db_path)
+    conn.executemany('''
+        INSERT INTO activities (created_at, timestamp, screenshot_path, active_window, user_apps, processed)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', ((f"2024-01-01T00:00:00.{i:06d}+00:00", f"history_{i:09d}", "screenshots/screenshot.png.encrypted",
+           '{"title": "history"}', '[]', STATUS_PROCESSED if i < rows - pending else 0) for i in range(rows)))
+    conn.commit()
+    conn.close()
+
+def run(manager_cls, label, rows, pending, save_sample):
+    manager = manager_cls(tempfile.mkdtemp(prefix="localrecall_bench_"))
+    fill_history(manager, rows, pending)
+
+    fetch_rate = bench_fetch(manager, repeats=200, limit=16)
+    save_rate = bench_save(manager, save_sample)
+    plan = sqlite3.connect(manager.db_path).execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM activities WHERE processed = 0 ORDER BY created_at LIMIT 16").fetchall()
+
+    print(f"{label:>8}: save {save_rate:8.0f} rows/s | fetch 16 of {pending} pending in {rows} rows: "
+          f"{fetch_rate:8.0f} calls/s ({fetch_rate * 16:.0f} rows/s) | plan: {plan[0][-1]}")
+
+def main():
+    parser = argparse.ArgumentParser(description="DataManager micro-benchmark")
+    parser.add_argument("--rows", type=int, default=100000, help="Total rows in the table (default: 100000)")
+    parser.add_argument("--pending", type=int, default=1000, help="Rows left unprocessed (default: 1000)")
+    parser.add_argument("--save-sample", type=int, default=2000, help="Number of timed saves on top of the history (default: 2000)")
+    args = parser.parse_args()
+
+    run(LegacyDataManager, "legacy", args.rows, args.pending, args.save_sample)
+    run(BenchDataManager, "pooled", args.rows, args.pending, args.save_sample)
+
+if __name__ == "__main__":
+    main()
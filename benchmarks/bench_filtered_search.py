@@ -0,0 +1,119 @@
+"""Benchmark for filtered retrieval: filters pushed into SQLite/Chroma versus filtering the results afterwards.
+
+Post-filtering has to over-fetch (here `--overfetch` times the wanted results) and can still come
+back short when the filter is selective; pushing the filter down returns exactly the matching
+top results. Embeddings are random vectors so no model server is needed.
+
+Usage:
+    python -m benchmarks.bench_filtered_search --sizes 1000 10000 50000
+"""
+import argparse
+import json
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from src.localrecall.data_manager import DataManager, VectorDataManager, STATUS_PROCESSED
+from src.localrecall.filters import ActivityFilter
+
+APPS = ["chrome.exe", "code.exe", "slack.exe", "outlook.exe", "explorer.exe", "teams.exe", "spotify.exe", "excel.exe"]
+WORDS = ["invoice", "deploy", "review", "budget", "meeting", "kernel", "release", "ticket", "design", "report"]
+DIMENSIONS = 64
+
+class RandomEmbeddingStrategy:
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+
+    def create_embedding(self, text):
+        return [self.random.gauss(0, 1) for _ in range(DIMENSIONS)]
+
+    def create_embeddings(self, texts):
+        return [self.create_embedding(text) for text in texts]
+
+def fill(data_manager, vector_data_manager, size, days):
+    """Load `size` processed activities spread over the last `days` days into both stores."""
+    rng = random.Random(size)
+    now = datetime.now(timezone.utc)
+    activities = []
+    for i in range(size):
+        created_at = now - timedelta(seconds=rng.uniform(0, days * 86400))
+        window = {"title": f"{rng.choice(WORDS)} {i} - {rng.choice(WORDS)}", "process_name": rng.choice(APPS)}
+        activities.append({
+            "timestamp": f"bench_{i:09d}",
+            "created_at": created_at.isoformat(),
+            "screenshot_path": "screenshots/screenshot.png.encrypted",
+            "active_window": window,
+            "analysis": f"Current Activity Title: {window['title']}\n" + " ".join(rng.choices(WORDS, k=12)),
+        })
+    conn = sqlite3.connect(data_manager.db_path)
+    conn.executemany('''
+        INSERT INTO activities (created_at, timestamp, screenshot_path, active_window, user_apps, processed, analysis,
+                                created_ts, process_name, title)
+        VALUES (?, ?, ?, ?, '[]', ?, ?, ?, ?, ?)
+    ''', ((a["created_at"], a["timestamp"], a["screenshot_path"], json.dumps(a["active_window"]), STATUS_PROCESSED,
+           a["analysis"], datetime.fromisoformat(a["created_at"]).timestamp(), a["active_window"]["process_name"],
+           a["active_window"]["title"]) for a in activities))
+    conn.commit()
+    conn.close()
+    vector_data_manager.add_activities(activities, chunk_size=5000)
+
+def passes(activity_filter, metadata):
+    window = json.loads(metadata["active_window"])
+    return ((activity_filter.start_time is None or metadata["created_at"] >= activity_filter.start_time)
+            and (activity_filter.end_time is None or metadata["created_at"] <= activity_filter.end_time)
+            and (not activity_filter.process_names or window["process_name"] in activity_filter.process_names))
+
+def timed(function, repeats):
+    samples, result = [], None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, result
+
+def run(size, days, n_results, overfetch, repeats):
+    data_manager = DataManager(tempfile.mkdtemp(prefix="localrecall_bench_"))
+    vector_data_manager = VectorDataManager(RandomEmbeddingStrategy(), base_dir=tempfile.mkdtemp(prefix="localrecall_bench_"))
+    fill(data_manager, vector_data_manager, size, days)
+    embedding = RandomEmbeddingStrategy(seed=1).create_embedding("query")
+    now = time.time()
+    activity_filter = ActivityFilter(start_time=now - 86400, end_time=now, process_names=("code.exe",))
+
+    def post_filtered():
+        results = vector_data_manager.query_by_embedding(embedding, None, n_results * overfetch)
+        return [result for result in results if passes(activity_filter, result["metadata"])][:n_results]
+
+    def lexical_post_filtered():
+        rows = data_manager.lexical_search('"deploy"', n_results * overfetch)
+        return [row for row in rows if passes(activity_filter, vector_data_manager.activity_metadata(
+            row["created_at"], row["screenshot_path"], json.loads(row["active_window"])))][:n_results]
+
+    rows = [
+        ("vector unfiltered", lambda: vector_data_manager.query_by_embedding(embedding, None, n_results)),
+        ("vector post-filter", post_filtered),
+        ("vector pushdown", lambda: vector_data_manager.query_by_embedding(embedding, activity_filter, n_results)),
+        ("lexical unfiltered", lambda: data_manager.lexical_search('"deploy"', n_results)),
+        ("lexical post-filter", lexical_post_filtered),
+        ("lexical pushdown", lambda: data_manager.lexical_search('"deploy"', n_results, activity_filter)),
+    ]
+    print(f"\n{size} activities over {days} days, filter = last 24h in code.exe")
+    print(f"{'query':<22}{'median ms':>10}{'results':>9}")
+    for label, function in rows:
+        latency, results = timed(function, repeats)
+        print(f"{label:<22}{latency:>10.2f}{len(results):>9}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Filtered retrieval benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--n-results", type=int, default=20)
+    parser.add_argument("--overfetch", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size, args.days, args.n_results, args.overfetch, args.repeats)
+
+if __name__ == "__main__":
+    main()
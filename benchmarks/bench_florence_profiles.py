@@ -0,0 +1,65 @@
+"""Latency and caption agreement of each Florence inference profile on a fixed image set.
+
+Captions from every profile are compared with the "quality" profile's captions, which act as
+the reference. Run inside the Florence image (or any environment with src/api/requirements.txt):
+
+    python -m benchmarks.bench_florence_profiles path/to/images --threads 8
+"""
+import argparse
+import os
+import statistics
+import time
+from difflib import SequenceMatcher
+from PIL import Image
+
+DEFAULT_ACTION_TYPE = "<MORE_DETAILED_CAPTION>"
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+def load_images(directory, limit):
+    names = sorted(name for name in os.listdir(directory) if name.lower().endswith(IMAGE_EXTENSIONS))[:limit]
+    return [Image.open(os.path.join(directory, name)).convert("RGB") for name in names]
+
+def caption_text(caption):
+    return caption.get(DEFAULT_ACTION_TYPE, "") if isinstance(caption, dict) else str(caption)
+
+def run_profile(model, profile, images):
+    # One warm-up pass so lazy loading and quantization are not timed
+    model.generate_caption(images[0], profile=profile)
+    latencies, captions = [], []
+    for image in images:
+        start = time.perf_counter()
+        caption = model.generate_caption(image, profile=profile)
+        latencies.append(time.perf_counter() - start)
+        captions.append(caption_text(caption))
+    return latencies, captions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Florence inference profiles")
+    parser.add_argument("images", help="Directory of screenshots to caption")
+    parser.add_argument("--limit", type=int, default=20, help="Max images to use (default: 20)")
+    parser.add_argument("--threads", type=int, default=0, help="torch.set_num_threads value (default: torch default)")
+    parser.add_argument("--profiles", nargs="+", default=["quality", "balanced", "fast"], help="Profiles to run (default: all)")
+    args = parser.parse_args()
+
+    # The service module loads its model on import; configure it first and reuse that instance
+    os.environ["INFERENCE_PROFILE"] = "quality"
+    if args.threads:
+        os.environ["TORCH_NUM_THREADS"] = str(args.threads)
+    from src.api.ml_model import model, PROFILES
+
+    images = load_images(args.images, args.limit)
+    if not images:
+        raise SystemExit(f"No images found in {args.images}")
+
+    _, reference = run_profile(model, PROFILES["quality"], images)
+
+    print(f"{'profile':>10} | {'mean s':>7} | {'p50 s':>7} | {'max s':>7} | similarity to quality")
+    for name in args.profiles:
+        latencies, captions = run_profile(model, PROFILES[name], images)
+        similarity = statistics.mean(SequenceMatcher(None, ref, caption).ratio() for ref, caption in zip(reference, captions))
+        print(f"{name:>10} | {statistics.mean(latencies):7.2f} | {statistics.median(latencies):7.2f} | "
+              f"{max(latencies):7.2f} | {similarity:.3f}")
+
+if __name__ == "__main__":
+    main()
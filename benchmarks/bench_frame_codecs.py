@@ -0,0 +1,91 @@
+"""CPU time and encrypted size per capture for each screenshot codec.
+
+Encodes every frame through FrameEncoder (encode straight into the encrypted container)
+and compares it with the old path: lossless PNG written to disk, read back, encrypted and
+deleted. Without a directory of screenshots a synthetic screen-like frame is used.
+
+Usage:
+    python -m benchmarks.bench_frame_codecs [path/to/screenshots] --repeat 5
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from PIL import Image, ImageDraw
+from src.localrecall.encryption_manager import EncryptionManager
+from src.localrecall.frame_encoder import FrameEncoder, JpegCodec, PngCodec, WebpCodec
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+def synthetic_frame(width=2560, height=1440, seed=0):
+    """A window-like frame: flat panels, text-like strokes and one photo-like region."""
+    rng = random.Random(seed)
+    image = Image.new("RGB", (width, height), (243, 243, 243))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, width, 40), fill=(32, 32, 32))
+    draw.rectangle((0, 40, 300, height), fill=(225, 228, 232))
+    for y in range(70, height - 20, 22):
+        x = 330
+        while x < width - 700:
+            word = rng.randint(20, 90)
+            draw.rectangle((x, y, x + word, y + 10), fill=(rng.randint(0, 80),) * 3)
+            x += word + 8
+    noise = Image.effect_noise((600, 400), 60).convert("RGB")
+    image.paste(noise, (width - 650, 80))
+    return image
+
+def load_frames(directory, limit):
+    if not directory:
+        return [synthetic_frame()]
+    names = sorted(name for name in os.listdir(directory) if name.lower().endswith(IMAGE_EXTENSIONS))[:limit]
+    return [Image.open(os.path.join(directory, name)).convert("RGB") for name in names]
+
+def bench_legacy(encryption_manager, frames, out_dir):
+    cpu, size = 0.0, 0
+    for index, frame in enumerate(frames):
+        path = os.path.join(out_dir, f"legacy_{index}.png")
+        start = time.thread_time()
+        frame.save(path, format="PNG")
+        encryption_manager.encrypt_file(path)
+        cpu += time.thread_time() - start
+        size += os.path.getsize(path + '.encrypted')
+    return 1000 * cpu / len(frames), size / len(frames)
+
+def bench_codec(encryption_manager, codec, frames, out_dir):
+    encoder = FrameEncoder(encryption_manager, codec, workers=1)
+    for index, frame in enumerate(frames):
+        encoder.encode(frame, os.path.join(out_dir, f"{codec.name}_{index}.encrypted"))
+    stats = encoder.stats()[codec.name]
+    encoder.shutdown()
+    return stats["cpu_ms_per_capture"], stats["bytes_per_capture"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark screenshot codecs")
+    parser.add_argument("images", nargs="?", help="Directory of screenshots (default: one synthetic 2560x1440 frame)")
+    parser.add_argument("--limit", type=int, default=20, help="Max images to use (default: 20)")
+    parser.add_argument("--repeat", type=int, default=3, help="Times each frame is encoded (default: 3)")
+    args = parser.parse_args()
+
+    frames = load_frames(args.images, args.limit) * args.repeat
+    if not frames:
+        raise SystemExit(f"No images found in {args.images}")
+
+    candidates = [
+        ("png (level 1)", PngCodec()),
+        ("jpeg q85", JpegCodec(quality=85)),
+        ("webp q80 fast", WebpCodec(quality=80, preset="fast")),
+        ("webp q80 balanced", WebpCodec(quality=80, preset="balanced")),
+        ("webp q80 small", WebpCodec(quality=80, preset="small")),
+    ]
+    with tempfile.TemporaryDirectory() as out_dir:
+        encryption_manager = EncryptionManager(password="benchmark", salt_file=os.path.join(out_dir, "salt.bin"))
+        print(f"{'codec':>20} | {'CPU ms/capture':>14} | {'KiB/capture':>11}")
+        cpu_ms, size = bench_legacy(encryption_manager, frames, out_dir)
+        print(f"{'legacy png + file':>20} | {cpu_ms:14.1f} | {size / 1024:11.0f}")
+        for label, codec in candidates:
+            cpu_ms, size = bench_codec(encryption_manager, codec, frames, out_dir)
+            print(f"{label:>20} | {cpu_ms:14.1f} | {size / 1024:11.0f}")
+
+if __name__ == "__main__":
+    main()
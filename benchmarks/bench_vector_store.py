@@ -0,0 +1,175 @@
+"""Vector store backends compared: Chroma versus the built-in NumPy/mmap store.
+
+For each backend and size, one process inserts the vectors (in time order, as captures arrive)
+and a fresh process then opens the store and queries it, so the reported memory is what the
+chat API would hold. Vectors are drawn around random cluster centres, like caption embeddings
+tend to be, and regenerated from a seed instead of being kept in memory. Recall@k is measured
+against an exact scan. Filtered queries ask for the last 24 hours of one application.
+
+Usage:
+    python -m benchmarks.bench_vector_store --sizes 10000 100000 1000000 --backends chroma numpy
+"""
+import argparse
+import gc
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+APPS = ["chrome.exe", "code.exe", "slack.exe", "outlook.exe", "explorer.exe", "teams.exe", "spotify.exe", "excel.exe"]
+CLUSTERS = 256
+DAYS = 30
+START = 1_700_000_000.0
+
+def rss_mb():
+    import psutil
+    return psutil.Process().memory_info().rss / 2 ** 20
+
+def centres(dimensions):
+    import numpy as np
+    return np.random.default_rng(0).normal(size=(CLUSTERS, dimensions)).astype(np.float32)
+
+def batch(start, count, dimensions, size):
+    """Vectors, ids, metadata and documents of rows [start, start + count); the same on every call."""
+    import numpy as np
+    rng = np.random.default_rng(start + 1)
+    labels = rng.integers(0, CLUSTERS, count)
+    vectors = centres(dimensions)[labels] + 0.5 * rng.normal(size=(count, dimensions)).astype(np.float32)
+    step = DAYS * 86400 / size
+    ids = [f"bench_{index:09d}" for index in range(start, start + count)]
+    metadatas = [{"created_at": START + index * step, "process_name": APPS[index % len(APPS)], "screenshot_path": "p",
+                  "active_window": "{}"} for index in range(start, start + count)]
+    documents = [f"Current Activity Title: window {index % 97}" for index in range(start, start + count)]
+    return vectors, ids, metadatas, documents
+
+def queries(count, dimensions):
+    import numpy as np
+    rng = np.random.default_rng(12345)
+    return centres(dimensions)[rng.integers(0, CLUSTERS, count)] + 0.5 * rng.normal(size=(count, dimensions)).astype(np.float32)
+
+def open_store(backend, path, dtype):
+    from src.localrecall.vector_store import ACTIVITY_FIELDS, open_vector_store
+    options = {"dtype": dtype} if backend == "numpy" else {}
+    return open_vector_store(backend, path, "activities", ACTIVITY_FIELDS, "created_at", **options)
+
+def insert(args):
+    store = open_store(args.backend, args.path, args.dtype)
+    elapsed = 0.0
+    for start in range(0, args.size, args.batch):
+        vectors, ids, metadatas, documents = batch(start, min(args.batch, args.size - start), args.dimensions, args.size)
+        began = time.perf_counter()
+        store.upsert(ids, vectors.tolist() if args.backend == "chroma" else vectors, metadatas, documents)
+        elapsed += time.perf_counter() - began
+    return {"insert_per_s": args.size / elapsed}
+
+def exact_top(query_vectors, args, where=None):
+    """Exact top-k ids for each query by a single pass over the regenerated vectors."""
+    import numpy as np
+    normalized = query_vectors / np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    best_scores = np.full((len(query_vectors), 0), -np.inf, dtype=np.float32)
+    best_rows = np.zeros((len(query_vectors), 0), dtype=np.int64)
+    for start in range(0, args.size, args.batch):
+        vectors, _, metadatas, _ = batch(start, min(args.batch, args.size - start), args.dimensions, args.size)
+        scores = normalized @ (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).T
+        if where is not None:
+            scores[:, [not where(metadata) for metadata in metadatas]] = -np.inf
+        best_scores = np.concatenate([best_scores, scores], axis=1)
+        best_rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, start + len(vectors)), scores.shape)], axis=1)
+        keep = np.argsort(-best_scores, axis=1)[:, :args.n_results]
+        best_scores = np.take_along_axis(best_scores, keep, axis=1)
+        best_rows = np.take_along_axis(best_rows, keep, axis=1)
+    return [{f"bench_{row:09d}" for row, score in zip(rows, scores) if score > -np.inf}
+            for rows, scores in zip(best_rows, best_scores)]
+
+def query(args):
+    began = time.perf_counter()
+    store = open_store(args.backend, args.path, args.dtype)
+    store.count()
+    opened = {"open_ms": 1000 * (time.perf_counter() - began), "rss_open_mb": rss_mb()}
+
+    query_vectors = queries(args.queries, args.dimensions)
+    end = START + DAYS * 86400
+    where = {"$and": [{"created_at": {"$gte": end - 86400}}, {"created_at": {"$lte": end}}, {"process_name": "code.exe"}]}
+    results = {}
+    for label, clause in (("", None), ("filtered_", where)):
+        # One untimed query, so the filtered run does not pay for the first page faults alone
+        store.query(query_vectors[0], args.n_results, where=clause)
+        samples, found = [], []
+        for vector in query_vectors:
+            began = time.perf_counter()
+            items = store.query(vector if args.backend == "numpy" else vector.tolist(), args.n_results, where=clause)
+            samples.append(1000 * (time.perf_counter() - began))
+            found.append({item["id"] for item in items})
+        samples.sort()
+        results[f"{label}p50_ms"] = statistics.median(samples)
+        results[f"{label}p99_ms"] = samples[min(len(samples) - 1, int(0.99 * len(samples)))]
+        checked = min(args.recall_queries, len(query_vectors))
+        passes = None if clause is None else (
+            lambda metadata: end - 86400 <= metadata["created_at"] <= end and metadata["process_name"] == "code.exe")
+        exact = exact_top(query_vectors[:checked], args, passes)
+        results[f"{label}recall"] = statistics.mean(len(expected & got) / max(1, len(expected))
+                                                    for expected, got in zip(exact, found[:checked]))
+    results["rss_query_mb"] = rss_mb()
+    return {**opened, **results}
+
+def worker(args):
+    result = insert(args) if args.worker == "insert" else query(args)
+    print(json.dumps(result))
+
+def disk_mb(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names) / 2 ** 20
+
+def run(backend, size, args):
+    path = tempfile.mkdtemp(prefix="localrecall_bench_")
+    result = {}
+    try:
+        for phase in ("insert", "query"):
+            command = [sys.executable, "-m", "benchmarks.bench_vector_store", "--worker", phase, "--backend", backend,
+                       "--path", path, "--size", str(size), "--dimensions", str(args.dimensions), "--batch", str(args.batch),
+                       "--queries", str(args.queries), "--recall-queries", str(args.recall_queries),
+                       "--n-results", str(args.n_results), "--dtype", args.dtype]
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+            result.update(json.loads(output.strip().splitlines()[-1]))
+        result["disk_mb"] = disk_mb(path)
+    finally:
+        gc.collect()
+        shutil.rmtree(path, ignore_errors=True)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Vector store backend benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--backends", nargs="+", default=["chroma", "numpy"], choices=["chroma", "numpy"])
+    parser.add_argument("--dimensions", type=int, default=768)
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16"], help="NumPy store precision")
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--recall-queries", type=int, default=20)
+    parser.add_argument("--n-results", type=int, default=10)
+    # Internal: run one phase in a fresh process
+    parser.add_argument("--worker", choices=["insert", "query"], help=argparse.SUPPRESS)
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker(args)
+        return
+
+    print(f"{args.dimensions}-dimensional vectors, top {args.n_results}, NumPy store in {args.dtype}; "
+          f"filtered = last 24h of {DAYS} days in one of {len(APPS)} applications")
+    print(f"{'backend':<8}{'size':>9}{'insert/s':>10}{'open ms':>9}{'p50 ms':>8}{'p99 ms':>8}{'recall':>8}"
+          f"{'filt p50':>10}{'filt p99':>10}{'filt rec':>10}{'RSS open':>10}{'RSS query':>11}{'disk MB':>9}")
+    for size in args.sizes:
+        for backend in args.backends:
+            r = run(backend, size, args)
+            print(f"{backend:<8}{size:>9}{r['insert_per_s']:>10.0f}{r['open_ms']:>9.0f}{r['p50_ms']:>8.2f}{r['p99_ms']:>8.2f}"
+                  f"{r['recall']:>8.3f}{r['filtered_p50_ms']:>10.2f}{r['filtered_p99_ms']:>10.2f}{r['filtered_recall']:>10.3f}"
+                  f"{r['rss_open_mb']:>10.0f}{r['rss_query_mb']:>11.0f}{r['disk_mb']:>9.0f}", flush=True)
+
+if __name__ == "__main__":
+    main()
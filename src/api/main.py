@@ -1,6 +1,7 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from .routes import router
+from .ml_model import scheduler
 import uvicorn
 from typing import List
 
@@ -28,6 +29,14 @@ def create_application() -> FastAPI:
 
     app.include_router(router)
 
+    @app.on_event("startup")
+    async def start_scheduler():
+        await scheduler.start()
+
+    @app.on_event("shutdown")
+    async def stop_scheduler():
+        await scheduler.stop()
+
     return app
 
 app = create_application()
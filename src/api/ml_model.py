@@ -1,22 +1,131 @@
 from transformers import AutoProcessor, AutoModelForCausalLM
 import torch
 from PIL import Image
-from typing import Tuple
+import asyncio
+import os
+import threading
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_ACTION_TYPE = "<MORE_DETAILED_CAPTION>"
+
+CHECKPOINTS = {
+    "large": "microsoft/Florence-2-large",
+    "base": "microsoft/Florence-2-base",
+}
+
+@dataclass(frozen=True)
+class InferenceProfile:
+    """
+    Model variant and decoding settings used for a caption request.
+
+    Attributes:
+        checkpoint (str): Key in CHECKPOINTS, "large" or "base".
+        quantize (bool): Apply int8 dynamic quantization to the linear layers (CPU only).
+        num_beams (int): Beam width; 1 means greedy decoding.
+        max_new_tokens (int): Upper bound on generated tokens.
+        inference_mode (bool): Run under torch.inference_mode instead of torch.no_grad.
+    """
+    checkpoint: str = "large"
+    quantize: bool = False
+    num_beams: int = 3
+    max_new_tokens: int = 200
+    inference_mode: bool = True
+
+PROFILES = {
+    "quality": InferenceProfile(),
+    "balanced": InferenceProfile(checkpoint="large", quantize=True, num_beams=1, max_new_tokens=128),
+    "fast": InferenceProfile(checkpoint="base", quantize=True, num_beams=1, max_new_tokens=64),
+}
+
+def _env_flag(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    return default if value is None else value.strip().lower() in ("1", "true", "yes", "on")
+
+def profile_from_env() -> InferenceProfile:
+    """
+    Build the default profile from INFERENCE_PROFILE plus individual FLORENCE_* overrides.
+
+    Returns:
+        InferenceProfile: The server's default inference profile.
+    """
+    name = os.environ.get("INFERENCE_PROFILE", "quality")
+    if name not in PROFILES:
+        raise ValueError(f"Unknown INFERENCE_PROFILE '{name}', expected one of {sorted(PROFILES)}")
+    profile = PROFILES[name]
+    checkpoint = os.environ.get("FLORENCE_CHECKPOINT", profile.checkpoint)
+    if checkpoint not in CHECKPOINTS:
+        raise ValueError(f"Unknown FLORENCE_CHECKPOINT '{checkpoint}', expected one of {sorted(CHECKPOINTS)}")
+    return replace(
+        profile,
+        checkpoint=checkpoint,
+        quantize=_env_flag("FLORENCE_QUANTIZE", profile.quantize),
+        num_beams=int(os.environ.get("FLORENCE_NUM_BEAMS", profile.num_beams)),
+        max_new_tokens=int(os.environ.get("FLORENCE_MAX_NEW_TOKENS", profile.max_new_tokens)),
+        inference_mode=_env_flag("FLORENCE_INFERENCE_MODE", profile.inference_mode),
+    )
+
+def resolve_profile(default: InferenceProfile, name: Optional[str] = None, num_beams: Optional[int] = None,
+                    max_new_tokens: Optional[int] = None) -> InferenceProfile:
+    """
+    Apply per-request overrides on top of a named or default profile.
+
+    Raises:
+        ValueError: If the profile name or a decoding setting is invalid.
+    """
+    if name and name not in PROFILES:
+        raise ValueError(f"Unknown inference profile '{name}', expected one of {sorted(PROFILES)}")
+    profile = PROFILES[name] if name else default
+    if num_beams is not None:
+        if num_beams < 1:
+            raise ValueError("num_beams must be at least 1")
+        profile = replace(profile, num_beams=num_beams)
+    if max_new_tokens is not None:
+        if not 1 <= max_new_tokens <= 1024:
+            raise ValueError("max_new_tokens must be between 1 and 1024")
+        profile = replace(profile, max_new_tokens=max_new_tokens)
+    return profile
 
 class MLModel:
-    def __init__(self, model_id: str = 'microsoft/Florence-2-large'):
+    def __init__(self, default_profile: Optional[InferenceProfile] = None, num_threads: Optional[int] = None):
         """
-        Initialize the MLModel with the specified model.
+        Initialize the MLModel and load the default profile's model variant.
 
         Args:
-            model_id (str): The identifier for the pre-trained model.
+            default_profile (InferenceProfile): Profile used when a request does not pick one.
+            num_threads (int): Torch intra-op thread count; defaults to TORCH_NUM_THREADS if set.
         """
-        self.model_id = model_id
+        self.default_profile = default_profile or profile_from_env()
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.model = AutoModelForCausalLM.from_pretrained(self.model_id, trust_remote_code=True).to(self.device).eval()
-        self.processor = AutoProcessor.from_pretrained(self.model_id, trust_remote_code=True)
+        num_threads = num_threads or int(os.environ.get("TORCH_NUM_THREADS", "0"))
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self._variants: Dict[Tuple[str, bool], Tuple[object, object]] = {}
+        self._load_lock = threading.Lock()
+        self._variant(self.default_profile)
 
-    def generate_caption(self, image: Image.Image, action_type: str = "<MORE_DETAILED_CAPTION>") -> str:
+    def _variant(self, profile: InferenceProfile):
+        """
+        Return the (model, processor) pair for a profile, loading it on first use.
+        """
+        # Dynamic quantization only has CPU kernels
+        quantize = profile.quantize and self.device == "cpu"
+        key = (profile.checkpoint, quantize)
+        variant = self._variants.get(key)
+        if variant is None:
+            with self._load_lock:
+                variant = self._variants.get(key)
+                if variant is None:
+                    model_id = CHECKPOINTS[profile.checkpoint]
+                    model = AutoModelForCausalLM.from_pretrained(model_id, trust_remote_code=True).to(self.device).eval()
+                    if quantize:
+                        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+                    processor = AutoProcessor.from_pretrained(model_id, trust_remote_code=True)
+                    variant = self._variants[key] = (model, processor)
+        return variant
+
+    def generate_caption(self, image: Image.Image, action_type: str = DEFAULT_ACTION_TYPE,
+                         profile: Optional[InferenceProfile] = None) -> str:
         """
         Generate a caption for the given image.
 
@@ -26,21 +135,142 @@ class MLModel:
         Returns:
             str: The generated caption.
         """
+        return self.generate_captions([image], action_type=action_type, profile=profile)[0]
+
+    def generate_captions(self, images: List[Image.Image], action_type: str = DEFAULT_ACTION_TYPE,
+                          profile: Optional[InferenceProfile] = None) -> List[Dict]:
+        """
+        Generate captions for a batch of images with a single forward pass.
+
+        Args:
+            images (List[PIL.Image.Image]): The input images.
+            action_type (str): The Florence task prompt shared by the whole batch.
+            profile (InferenceProfile): Model variant and decoding settings; defaults to the server profile.
+
+        Returns:
+            List[Dict]: The parsed caption for each image, in input order.
+        """
+        profile = profile or self.default_profile
+        model, processor = self._variant(profile)
         prompt = action_type
-        inputs = self.processor(text=prompt, images=image, return_tensors="pt")
+        inputs = processor(text=[prompt] * len(images), images=images, return_tensors="pt")
         inputs = {k: v.to(self.device) for k, v in inputs.items()}
 
-        with torch.no_grad():
-            generated_ids = self.model.generate(
+        with (torch.inference_mode() if profile.inference_mode else torch.no_grad()):
+            generated_ids = model.generate(
                 input_ids=inputs["input_ids"],
                 pixel_values=inputs["pixel_values"],
-                max_new_tokens=200,
-                num_beams=3
+                max_new_tokens=profile.max_new_tokens,
+                num_beams=profile.num_beams,
+                do_sample=False
             )
-        
-        generated_text = self.processor.batch_decode(generated_ids, skip_special_tokens=False)[0]
-        parsed_answer = self.processor.post_process_generation(generated_text, task=prompt, image_size=(image.width, image.height))
-        
-        return parsed_answer
+
+        generated_texts = processor.batch_decode(generated_ids, skip_special_tokens=False)
+        return [
+            processor.post_process_generation(generated_text, task=prompt, image_size=(image.width, image.height))
+            for generated_text, image in zip(generated_texts, images)
+        ]
+
+class QueueFullError(Exception):
+    """Raised when the caption queue is at capacity and the request should be retried later."""
+
+class BatchScheduler:
+    def __init__(self, model: MLModel, max_batch_size: int = 8, max_wait_ms: float = 20, max_queue_size: int = 64):
+        """
+        Collect concurrent caption requests into batches for the model.
+
+        The worker takes the first queued request, then keeps collecting until it has
+        `max_batch_size` requests or `max_wait_ms` has passed, and runs one batched
+        generation per (action type, profile) in a worker thread so the event loop stays free.
+
+        Args:
+            model (MLModel): The model used to generate captions.
+            max_batch_size (int): The largest number of images per forward pass.
+            max_wait_ms (float): How long to wait for a batch to fill after the first request.
+            max_queue_size (int): Queued requests allowed before new ones are rejected.
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue_size = max_queue_size
+        self.queue: Optional[asyncio.Queue] = None
+        self.worker: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self.worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.worker:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+        while self.queue and not self.queue.empty():
+            _, _, future = self.queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Caption service is shutting down"))
+
+    async def submit(self, image: Image.Image, action_type: str = DEFAULT_ACTION_TYPE,
+                     profile: Optional[InferenceProfile] = None) -> Dict:
+        """
+        Queue an image for captioning and wait for its result.
+
+        Requests are only batched with others that use the same action type and profile.
+
+        Raises:
+            QueueFullError: If the queue is at capacity.
+        """
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((image, (action_type, profile or self.model.default_profile), future))
+        except asyncio.QueueFull:
+            raise QueueFullError("Caption queue is full")
+        return await future
+
+    async def _collect_batch(self) -> List[Tuple[Image.Image, Tuple[str, InferenceProfile], asyncio.Future]]:
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        # Poll instead of wait_for(queue.get()), which can swallow a cancellation before Python 3.12
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(remaining, 0.002))
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            groups: Dict[Tuple[str, InferenceProfile], List[Tuple[Image.Image, asyncio.Future]]] = {}
+            for image, group, future in batch:
+                groups.setdefault(group, []).append((image, future))
+
+            for (action_type, profile), items in groups.items():
+                images = [image for image, _ in items]
+                try:
+                    captions = await loop.run_in_executor(None, self.model.generate_captions, images, action_type, profile)
+                except Exception as e:
+                    for _, future in items:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for (_, future), caption in zip(items, captions):
+                    if not future.done():
+                        future.set_result(caption)
 
 model = MLModel()
+scheduler = BatchScheduler(
+    model,
+    max_batch_size=int(os.environ.get("MAX_BATCH_SIZE", "8")),
+    max_wait_ms=float(os.environ.get("MAX_WAIT_MS", "20")),
+    max_queue_size=int(os.environ.get("MAX_QUEUE_SIZE", "64")),
+)
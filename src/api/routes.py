@@ -2,32 +2,44 @@ from fastapi import APIRouter, File, UploadFile, HTTPException, Form
 from fastapi.responses import JSONResponse
 from PIL import Image
 import io
-from .ml_model import model
+from .ml_model import model, scheduler, resolve_profile, QueueFullError, DEFAULT_ACTION_TYPE
 from typing import Dict
 from typing import Optional
 
 router = APIRouter()
 
 @router.post("/generate_caption", response_model=Dict[str, str])
-async def generate_caption(file: UploadFile = File(...), action_type: Optional[str] = Form(None)):
+async def generate_caption(file: UploadFile = File(...), action_type: Optional[str] = Form(None),
+                           profile: Optional[str] = Form(None), num_beams: Optional[int] = Form(None),
+                           max_new_tokens: Optional[int] = Form(None)):
     """
     Generate a caption for the uploaded image.
 
     Args:
         file (UploadFile): The uploaded image file.
         action_type (Optional[str]): The type of action to perform. Defaults to None.
+        profile (Optional[str]): Inference profile name ("quality", "balanced", "fast"). Defaults to the server profile.
+        num_beams (Optional[int]): Overrides the profile's beam width; 1 is greedy decoding.
+        max_new_tokens (Optional[int]): Overrides the profile's token limit.
 
     Returns:
         Dict[str, dict]: A dictionary containing the generated caption.
 
     Raises:
-        HTTPException: If there's an error processing the image.
+        HTTPException: 503 if the caption queue is full, 400 if there's an error processing the image.
     """
+    try:
+        inference_profile = resolve_profile(model.default_profile, profile, num_beams, max_new_tokens)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     try:
         contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
-        caption = model.generate_caption(image, action_type=action_type)
+        image = Image.open(io.BytesIO(contents)).convert("RGB")
+        caption = await scheduler.submit(image, action_type=action_type or DEFAULT_ACTION_TYPE, profile=inference_profile)
         return JSONResponse(content={"caption": caption})
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error processing image: {str(e)}")
 
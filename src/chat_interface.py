@@ -3,51 +3,113 @@ import asyncio
 import aiohttp
 from PIL import Image
 import io
+import json
+import os
+import urllib.parse
+import urllib.request
+from dotenv import load_dotenv
+
+load_dotenv()
+API_URL = "http://localhost:11011"
+# Sent to the chat API when it requires a token
+API_TOKEN = os.environ.get("API_TOKEN")
+# Version of the /chat event stream this client understands
+CHAT_PROTOCOL = 1
 
 async def call_chat_api(question, history=None, filters=None):
-    url = "http://localhost:11011/chat"
+    url = f"{API_URL}/chat"
     
     payload = {
         "question": question,
         "history": history or [],
         "filters": filters,
         "strategy": "local",
+        "protocol": CHAT_PROTOCOL,
     }
     
     headers = {
         "Content-Type": "application/json",
-        "Accept": "text/event-stream"
+        "Accept": "text/event-stream",
+        **auth_headers(),
     }
     
     async with aiohttp.ClientSession() as session:
         async with session.post(url, json=payload, headers=headers) as response:
+            if response.status != 200:
+                yield {"type": "text", "content": f"Error: {await response.text()}"}
+                return
+            # Server-sent events: an `event:` line names the event, a `data:` line carries its JSON payload,
+            # a blank line ends it
+            event, data = "message", []
             async for line in response.content:
-                if line.startswith(b'data: '):
-                    chunk = line[6:].decode('utf-8').strip()
-                    if chunk.startswith('list_'):
-                        chunk = chunk[5:].strip('[]').replace("'", "").split(',')
-                        for item in chunk:
-                            yield {"type": "image", "content": item.strip()}
-                    else:
-                        yield {"type": "text", "content": f"{chunk} "}
+                line = line.decode('utf-8').rstrip("\r\n")
+                if line.startswith("event: "):
+                    event = line[7:]
+                elif line.startswith("data: "):
+                    data.append(line[6:])
+                elif not line and data:
+                    payload = json.loads("\n".join(data))
+                    if event == "start" and payload.get("version") != CHAT_PROTOCOL:
+                        yield {"type": "text", "content": f"Error: unsupported chat protocol {payload.get('version')}"}
+                        return
+                    if event == "token":
+                        yield {"type": "text", "content": payload["text"]}
+                    elif event == "image":
+                        yield {"type": "image", "content": payload["thumbnail_url"]}
+                    elif event == "error":
+                        yield {"type": "text", "content": f"\n\nError: {payload['message']}"}
+                    event, data = "message", []
+
+def auth_headers():
+    return {"Authorization": f"Bearer {API_TOKEN}"} if API_TOKEN else {}
 
 def load_image(image_path):
+    """Open a preview; API paths (e.g. /activities/<id>/thumbnail) are fetched from the chat server."""
     try:
+        if image_path.startswith("/"):
+            request = urllib.request.Request(f"{API_URL}{image_path}", headers=auth_headers())
+            with urllib.request.urlopen(request) as response:
+                return Image.open(io.BytesIO(response.read()))
         return Image.open(image_path)
     except Exception as e:
         st.error(f"Error loading image: {e}")
         return None
 
-async def process_chunks(prompt, message_placeholder):
+def show_image(image_path):
+    image = load_image(image_path)
+    if image:
+        st.image(image)
+        if image_path.endswith("/thumbnail"):
+            # The full screenshot is only decrypted if the link is opened
+            # A plain link cannot send headers, so the token goes in the query string
+            query = f"?{urllib.parse.urlencode({'token': API_TOKEN})}" if API_TOKEN else ""
+            st.markdown(f"[Full screenshot]({API_URL}{image_path[:-len('/thumbnail')]}/screenshot{query})")
+
+def sidebar_filters():
+    """Retrieval filters chosen in the sidebar, in the /chat `filters` format."""
+    st.sidebar.header("Filters")
+    last = st.sidebar.selectbox("Time range", ["Any time", "last 1 hour", "last 4 hours", "today", "yesterday", "last 7 days"])
+    process_names = st.sidebar.text_input("Applications", placeholder="chrome.exe, code.exe")
+    title = st.sidebar.text_input("Window title contains")
+
+    filters = {}
+    if last != "Any time":
+        filters["last"] = last
+    names = [name.strip() for name in process_names.split(",") if name.strip()]
+    if names:
+        filters["process_name"] = names
+    if title.strip():
+        filters["title"] = title.strip()
+    return filters or None
+
+async def process_chunks(prompt, message_placeholder, filters=None):
     full_response = ""
-    async for chunk in call_chat_api(prompt, st.session_state.messages):
+    async for chunk in call_chat_api(prompt, st.session_state.messages, filters):
         if chunk["type"] == "text":
             full_response += chunk["content"]
             message_placeholder.markdown(full_response + "▌")
         elif chunk["type"] == "image":
-            image = load_image(chunk["content"])
-            if image:
-                st.image(image)
+            show_image(chunk["content"])
             # st.session_state.messages.append({"role": "assistant", "type": "image", "content": chunk["content"]})
     message_placeholder.markdown(full_response)
     return full_response
@@ -59,15 +121,14 @@ def main():
         st.session_state.messages = []
 
     print(st.session_state.messages)
+    filters = sidebar_filters()
 
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
             if message["type"] == "text":
                 st.markdown(message["content"])
             elif message["type"] == "image":
-                image = load_image(message["content"])
-                if image:
-                    st.image(image)
+                show_image(message["content"])
 
     if prompt := st.chat_input("What is your question?"):
         st.session_state.messages.append({"role": "user", "type": "text", "content": prompt})
@@ -80,7 +141,7 @@ def main():
             # Run the asynchronous function
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
-            full_response = loop.run_until_complete(process_chunks(prompt, message_placeholder))
+            full_response = loop.run_until_complete(process_chunks(prompt, message_placeholder, filters))
             
         st.session_state.messages.append({"role": "assistant", "type": "text", "content": full_response})
 
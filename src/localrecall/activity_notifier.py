@@ -0,0 +1,67 @@
+import threading
+import time
+from typing import Optional
+from .data_manager import DataManager
+
+class ActivityNotifier:
+    """In-process signal from the tracker to the processor that a new activity was stored."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._version = 0
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def notify(self):
+        with self._condition:
+            self._version += 1
+            self._condition.notify_all()
+
+    def wait(self, seen_version: int, timeout: float) -> bool:
+        """Block until the version moves past `seen_version` or `timeout` passes. Returns True if notified."""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._version != seen_version, timeout)
+
+class ActivityWaiter:
+    """Lets the processor sleep until there may be new work.
+
+    With an ActivityNotifier (tracker in the same process) the processor wakes as soon as
+    a frame is stored. Otherwise it watches SQLite's `PRAGMA data_version`, which changes
+    when another process commits, checking at an interval that backs off exponentially from
+    `min_poll` to `max_poll` while the database stays unchanged. Either way it wakes after
+    `max_idle` seconds so activities waiting on a retry backoff or an expired lease are
+    picked up.
+
+    Call `mark()` before each processing pass and `wait()` after a pass that found no
+    work, so a frame stored during the pass is never missed.
+    """
+
+    def __init__(self, data_manager: DataManager, notifier: Optional[ActivityNotifier] = None,
+                 min_poll: float = 0.005, max_poll: float = 0.25, max_idle: float = 30):
+        self.data_manager = data_manager
+        self.notifier = notifier
+        self.min_poll = min_poll
+        self.max_poll = max_poll
+        self.max_idle = max_idle
+        self._seen = None
+
+    def mark(self):
+        self._seen = self.notifier.version if self.notifier else self.data_manager.data_version()
+
+    def wait(self) -> bool:
+        """Block until new activities may be available. Returns True if woken by a change, False on timeout."""
+        if self.notifier:
+            return self.notifier.wait(self._seen, self.max_idle)
+
+        deadline = time.monotonic() + self.max_idle
+        poll = self.min_poll
+        while True:
+            if self.data_manager.data_version() != self._seen:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(poll, remaining))
+            poll = min(poll * 2, self.max_poll)
@@ -1,26 +1,103 @@
-from .data_manager import DataManager
+from .data_manager import DataManager, STATUS_ENCODING
 from .screenshot_capture import ScreenshotCapture
 from .window_info import WindowInfo
+from .frame_deduplicator import FrameDeduplicator
+from .capture_scheduler import CaptureScheduler
+from .frame_encoder import frame_to_image
+from .change_detector import RegionChangeDetector
 import time
 
 class ActivityTracker:
-    def __init__(self, interval=30, save_dir=None, compress=False, compress_quality=85, resize_factor=1.0):
+    def __init__(self, interval=30, save_dir=None, compress=False, compress_quality=85, resize_factor=1.0,
+                 dedup=True, dedup_threshold=5, dedup_history=8, notifier=None, min_interval=2, max_interval=300,
+                 idle_threshold=60, poll_interval=0.5, codec=None, webp_preset="fast", encoder_workers=2, per_monitor=False,
+                 tile_size=256):
         self.interval = interval
+        self.notifier = notifier
         self.data_manager = DataManager(save_dir)
-        self.screenshot_capture = ScreenshotCapture(compress, compress_quality, resize_factor)
+        # Frames left half-encoded by a previous run have no usable screenshot
+        self.data_manager.fail_unfinished_encodings()
+        self.screenshot_capture = ScreenshotCapture(compress, compress_quality, resize_factor, codec=codec,
+                                                    webp_preset=webp_preset, encoder_workers=encoder_workers)
         self.window_info = WindowInfo()
+        self.scheduler = CaptureScheduler(self.window_info, interval=interval, min_interval=min_interval,
+                                          max_interval=max_interval, idle_threshold=idle_threshold, poll_interval=poll_interval)
+        self.deduplicator = FrameDeduplicator(dedup_threshold, dedup_history) if dedup else None
+        # Per-monitor mode replaces whole-desktop deduplication with per-monitor change detection
+        self.change_detector = RegionChangeDetector(tile_size=tile_size) if per_monitor else None
 
     def run(self):
         try:
             while True:
-                # time.sleep(self.interval)
-                screenshot_path = self.screenshot_capture.capture()
-                active_window = self.window_info.get_active_window_info()
-                user_apps = self.window_info.get_user_applications()
-                
-                self.data_manager.save_activity(screenshot_path, active_window, user_apps)
-                time.sleep(self.interval)
-                
+                _, active_window, idle_seconds = self.scheduler.wait_for_capture()
+                try:
+                    user_apps = self.window_info.get_user_applications()
+                    if self.change_detector:
+                        self.record_monitors(active_window, user_apps)
+                    else:
+                        self.record_frame(self.screenshot_capture.grab(), active_window, user_apps)
+                except Exception as e:
+                    # One failed capture must not stop tracking
+                    print(f"Error capturing activity: {str(e)}")
+                self.scheduler.record_capture(time.monotonic(), active_window, idle_seconds)
+
         except KeyboardInterrupt:
             print("Activity tracking stopped.")
+        finally:
+            self.screenshot_capture.close()
+            for codec, stats in self.screenshot_capture.stats().items():
+                print(f"{codec}: {stats['captures']} captures, {stats['cpu_ms_per_capture']:.1f} ms CPU "
+                      f"and {stats['bytes_per_capture'] / 1024:.0f} KiB per capture")
+
+    def record_frame(self, screenshot, active_window, user_apps):
+        frame_hash = None
+        if self.deduplicator:
+            # Hashed from the raw buffer; the RGB conversion is left to the encoder's threads
+            frame_hash = self.deduplicator.compute_hash(screenshot)
+            duplicate_of = self.deduplicator.find_duplicate(frame_hash)
+            if duplicate_of:
+                timestamp = self.data_manager.save_duplicate_activity(duplicate_of, active_window, user_apps)
+                if timestamp is not None:
+                    return timestamp
+                # The matched frame's row is gone, so store this frame in its own right
+                self.deduplicator.forget(duplicate_of)
+
+        timestamp = self._store_frame(screenshot, active_window, user_apps, frame_hash=frame_hash)
+        if self.deduplicator:
+            self.deduplicator.remember(frame_hash, timestamp)
+        return timestamp
+
+    def record_monitors(self, active_window, user_apps):
+        """Store only the monitors, or the parts of them, that changed since they were last stored."""
+        timestamps = []
+        for monitor, screenshot in self.screenshot_capture.grab_monitors():
+            image = frame_to_image(screenshot)
+            region = self.change_detector.changed_region(monitor, image)
+            if region is None:
+                continue
+            if region != (0, 0) + image.size:
+                image = image.crop(region)
+            timestamps.append(self._store_frame(image, active_window, user_apps, monitor=monitor, region=region))
+        return timestamps
+
+    def _store_frame(self, screenshot, active_window, user_apps, frame_hash=None, monitor=None, region=None):
+        # The row exists before its screenshot does, so it waits in STATUS_ENCODING until the encoder finishes
+        screenshot_path = self.screenshot_capture.new_path(monitor)
+        timestamp = self.data_manager.save_activity(screenshot_path, active_window, user_apps, frame_hash=frame_hash,
+                                                    status=STATUS_ENCODING, monitor=monitor, region=region)
+        encoding = self.screenshot_capture.save_async(screenshot, screenshot_path)
+        encoding.add_done_callback(lambda future: self._encoded(timestamp, future))
+        return timestamp
+
+    def _encoded(self, timestamp, future):
+        error = future.exception()
+        if error:
+            print(f"Error encoding screenshot for activity {timestamp}: {str(error)}")
+        self.data_manager.mark_activity_encoded(timestamp, error)
+        if not error:
+            self._notify()
 
+    def _notify(self):
+        # Duplicates are stored already processed, so only new frames wake the processor
+        if self.notifier:
+            self.notifier.notify()
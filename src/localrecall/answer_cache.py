@@ -0,0 +1,100 @@
+import hashlib
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+def fingerprint(*parts: Any) -> str:
+    """Stable hash of JSON-serialisable parts (anything else is hashed by its repr)."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=repr).encode()).hexdigest()
+
+def _normalize(embedding: List[float]) -> List[float]:
+    norm = math.sqrt(sum(value * value for value in embedding)) or 1.0
+    return [value / norm for value in embedding]
+
+class AnswerCache:
+    """In-memory cache of streamed chat answers.
+
+    Answers are stored under an exact key (the retrieved documents, the filters and the
+    conversation so far) and matched on the question's embedding: a cached answer is reused
+    when its question has cosine similarity of at least `threshold` with the new one. Each
+    entry remembers how many activities matched the filter's time window when it was stored
+    and is dropped once that count changes, i.e. when new activities were processed in the
+    window. Entries also expire after `max_age` seconds. Answers are never written to disk.
+
+    Entries stored without an embedding only match lookups without one; the caller then puts
+    the question text itself into the key.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 256, max_age: float = 3600):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_age = max_age
+        # key -> list of entries, least recently used key first
+        self._entries: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _expired(self, entry: Dict, window_count: int, now: float) -> bool:
+        return entry["window_count"] != window_count or now - entry["stored_at"] > self.max_age
+
+    def lookup(self, key: str, embedding: Optional[List[float]], window_count: int) -> Optional[List]:
+        """Return the cached chunks for a similar question under `key`, or None."""
+        embedding = _normalize(embedding) if embedding is not None else None
+        now = time.time()
+        with self._lock:
+            entries = self._entries.get(key, [])
+            fresh = [entry for entry in entries if not self._expired(entry, window_count, now)]
+            if len(fresh) != len(entries):
+                self.invalidations += len(entries) - len(fresh)
+                self._size -= len(entries) - len(fresh)
+                if fresh:
+                    self._entries[key] = fresh
+                else:
+                    self._entries.pop(key, None)
+            for entry in fresh:
+                if embedding is None or entry["embedding"] is None:
+                    similar = embedding is None and entry["embedding"] is None
+                else:
+                    similar = sum(a * b for a, b in zip(embedding, entry["embedding"])) >= self.threshold
+                if similar:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return list(entry["chunks"])
+            self.misses += 1
+            return None
+
+    def store(self, key: str, embedding: Optional[List[float]], window_count: int, chunks: List):
+        with self._lock:
+            self._entries.setdefault(key, []).append({
+                "embedding": _normalize(embedding) if embedding is not None else None,
+                "window_count": window_count,
+                "stored_at": time.time(),
+                "chunks": list(chunks),
+            })
+            self._entries.move_to_end(key)
+            self._size += 1
+            while self._size > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,83 @@
+import time
+from typing import Dict, Optional, Tuple
+from .window_info import WindowInfo
+
+CAPTURE_START = "start"
+CAPTURE_WINDOW_CHANGE = "window_change"
+CAPTURE_RESUMED = "resumed"
+CAPTURE_INTERVAL = "interval"
+CAPTURE_IDLE = "idle"
+CAPTURE_MAX_INTERVAL = "max_interval"
+
+class CaptureScheduler:
+    """Decides when the tracker takes a screenshot, based on cheap signals polled often.
+
+    The foreground window and input idle time are checked every `poll_interval` seconds.
+    A capture is taken right away when the foreground window (title or process) changes
+    or the user comes back from being idle, and every `interval` seconds while the user is
+    active. Once input has been idle for `idle_threshold` seconds, the interval grows by
+    `idle_backoff` after each capture up to `max_interval`. Captures are never closer than
+    `min_interval` or further apart than `max_interval`; setting both to `interval` gives
+    the old fixed-rate behaviour.
+    """
+
+    def __init__(self, window_info: WindowInfo, interval: float = 30, min_interval: float = 2, max_interval: float = 300,
+                 idle_threshold: float = 60, poll_interval: float = 0.5, idle_backoff: float = 2.0):
+        # Activity keys and screenshot names have one-second resolution
+        if not 1 <= min_interval <= max_interval:
+            raise ValueError("min_interval must be at least 1 second and no larger than max_interval")
+        self.window_info = window_info
+        self.interval = min(max(interval, min_interval), max_interval)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.idle_threshold = idle_threshold
+        self.poll_interval = poll_interval
+        self.idle_backoff = idle_backoff
+
+        self.current_interval = self.interval
+        self.last_capture: Optional[float] = None
+        self.last_window_key = None
+        self.was_idle = False
+
+    @staticmethod
+    def _window_key(window: Optional[Dict]):
+        window = window or {}
+        return window.get("title"), window.get("process_name")
+
+    def decide(self, now: float, window: Optional[Dict], idle_seconds: float) -> Optional[str]:
+        """Return why a capture is due at `now` (monotonic seconds), or None if it is not."""
+        if self.last_capture is None:
+            return CAPTURE_START
+        elapsed = now - self.last_capture
+        if elapsed < self.min_interval:
+            return None
+        if elapsed >= self.max_interval:
+            return CAPTURE_MAX_INTERVAL
+        idle = idle_seconds >= self.idle_threshold
+        if self._window_key(window) != self.last_window_key:
+            return CAPTURE_WINDOW_CHANGE
+        if self.was_idle and not idle:
+            return CAPTURE_RESUMED
+        if elapsed >= self.current_interval:
+            return CAPTURE_IDLE if idle else CAPTURE_INTERVAL
+        return None
+
+    def record_capture(self, now: float, window: Optional[Dict], idle_seconds: float):
+        idle = idle_seconds >= self.idle_threshold
+        if idle:
+            self.current_interval = min(self.current_interval * self.idle_backoff, self.max_interval)
+        else:
+            self.current_interval = self.interval
+        self.last_capture = now
+        self.last_window_key = self._window_key(window)
+        self.was_idle = idle
+
+    def wait_for_capture(self) -> Tuple[str, Optional[Dict], float]:
+        """Block until a capture is due. Returns (reason, active window info, idle seconds)."""
+        while True:
+            window = self.window_info.get_active_window_info()
+            idle_seconds = self.window_info.get_idle_seconds()
+            reason = self.decide(time.monotonic(), window, idle_seconds)
+            if reason:
+                return reason, window, idle_seconds
+            time.sleep(self.poll_interval)
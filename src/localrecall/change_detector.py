@@ -0,0 +1,50 @@
+from typing import Dict, Optional, Tuple
+from PIL import Image, ImageChops
+
+Region = Tuple[int, int, int, int]
+
+class RegionChangeDetector:
+    """Finds the part of each monitor that changed since the frame last stored for it.
+
+    Frames are compared on a `scale`-times downsampled grayscale copy. Pixels that differ
+    by more than `noise` levels count as changed, and the change is ignored when fewer than
+    `min_changed_ratio` of them changed (e.g. a ticking clock). The bounding box of the
+    change is snapped outward to a `tile_size` grid so the crop keeps some context, and
+    the whole monitor is returned once the box covers `full_frame_ratio` of it.
+    """
+
+    def __init__(self, tile_size=256, scale=8, noise=16, min_changed_ratio=0.0005, full_frame_ratio=0.6):
+        self.tile_size = tile_size
+        self.scale = scale
+        self.noise = noise
+        self.min_changed_ratio = min_changed_ratio
+        self.full_frame_ratio = full_frame_ratio
+        # monitor -> downsampled grayscale of the last stored frame
+        self.previous: Dict[int, Image.Image] = {}
+
+    def _snap(self, low, high, limit):
+        tile = self.tile_size
+        return (low * self.scale // tile) * tile, min(-(-high * self.scale // tile) * tile, limit)
+
+    def changed_region(self, monitor: int, image: Image.Image) -> Optional[Region]:
+        """Return the changed (left, top, right, bottom) region of `image`, or None if nothing changed."""
+        width, height = image.size
+        small = image.reduce(self.scale).convert("L")
+        previous = self.previous.get(monitor)
+        if previous is None or previous.size != small.size:
+            self.previous[monitor] = small
+            return (0, 0, width, height)
+
+        mask = ImageChops.difference(previous, small).point(lambda value: 255 if value > self.noise else 0)
+        changed = mask.histogram()[255]
+        if changed < self.min_changed_ratio * small.width * small.height:
+            return None
+
+        # Only move the baseline when something is stored, so slow changes still add up
+        self.previous[monitor] = small
+        box = mask.getbbox()
+        left, right = self._snap(box[0], box[2], width)
+        top, bottom = self._snap(box[1], box[3], height)
+        if (right - left) * (bottom - top) >= self.full_frame_ratio * width * height:
+            return (0, 0, width, height)
+        return (left, top, right, bottom)
@@ -5,14 +5,26 @@ from .data_manager import DataManager, VectorDataManager
 import json
 from typing import List
 from .embedding_processor import GeminiEmbeddingStrategy, LocalEmbeddingStrategy
+from .embedding_cache import CachedEmbeddingStrategy
 import requests
 from typing import Optional
-from .encryption_manager import EncryptionManager
-from ollama import AsyncClient
+from ollama import AsyncClient, Client
+import asyncio
+import re
+import time
+from .utils import run_blocking
+from .hybrid_search import HybridSearcher, SOURCE_LEXICAL, SOURCE_VECTOR
+from .filters import ActivityFilter, parse_filters
+from .session_index import SessionIndex
+from .answer_cache import AnswerCache, fingerprint
+from .context_builder import ContextBuilder
+from .chat_events import ChatEvent, EVENT_DOCUMENTS, EVENT_DONE, EVENT_IMAGE, EVENT_TOKEN, merge_streams
+from .previews import shared_preview_loader
 
 class ChatStrategy(ABC):
     def __init__(self):
-        self.encryption_manager = EncryptionManager()
+        self.answer_cache = AnswerCache()
+        self.context_builder = ContextBuilder(max_tokens=int(os.environ.get("CHAT_CONTEXT_TOKENS", "3072")))
 
     _SYSTEM_INSTRUCTIONS = """You are an advanced AI assistant, similar to Jarvis from Iron Man, designed to analyze and respond to queries based on descriptions of screenshots from the user's computer activities. Your primary functions are:
 - Interpret and understand the context provided by the screenshot descriptions.
@@ -25,27 +37,141 @@ Your goal is to be a knowledgeable, efficient, and trustworthy assistant, enhanc
 """
 
     @abstractmethod
-    def process_question(self, question, history, filters):
+    def generate_answer(self, history, final_prompt):
+        """Stream the model's answer to `final_prompt` as text chunks."""
         pass
 
-    def process_prompt(self, prompt, filters=None, history=[]):
-        # TODO - Filters handling
-        related_documents = self.vector_data_manager.search_activities_with_filters(
+    async def process_question(self, question, history=[], filters=None):
+        """Answer `question` as a stream of ChatEvents: documents, then image and token events as they are ready, then done.
+
+        The LLM request starts as soon as the prompt is built; the preview image is prepared
+        alongside it instead of before it.
+        """
+        started = time.perf_counter()
+        # `filters` is the request payload (see parse_filters) or an already parsed ActivityFilter
+        activity_filter = filters if isinstance(filters, ActivityFilter) else parse_filters(filters)
+        counting = asyncio.ensure_future(run_blocking(self.searcher.data_manager.count_matching_activities, activity_filter))
+        try:
+            related_documents, context = await self.process_prompt(question, activity_filter, history)
+            window_count = await counting
+        finally:
+            # Not left running (or its error unretrieved) when retrieval fails
+            counting.cancel()
+        retrieved = time.perf_counter()
+        yield ChatEvent(EVENT_DOCUMENTS, [self.describe_document(document) for document in related_documents])
+
+        # Same documents, filters and conversation, and a near-identical question: replay the earlier answer.
+        # When the vector search ran, the question's embedding is already in the embedding cache. Lexical-only
+        # answers never embedded it, and an embedding call just for the cache would delay the first token, so
+        # those are cached under the exact question text instead.
+        if any(SOURCE_VECTOR in document.get("sources", []) for document in related_documents):
+            embedding, exact_question = await self.vector_data_manager.embedding_strategy.acreate_embedding(question), None
+        else:
+            embedding, exact_question = None, " ".join(re.findall(r"\w+", question.lower()))
+        cache_key = fingerprint([document["timestamp"] for document in related_documents], filters, history, exact_question)
+        cached = self.answer_cache.lookup(cache_key, embedding, window_count)
+        events = cached if cached is not None else []
+        first_token = None
+        if cached is not None:
+            for event in cached:
+                yield event
+            first_token = time.perf_counter()
+        else:
+            async for event in merge_streams(self._token_events(context), self._image_events(related_documents)):
+                if first_token is None and event.type == EVENT_TOKEN:
+                    first_token = time.perf_counter()
+                events.append(event)
+                yield event
+            # Only complete answers are cached; a failed or cancelled stream never gets here
+            self.answer_cache.store(cache_key, embedding, window_count, events)
+
+        finished = time.perf_counter()
+        yield ChatEvent(EVENT_DONE, {
+            "cached": cached is not None,
+            "retrieval_ms": round(1000 * (retrieved - started), 1),
+            "first_token_ms": round(1000 * (first_token - started), 1) if first_token else None,
+            "total_ms": round(1000 * (finished - started), 1),
+            "prompt_tokens": context.stats["prompt_tokens"],
+            "saved_tokens": context.stats["saved_tokens"],
+        })
+
+    async def _token_events(self, context):
+        async for chunk in self.generate_answer(context.history, context.prompt):
+            if chunk:
+                yield ChatEvent(EVENT_TOKEN, chunk)
+
+    async def _image_events(self, related_documents):
+        """Decrypt the preview thumbnail into the shared loader's memory cache, then announce it."""
+        previews = await run_blocking(shared_preview_loader)
+        for document, handle in zip(related_documents, self.preview_handles(related_documents)):
+            try:
+                await run_blocking(previews.thumbnail, document["metadata"]["screenshot_path"])
+            except Exception as e:
+                print(f"Warning: could not prepare the preview for {document['timestamp']}: {str(e)}")
+                continue
+            yield ChatEvent(EVENT_IMAGE, handle)
+
+    @staticmethod
+    def describe_document(document):
+        metadata = document.get("metadata", {})
+        active_window = json.loads(metadata.get("active_window") or "null") or {}
+        return {
+            "timestamp": document["timestamp"],
+            "created_at": metadata.get("created_at"),
+            "title": active_window.get("title"),
+            "process_name": active_window.get("process_name"),
+            "distance": document.get("distance"),
+            "sources": document.get("sources", []),
+        }
+
+    def warm_up(self):
+        """Open the vector collection and embedding client so the first request does not pay for them."""
+        self.vector_data_manager.collection.count()
+        self.vector_data_manager.ensure_filter_metadata()
+        self.vector_data_manager.embedding_strategy.create_embedding("warm up")
+        shared_preview_loader()
+
+    def _make_searcher(self):
+        data_manager = DataManager()
+        return HybridSearcher(data_manager, self.vector_data_manager,
+                              session_index=SessionIndex(data_manager, self.vector_data_manager))
+
+    async def aclose(self):
+        await self.vector_data_manager.embedding_strategy.aclose()
+
+    def retrieval_stats(self):
+        """Embedding cache hits, lexical-only versus hybrid searches and session versus frame queries."""
+        session_index = self.searcher.session_index
+        return {
+            "embedding_cache": self.vector_data_manager.embedding_strategy.stats(),
+            "search": self.searcher.stats(),
+            "sessions": session_index.stats() if session_index is not None else None,
+        }
+
+    def preview_handles(self, related_documents, limit=1):
+        """API paths of the retrieved activities' images; they are decrypted only when the client fetches them."""
+        return [
+            {
+                "timestamp": document["timestamp"],
+                "thumbnail_url": f"/activities/{document['timestamp']}/thumbnail",
+                "screenshot_url": f"/activities/{document['timestamp']}/screenshot",
+            }
+            for document in related_documents[:limit]
+        ]
+
+    async def process_prompt(self, prompt, filters=None, history=[]):
+        activity_filter = filters if isinstance(filters, ActivityFilter) else parse_filters(filters)
+        related_documents = await self.searcher.asearch(
             query=prompt,
+            activity_filter=activity_filter,
             n_results=5,
         )
-        _PROMPT = ""
-        for index, document in enumerate(related_documents):
-            if document.get("distance", 1) > 0.5:
-                continue
-
-            _PROMPT += f"--------------DOCUMENT_{index+1}_start------"
-            _PROMPT += document.get("analysis", "") + "\n"
-            _PROMPT += f"--------------DOCUMENT_{index+1}_end------\n"
-
-        _PROMPT += f"Can you please answer the following question: {prompt}\n"
-
-        return related_documents, _PROMPT
+        # Exact keyword matches are kept even when their embedding is far from the question
+        relevant = [document for document in related_documents
+                    if SOURCE_LEXICAL in document.get("sources", [])
+                    or (document.get("distance") is not None and document["distance"] <= 0.5)]
+        context = self.context_builder.build(prompt, relevant, history, self._SYSTEM_INSTRUCTIONS)
+        return related_documents, context
 
 class GoogleGeminiChat(ChatStrategy):
     def __init__(self):
@@ -54,7 +180,8 @@ class GoogleGeminiChat(ChatStrategy):
         if not api_key:
             raise ValueError("GEMINI_API_KEY environment variable not set")
         genai.configure(api_key=api_key)
-        self.vector_data_manager = VectorDataManager(embedding_strategy=GeminiEmbeddingStrategy())
+        self.vector_data_manager = VectorDataManager(embedding_strategy=CachedEmbeddingStrategy(GeminiEmbeddingStrategy()))
+        self.searcher = self._make_searcher()
         self.model = genai.GenerativeModel(
             model_name="gemini-1.5-flash",
             generation_config={
@@ -83,23 +210,18 @@ class GoogleGeminiChat(ChatStrategy):
             else:
                 # Skip unknown roles
                 continue
-            
+
+            # Gemini expects turns to alternate, and the history summary is sent as a user turn
+            if converted_history and converted_history[-1]["role"] == new_message["role"]:
+                converted_history[-1]["parts"].extend(new_message["parts"])
+                continue
             converted_history.append(new_message)
         
         return converted_history
     
 
-    async def process_question(self, question, history=[], filters=None):
-        google_format_history = self._format_history(history)
-        related_documents, final_prompt = self.process_prompt(question, filters, history)
-        google_format_history.append({
-            "role": "user",
-            "parts": [final_prompt]
-        })
-        encrypted_images = [document.get("metadata", {}).get("screenshot_path", "") for document in related_documents]
-        decrypted_images = [self.encryption_manager.decrypt_file(encrypted_image) for encrypted_image in encrypted_images]
-
-        yield [decrypted_images[0]]
+    async def generate_answer(self, history, final_prompt):
+        google_format_history = self._format_history(history + [{"role": "user", "content": final_prompt}])
         response = await self.model.generate_content_async(contents=google_format_history, stream=True)
         async for chunk in response:
             yield chunk.text
@@ -109,19 +231,19 @@ class LocalModelChat(ChatStrategy):
         super().__init__()
         self.model_name = model_name
         self.client = AsyncClient()
-        self.vector_data_manager = VectorDataManager(embedding_strategy=LocalEmbeddingStrategy())
+        self.vector_data_manager = VectorDataManager(embedding_strategy=CachedEmbeddingStrategy(LocalEmbeddingStrategy()))
+        self.searcher = self._make_searcher()
 
-    async def process_question(self, question, history=[], filters=None):
-        related_documents, final_prompt = self.process_prompt(question, filters, history)
+    def warm_up(self):
+        super().warm_up()
+        # An empty prompt makes Ollama load the model into memory without generating anything
+        Client().generate(model=self.model_name, prompt="")
+
+    async def generate_answer(self, history, final_prompt):
         messages = [{'role': 'system', 'content': self._SYSTEM_INSTRUCTIONS}]        
         messages.extend(history)
         messages.append({'role': 'user', 'content': final_prompt})
 
-        encrypted_images = [document.get("metadata", {}).get("screenshot_path", "") for document in related_documents]
-        decrypted_images = [self.encryption_manager.decrypt_file(encrypted_image) for encrypted_image in encrypted_images]
-
-        yield [decrypted_images[0]]  # Yield the first decrypted image
-
         async for part in await self.client.chat(model=self.model_name, messages=messages, stream=True):
             yield part['message']['content']
 
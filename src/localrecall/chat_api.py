@@ -1,9 +1,89 @@
-from fastapi import FastAPI, HTTPException, Depends
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 import asyncio
-from typing import List, Optional
-from .chat import GoogleGeminiChat, LocalModelChat
+import functools
+import hmac
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+from .chat import ChatStrategy, GoogleGeminiChat, LocalModelChat
+from .chat_events import ChatEvent, EVENT_ERROR, EVENT_START, PROTOCOL_VERSION, batch_tokens, encode_sse
+from .data_manager import DataManager
+from .filters import parse_filters
+from .previews import shared_preview_loader
+from .utils import detect_image_mime, load_env_variables, run_blocking
+
+class ChatStrategyRegistry:
+    """Builds each chat strategy once and shares it across requests.
+
+    Construction is expensive (PBKDF2 key derivation, opening the vector store, service
+    health checks), so strategies are created lazily on first use or at startup and kept
+    until `reload` swaps in a fresh instance. The replaced instances are returned so the
+    caller can close them.
+    """
+
+    def __init__(self, factories: Dict[str, Callable[[], ChatStrategy]]):
+        self._factories = factories
+        self._strategies: Dict[str, ChatStrategy] = {}
+        self._lock = threading.Lock()
+
+    def _build(self, name: str) -> ChatStrategy:
+        strategy = self._factories[name]()
+        strategy.warm_up()
+        return strategy
+
+    def get(self, name: str) -> ChatStrategy:
+        if name not in self._factories:
+            raise KeyError(name)
+        strategy = self._strategies.get(name)
+        if strategy is None:
+            with self._lock:
+                strategy = self._strategies.get(name)
+                if strategy is None:
+                    strategy = self._build(name)
+                    self._strategies[name] = strategy
+        return strategy
+
+    def warm_up(self, names: List[str]):
+        for name in names:
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"Warning: could not warm up chat strategy '{name}': {str(e)}")
+
+    def built(self) -> Dict[str, ChatStrategy]:
+        """Strategies that have been built so far, by name."""
+        return dict(self._strategies)
+
+    async def aclose(self):
+        for strategy in list(self._strategies.values()):
+            await strategy.aclose()
+
+    def reload(self, name: Optional[str] = None) -> Tuple[List[str], List[ChatStrategy]]:
+        """Rebuild one strategy (or all built ones) after a configuration change.
+
+        Builds and swaps under the lock, so concurrent reloads do not each build a copy.
+        Returns the reloaded names and the replaced strategies, which the caller must `aclose`.
+        """
+        with self._lock:
+            names = [name] if name else list(self._strategies)
+            for strategy_name in names:
+                if strategy_name not in self._factories:
+                    raise KeyError(strategy_name)
+            replaced = []
+            for strategy_name in names:
+                strategy = self._build(strategy_name)
+                old = self._strategies.get(strategy_name)
+                self._strategies[strategy_name] = strategy
+                if old is not None:
+                    replaced.append(old)
+        return names, replaced
+
+registry = ChatStrategyRegistry({
+    "google_gemini": GoogleGeminiChat,
+    "local": LocalModelChat,
+})
 
 app = FastAPI()
 
@@ -12,22 +92,56 @@ class ChatRequest(BaseModel):
     strategy: str = "google_gemini"
     history: List[dict] = []
     filters: Optional[dict] = None
+    # Event stream version the client understands, and how long small tokens may be held to batch them
+    protocol: int = PROTOCOL_VERSION
+    token_batch_ms: float = 15
+
+def require_token(authorization: Optional[str] = Header(None), token: Optional[str] = None):
+    """Reject requests without the API_TOKEN, when one is set, as a bearer header or `token` query parameter.
 
-@app.post("/chat")
+    Responses contain decrypted screenshots and captions, so the token should be set whenever
+    the API listens on anything but localhost.
+    """
+    expected = os.environ.get("API_TOKEN")
+    if not expected:
+        return
+    supplied = token
+    if authorization and authorization.lower().startswith("bearer "):
+        supplied = authorization[len("bearer "):]
+    if not supplied or not hmac.compare_digest(supplied.encode(), expected.encode()):
+        raise HTTPException(status_code=401, detail="Missing or invalid API token")
+
+@app.on_event("startup")
+async def warm_up_strategies():
+    names = [name.strip() for name in os.environ.get("CHAT_STRATEGIES", "local,google_gemini").split(",") if name.strip()]
+    await asyncio.to_thread(registry.warm_up, names)
+
+@app.on_event("shutdown")
+async def close_strategies():
+    await registry.aclose()
+
+@app.post("/chat", dependencies=[Depends(require_token)])
 async def chat_endpoint(request: ChatRequest):
     try:
         if not request.strategy:
             raise HTTPException(status_code=400, detail="Strategy is required")
 
-        if request.strategy == "google_gemini":
-            chat_strategy = GoogleGeminiChat()
-            
-        elif request.strategy == "local":
-            chat_strategy = LocalModelChat()
-            
-        else:
+        if request.protocol != PROTOCOL_VERSION:
+            raise HTTPException(status_code=400, detail=f"Unsupported protocol {request.protocol}, the server speaks {PROTOCOL_VERSION}")
+
+        try:
+            # Only the first request for a strategy builds it; keep that off the event loop
+            chat_strategy = await asyncio.to_thread(registry.get, request.strategy)
+        except KeyError:
             raise HTTPException(status_code=400, detail="Invalid strategy")
 
+        try:
+            # Validate before streaming starts so a bad filter is a 400, not a broken stream
+            parse_filters(request.filters)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        # The raw filters are passed on: relative ranges like "today" are part of the answer cache key as written
         chat_generator = chat_strategy.process_question(
             question=request.question,
             history=request.history,
@@ -35,18 +149,85 @@ async def chat_endpoint(request: ChatRequest):
         )
 
         async def response_generator():
-            async for chunk in chat_generator:
-                if isinstance(chunk, list): 
-                    yield f"data: list_{chunk}\n\n"
-                elif isinstance(chunk, str):
-                    yield f"data: {chunk}\n\n"
-                await asyncio.sleep(0) 
+            event_id = 0
+            yield encode_sse(ChatEvent(EVENT_START, {"version": PROTOCOL_VERSION}), event_id)
+            try:
+                async for event in batch_tokens(chat_generator, request.token_batch_ms):
+                    event_id += 1
+                    yield encode_sse(event, event_id)
+                    await asyncio.sleep(0)
+            except Exception as e:
+                # The status line has already been sent, so failures are reported in the stream
+                yield encode_sse(ChatEvent(EVENT_ERROR, {"message": str(e)}), event_id + 1)
+
+        return StreamingResponse(response_generator(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Chat-Protocol": str(PROTOCOL_VERSION)})
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/chat/cache/stats", dependencies=[Depends(require_token)])
+async def answer_cache_stats():
+    """Answer cache entries, hits, misses, invalidations and hit rate per chat strategy."""
+    return {name: strategy.answer_cache.stats() for name, strategy in registry.built().items()}
+
+@app.get("/chat/context/stats", dependencies=[Depends(require_token)])
+async def context_stats():
+    """Prompt tokens sent and saved by context packing, per chat strategy."""
+    return {name: strategy.context_builder.stats() for name, strategy in registry.built().items()}
+
+@app.get("/chat/retrieval/stats", dependencies=[Depends(require_token)])
+async def retrieval_stats():
+    """Embedding cache, hybrid search and session index counters, per chat strategy."""
+    return {name: strategy.retrieval_stats() for name, strategy in registry.built().items()}
 
-        return StreamingResponse(response_generator(), media_type="text/event-stream")
+@functools.lru_cache(maxsize=1)
+def _data_manager():
+    return DataManager()
 
+async def _image_response(timestamp: str, full: bool) -> Response:
+    previews = await asyncio.to_thread(shared_preview_loader)
+    screenshot_path = await run_blocking(_data_manager().get_screenshot_path, timestamp)
+    if not screenshot_path:
+        raise HTTPException(status_code=404, detail="Activity not found")
+    try:
+        image = await run_blocking(previews.full if full else previews.thumbnail, screenshot_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Screenshot not found")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    # Decrypted images must not end up in shared caches
+    return Response(content=image, media_type=detect_image_mime(image), headers={"Cache-Control": "private, max-age=3600"})
+
+@app.get("/activities/{timestamp}/thumbnail", dependencies=[Depends(require_token)])
+async def activity_thumbnail(timestamp: str):
+    """Small preview of an activity's screenshot, decrypted in memory."""
+    return await _image_response(timestamp, full=False)
+
+@app.get("/activities/{timestamp}/screenshot", dependencies=[Depends(require_token)])
+async def activity_screenshot(timestamp: str):
+    """The full-resolution screenshot, decrypted in memory only when requested."""
+    return await _image_response(timestamp, full=True)
+
+@app.post("/admin/reload", dependencies=[Depends(require_token)])
+async def reload_strategies(strategy: Optional[str] = None):
+    """Re-read .env and rebuild chat strategies so configuration changes take effect."""
+    load_env_variables(override=True)
+    try:
+        reloaded, replaced = await asyncio.to_thread(registry.reload, strategy)
+    except KeyError:
+        raise HTTPException(status_code=400, detail="Invalid strategy")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    for old in replaced:
+        try:
+            await old.aclose()
+        except Exception as e:
+            print(f"Warning: could not close a replaced chat strategy: {str(e)}")
+    return {"reloaded": reloaded}
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=11011)
\ No newline at end of file
+    uvicorn.run(app, host="127.0.0.1", port=11011)
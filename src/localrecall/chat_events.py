@@ -0,0 +1,123 @@
+import asyncio
+import json
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator
+
+# Version of the /chat event stream; bump it when a payload changes incompatibly
+PROTOCOL_VERSION = 1
+
+EVENT_START = "start"
+EVENT_DOCUMENTS = "documents"
+EVENT_IMAGE = "image"
+EVENT_TOKEN = "token"
+EVENT_DONE = "done"
+EVENT_ERROR = "error"
+
+@dataclass(frozen=True)
+class ChatEvent:
+    """One piece of a streamed chat answer.
+
+    `documents` carries the retrieved activities, `image` a preview handle (activity
+    timestamp, thumbnail and screenshot URLs), `token` a chunk of answer text and `done`
+    the timings and token counts of the request.
+    """
+    type: str
+    data: Any
+
+_FINISHED = object()
+
+async def merge_streams(*streams: AsyncIterator) -> AsyncIterator:
+    """Yield items from several async iterators as soon as any of them produces one.
+
+    An exception in one stream cancels the others and is re-raised.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump(stream):
+        try:
+            async for item in stream:
+                await queue.put(item)
+        finally:
+            await queue.put(_FINISHED)
+
+    tasks = [asyncio.create_task(pump(stream)) for stream in streams]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            item = await queue.get()
+            if item is _FINISHED:
+                remaining -= 1
+                for task in tasks:
+                    if task.done() and not task.cancelled() and task.exception():
+                        raise task.exception()
+                continue
+            yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def encode_sse(event: ChatEvent, event_id: int) -> str:
+    """Serialise an event as a named SSE event with a one-line JSON payload.
+
+    Payloads by event: start {"version"}, documents {"documents": [...]}, image {"timestamp",
+    "thumbnail_url", "screenshot_url"}, token {"text"}, done {timings and token counts},
+    error {"message"}. JSON escapes newlines, so any text survives the line-based framing.
+    """
+    if event.type == EVENT_TOKEN:
+        payload = {"text": event.data}
+    elif event.type == EVENT_DOCUMENTS:
+        payload = {"documents": event.data}
+    else:
+        payload = event.data
+    return f"id: {event_id}\nevent: {event.type}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+async def batch_tokens(events: AsyncIterator[ChatEvent], interval_ms: float) -> AsyncIterator[ChatEvent]:
+    """Coalesce token events arriving within `interval_ms` of the first buffered one into a single event.
+
+    Other events flush the buffer first, so ordering is preserved. An interval of 0 disables batching.
+    """
+    if interval_ms <= 0:
+        async for event in events:
+            yield event
+        return
+
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump():
+        try:
+            async for event in events:
+                await queue.put(event)
+        except Exception as e:
+            await queue.put(e)
+        finally:
+            await queue.put(_FINISHED)
+
+    task = asyncio.create_task(pump())
+    buffer, deadline = [], None
+    try:
+        while True:
+            try:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                yield ChatEvent(EVENT_TOKEN, "".join(buffer))
+                buffer, deadline = [], None
+                continue
+            if isinstance(item, ChatEvent) and item.type == EVENT_TOKEN:
+                if deadline is None:
+                    deadline = time.monotonic() + interval_ms / 1000
+                buffer.append(item.data)
+                continue
+            if buffer:
+                yield ChatEvent(EVENT_TOKEN, "".join(buffer))
+                buffer, deadline = [], None
+            if item is _FINISHED:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
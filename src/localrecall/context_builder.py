@@ -0,0 +1,172 @@
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List
+from .answer_cache import fingerprint
+
+# Words split into pieces of up to four characters, plus punctuation: close to BPE counts for English text
+_TOKEN = re.compile(r"\w{1,4}|[^\w\s]")
+_WORDS = re.compile(r"\w+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+def estimate_tokens(text: str) -> int:
+    return len(_TOKEN.findall(text or ""))
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` after `max_tokens` estimated tokens."""
+    if max_tokens <= 0:
+        return ""
+    for count, match in enumerate(_TOKEN.finditer(text), start=1):
+        if count == max_tokens:
+            return text if match.end() >= len(text.rstrip()) else text[:match.end()] + " …"
+    return text
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = _WORDS.findall(text.lower())
+    return {tuple(words[index:index + size]) for index in range(max(1, len(words) - size + 1))}
+
+@dataclass
+class PromptContext:
+    """What the model is sent: the conversation (possibly compacted) and the final user prompt."""
+    history: List[Dict]
+    prompt: str
+    stats: Dict = field(default_factory=dict)
+
+class ContextBuilder:
+    """Fits retrieved documents and the conversation into a prompt token budget.
+
+    Documents are taken in rank order, skipping any whose word 3-grams overlap an already
+    chosen one by `dedupe_threshold` (Jaccard) or more, and each is cut to
+    `max_document_tokens`; together they get at most `document_share` of the budget. The
+    last `keep_recent_messages` messages are kept verbatim while they fit, and older ones
+    are folded into a rolling summary message. Summaries are cached per conversation, so
+    each turn only summarises the messages that just fell out of the window. Token counts
+    are estimates unless a `count_tokens` function is given.
+    """
+
+    def __init__(self, max_tokens: int = 3072, document_share: float = 0.6, max_document_tokens: int = 400,
+                 keep_recent_messages: int = 4, summary_tokens: int = 300, dedupe_threshold: float = 0.85,
+                 count_tokens: Callable[[str], int] = estimate_tokens, max_conversations: int = 256):
+        self.max_tokens = max_tokens
+        self.document_share = document_share
+        self.max_document_tokens = max_document_tokens
+        self.keep_recent_messages = keep_recent_messages
+        self.summary_tokens = summary_tokens
+        self.dedupe_threshold = dedupe_threshold
+        self.count_tokens = count_tokens
+        self.max_conversations = max_conversations
+        # conversation id -> (number of messages summarised, fingerprint of them, summary)
+        self._summaries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.tokens_sent = 0
+        self.tokens_saved = 0
+
+    def _select_documents(self, documents: List[Dict], budget: int) -> List[str]:
+        chosen, chosen_shingles = [], []
+        for document in documents:
+            text = (document.get("analysis") or "").strip()
+            if not text:
+                continue
+            shingles = _shingles(text)
+            if any(len(shingles & other) / len(shingles | other) >= self.dedupe_threshold for other in chosen_shingles):
+                continue
+            text = truncate_tokens(text, min(self.max_document_tokens, budget))
+            cost = self.count_tokens(text)
+            if not text or cost > budget:
+                break
+            budget -= cost
+            chosen.append(text)
+            chosen_shingles.append(shingles)
+        return chosen
+
+    def _summarize_messages(self, messages: List[Dict]) -> str:
+        """Extractive summary: the first sentence of each message, shortened."""
+        lines = []
+        for message in messages:
+            content = " ".join((message.get("content") or "").split())
+            if content:
+                lines.append(f"{message.get('role', 'user')}: {truncate_tokens(_SENTENCE_END.split(content)[0], 40)}")
+        return "\n".join(lines)
+
+    def _rolling_summary(self, older: List[Dict]) -> str:
+        """Summary of `older`, extending the cached summary of an earlier prefix of the same conversation."""
+        conversation = fingerprint(older[:1])
+        with self._lock:
+            cached = self._summaries.get(conversation)
+        summary, start = "", 0
+        if cached and cached[0] <= len(older) and cached[1] == fingerprint(older[:cached[0]]):
+            start, _, summary = cached
+        if start < len(older):
+            addition = self._summarize_messages(older[start:])
+            summary = f"{summary}\n{addition}" if summary else addition
+            # Keep the most recent part when the summary outgrows its budget
+            while self.count_tokens(summary) > self.summary_tokens and "\n" in summary:
+                summary = summary.split("\n", 1)[1]
+            summary = truncate_tokens(summary, self.summary_tokens)
+        with self._lock:
+            self._summaries[conversation] = (len(older), fingerprint(older), summary)
+            self._summaries.move_to_end(conversation)
+            while len(self._summaries) > self.max_conversations:
+                self._summaries.popitem(last=False)
+        return summary
+
+    def _fit_history(self, history: List[Dict], budget: int):
+        """Recent messages that fit in `budget`, preceded by a summary of the rest. Also returns how many were summarised."""
+        kept, start = [], len(history)
+        summary_reserve = min(self.summary_tokens, budget // 3) if len(history) > self.keep_recent_messages else 0
+        for index in range(len(history) - 1, -1, -1):
+            cost = self.count_tokens(history[index].get("content") or "")
+            if len(kept) >= self.keep_recent_messages or cost > budget - summary_reserve:
+                break
+            budget -= cost
+            kept.insert(0, history[index])
+            start = index
+        if start == 0:
+            return kept, 0
+        summary = truncate_tokens(self._rolling_summary(history[:start]), budget)
+        if summary:
+            kept.insert(0, {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+        return kept, start
+
+    def build(self, question: str, documents: List[Dict], history: List[Dict], system_prompt: str = "") -> PromptContext:
+        history = history or []
+        question_line = f"Can you please answer the following question: {question}\n"
+        budget = self.max_tokens - self.count_tokens(system_prompt) - self.count_tokens(question_line)
+        texts = self._select_documents(documents, max(0, int(budget * self.document_share)))
+
+        context = ""
+        for index, text in enumerate(texts, start=1):
+            context += f"--------------DOCUMENT_{index}_start------"
+            context += text + "\n"
+            context += f"--------------DOCUMENT_{index}_end------\n"
+        compacted, summarized = self._fit_history(history, max(0, budget - self.count_tokens(context)))
+        prompt = context + question_line
+
+        fixed = self.count_tokens(system_prompt) + self.count_tokens(question_line)
+        uncompacted = (fixed + sum(self.count_tokens(message.get("content") or "") for message in history)
+                       + sum(self.count_tokens(document.get("analysis") or "") for document in documents))
+        sent = fixed + self.count_tokens(context) + sum(self.count_tokens(message.get("content") or "") for message in compacted)
+        stats = {
+            "prompt_tokens": sent,
+            "uncompacted_tokens": uncompacted,
+            "saved_tokens": max(0, uncompacted - sent),
+            "documents": len(texts),
+            "documents_dropped": len(documents) - len(texts),
+            "messages_summarized": summarized,
+        }
+        with self._lock:
+            self.requests += 1
+            self.tokens_sent += sent
+            self.tokens_saved += stats["saved_tokens"]
+        return PromptContext(history=compacted, prompt=prompt, stats=stats)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "prompt_tokens": self.tokens_sent,
+                "saved_tokens": self.tokens_saved,
+                "saved_tokens_per_request": self.tokens_saved / self.requests if self.requests else 0.0,
+            }
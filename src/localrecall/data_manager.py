@@ -1,168 +1,711 @@
 import os
 import json
-from .utils import ensure_dir
+import re
+from .utils import ensure_dir, run_blocking
 import sqlite3
-import os
-import json
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime, timezone
 from typing import List, Dict, Optional
-import chromadb
 from .embedding_processor import EmbeddingStrategy
+from .filters import ActivityFilter, casefold_text
+from .vector_store import ACTIVITY_FIELDS, SESSION_FIELDS, VectorStore, open_vector_store
+
+# Values of the `processed` column
+STATUS_PENDING = 0
+STATUS_PROCESSED = 1
+STATUS_DUPLICATE = 2
+STATUS_FAILED = 3  # dead letter: gave up after repeated failures
+STATUS_ENCODING = 4  # screenshot is still being encoded in the background; not claimable yet
+
+# Written to the vector store directory once old vectors carry the filter metadata
+FILTER_METADATA_MARKER = '.filter_metadata_v1'
+
+ACTIVITY_COLUMNS = ['created_at', 'timestamp', 'screenshot_path', 'active_window', 'user_apps', 'analysis', 'processed', 'frame_hash', 'duplicate_of',
+                    'lease_owner', 'lease_expires_at', 'attempts', 'next_attempt_at', 'last_error', 'monitor', 'region',
+                    'created_ts', 'process_name', 'title', 'session_id']
+
+_INSERT_ACTIVITY = '''
+    INSERT INTO activities (created_at, timestamp, screenshot_path, active_window, user_apps, processed, frame_hash, monitor, region,
+                            created_ts, process_name, title)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+_INSERT_DUPLICATE_ACTIVITY = '''
+    INSERT INTO activities (created_at, timestamp, screenshot_path, active_window, user_apps, processed, duplicate_of, monitor, region,
+                            created_ts, process_name, title)
+    SELECT ?, ?, screenshot_path, ?, ?, ?, timestamp, monitor, region, ?, ?, ? FROM activities WHERE timestamp = ?
+'''
+_SELECT_UNPROCESSED = f'''
+    SELECT {", ".join(ACTIVITY_COLUMNS)} FROM activities
+    WHERE processed = ? ORDER BY created_at LIMIT ?
+'''
+_UPDATE_ACTIVITY = '''
+    UPDATE activities
+    SET active_window = ?, user_apps = ?, analysis = ?
+    WHERE timestamp = ?
+'''
+_MARK_PROCESSED = 'UPDATE activities SET processed = ? WHERE timestamp = ?'
+_MARK_ENCODED = 'UPDATE activities SET processed = ?, last_error = ? WHERE timestamp = ? AND processed = ?'
+# A field of active_window; rows written before update_activity stopped double-encoding hold a JSON string
+_WINDOW_FIELD_SQL = '''(CASE WHEN json_valid({col}) THEN CASE json_type({col})
+    WHEN 'object' THEN json_extract({col}, '$.{field}')
+    WHEN 'text' THEN CASE WHEN json_valid(json_extract({col}, '$')) THEN json_extract(json_extract({col}, '$'), '$.{field}') END
+END END)'''
+_TITLE_SQL = _WINDOW_FIELD_SQL.replace('{field}', 'title')
+# Fills the filter columns of rows stored before they existed
+_BACKFILL_FILTER_COLUMNS = f'''
+    UPDATE activities
+    SET created_ts = (julianday(created_at) - 2440587.5) * 86400.0,
+        process_name = lower({_WINDOW_FIELD_SQL.format(col='active_window', field='process_name')}),
+        title = {_TITLE_SQL.format(col='active_window')}
+    WHERE created_ts IS NULL
+'''
+# Full-text index over window titles and analyses. Its rowids are those of `activities`, which
+# has no INTEGER PRIMARY KEY, so the database must not be VACUUMed without rebuilding it.
+_FTS_TRIGGERS = [f'''
+    CREATE TRIGGER IF NOT EXISTS activities_fts_insert AFTER INSERT ON activities BEGIN
+        INSERT INTO activities_fts (rowid, title, analysis) VALUES (new.rowid, {_TITLE_SQL.format(col='new.active_window')}, new.analysis);
+    END
+''', f'''
+    CREATE TRIGGER IF NOT EXISTS activities_fts_update AFTER UPDATE OF active_window, analysis ON activities BEGIN
+        DELETE FROM activities_fts WHERE rowid = old.rowid;
+        INSERT INTO activities_fts (rowid, title, analysis) VALUES (new.rowid, {_TITLE_SQL.format(col='new.active_window')}, new.analysis);
+    END
+''', '''
+    CREATE TRIGGER IF NOT EXISTS activities_fts_delete AFTER DELETE ON activities BEGIN
+        DELETE FROM activities_fts WHERE rowid = old.rowid;
+    END
+''']
+_LEXICAL_SEARCH = '''
+    SELECT a.timestamp, a.created_at, a.screenshot_path, a.active_window, a.analysis, bm25(activities_fts, 2.0, 1.0) AS score
+    FROM activities_fts JOIN activities a ON a.rowid = activities_fts.rowid
+    WHERE activities_fts MATCH ? AND a.processed = ?{conditions}
+    ORDER BY score LIMIT ?
+'''
+_SELECT_UNSESSIONED = '''
+    SELECT timestamp, created_ts, COALESCE(process_name, ''), title FROM activities
+    WHERE processed = ? AND session_id IS NULL
+    ORDER BY created_ts LIMIT ?
+'''
+_SELECT_LATEST_SESSION = 'SELECT id, process_name, title, start_ts, end_ts FROM sessions ORDER BY end_ts DESC LIMIT 1'
+_REFRESH_SESSION = '''
+    UPDATE sessions
+    SET (start_ts, end_ts, activity_count) = (SELECT MIN(created_ts), MAX(created_ts), COUNT(*) FROM activities WHERE session_id = sessions.id),
+        version = version + 1
+    WHERE id = ?
+'''
+_SELECT_STALE_SESSIONS = '''
+    SELECT id, process_name, title, start_ts, end_ts, activity_count, version FROM sessions
+    WHERE embedded_version IS NOT version
+    ORDER BY end_ts LIMIT ?
+'''
+_SELECT_CLAIMABLE = '''
+    SELECT timestamp, attempts FROM activities
+    WHERE processed = ?
+      AND (lease_expires_at IS NULL OR lease_expires_at < ?)
+      AND (next_attempt_at IS NULL OR next_attempt_at <= ?)
+    ORDER BY created_at LIMIT ?
+'''
+_COMPLETE_LEASED = '''
+    UPDATE activities SET processed = ?, lease_owner = NULL, lease_expires_at = NULL, last_error = NULL
+    WHERE timestamp = ? AND lease_owner = ?
+'''
+_DEAD_LETTER = '''
+    UPDATE activities SET processed = ?, last_error = ?, lease_owner = NULL, lease_expires_at = NULL, next_attempt_at = NULL
+    WHERE timestamp = ?
+'''
+_SELECT_ATTEMPTS = 'SELECT attempts FROM activities WHERE timestamp = ? AND lease_owner = ?'
+_FAIL_LEASED = '''
+    UPDATE activities
+    SET processed = ?, attempts = ?, next_attempt_at = ?, last_error = ?, lease_owner = NULL, lease_expires_at = NULL
+    WHERE timestamp = ? AND lease_owner = ?
+'''
 
 class DataManager:
-    def __init__(self, base_dir=None):
+    def __init__(self, base_dir=None, cache_size_kb=16384):
         self.base_dir = base_dir or os.path.join(os.getcwd(), 'data')
         ensure_dir(self.base_dir)
         self.db_path = os.path.join(self.base_dir, 'activities.db')
+        self.cache_size_kb = cache_size_kb
+        # Each thread (tracker, processor, API) keeps one long-lived connection
+        self._local = threading.local()
         self._create_db()
 
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit mode; writes go through _transaction(). sqlite3 caches the prepared
+            # statements for the SQL strings below per connection.
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, cached_statements=128)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            conn.execute(f'PRAGMA cache_size = -{self.cache_size_kb}')
+            conn.execute('PRAGMA temp_store = MEMORY')
+            conn.execute('PRAGMA busy_timeout = 30000')
+            # Title filters fold case in Python so they match the vector path (ActivityFilter.matches_title)
+            conn.create_function('casefold', 1, casefold_text, deterministic=True)
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def close(self):
+        """Close the calling thread's connection."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def data_version(self) -> int:
+        """Counter that changes whenever another connection commits to the database.
+
+        Reading it only touches the shared WAL index, so it is cheap enough to poll.
+        """
+        return self._connection().execute('PRAGMA data_version').fetchone()[0]
+
     def _create_db(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS activities (
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, 
-                timestamp TEXT PRIMARY KEY,
-                screenshot_path TEXT,
-                active_window TEXT,
-                user_apps TEXT,
-                analysis TEXT,
-                processed INTEGER
+        with self._transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS activities (
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, 
+                    timestamp TEXT PRIMARY KEY,
+                    screenshot_path TEXT,
+                    active_window TEXT,
+                    user_apps TEXT,
+                    analysis TEXT,
+                    processed INTEGER,
+                    frame_hash TEXT,
+                    duplicate_of TEXT,
+                    lease_owner TEXT,
+                    lease_expires_at REAL,
+                    attempts INTEGER DEFAULT 0,
+                    next_attempt_at REAL,
+                    last_error TEXT,
+                    monitor INTEGER,
+                    region TEXT,
+                    created_ts REAL,
+                    process_name TEXT,
+                    title TEXT,
+                    session_id INTEGER
+                )
+            ''')
+            self._ensure_columns(conn, 'activities', {
+                'frame_hash': 'TEXT',
+                'duplicate_of': 'TEXT',
+                'lease_owner': 'TEXT',
+                'lease_expires_at': 'REAL',
+                'attempts': 'INTEGER DEFAULT 0',
+                'next_attempt_at': 'REAL',
+                'last_error': 'TEXT',
+                'monitor': 'INTEGER',
+                'region': 'TEXT',
+                'created_ts': 'REAL',
+                'process_name': 'TEXT',
+                'title': 'TEXT',
+                'session_id': 'INTEGER',
+            })
+            conn.execute(_BACKFILL_FILTER_COLUMNS)
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_activities_processed_created_at ON activities (processed, created_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_activities_created_at ON activities (created_at)')
+            # Retrieval filters: time range, optionally narrowed to one application
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_activities_processed_created_ts ON activities (processed, created_ts)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_activities_process_name_created_ts ON activities (process_name, created_ts)')
+            self._create_fts(conn)
+            self._create_sessions(conn)
+
+    def _create_sessions(self, conn):
+        # Runs of consecutive activities in one application, summarised and embedded as a unit
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                id INTEGER PRIMARY KEY,
+                process_name TEXT,
+                title TEXT,
+                start_ts REAL,
+                end_ts REAL,
+                activity_count INTEGER,
+                summary TEXT,
+                version INTEGER DEFAULT 0,
+                embedded_version INTEGER
             )
         ''')
-        conn.commit()
-        conn.close()
-
-    def save_activity(self, screenshot_path, active_window, user_apps):
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO activities (created_at, timestamp, screenshot_path, active_window, user_apps, processed)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (datetime.now(timezone.utc).astimezone().isoformat(), timestamp, screenshot_path, json.dumps(active_window), json.dumps(user_apps), 0))
-        conn.commit()
-        conn.close()
-
-    def get_unprocessed_activities(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM activities WHERE processed = 0')
-        activities = [dict(zip(['created_at', 'timestamp', 'screenshot', 'active_window', 'user_apps', 'analysis', 'processed'], row))
-                      for row in cursor.fetchall()]
-        conn.close()
-        return activities
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_end_ts ON sessions (end_ts)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_activities_session_id ON activities (session_id)')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_activities_unsessioned ON activities (processed, created_ts)
+            WHERE session_id IS NULL
+        ''')
+
+    def _create_fts(self, conn):
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'activities_fts'").fetchone()
+        if not exists:
+            conn.execute("CREATE VIRTUAL TABLE activities_fts USING fts5(title, analysis, tokenize = 'unicode61 remove_diacritics 2')")
+            conn.execute(f'''
+                INSERT INTO activities_fts (rowid, title, analysis)
+                SELECT rowid, {_TITLE_SQL.format(col='active_window')}, analysis FROM activities
+            ''')
+        for trigger in _FTS_TRIGGERS:
+            conn.execute(trigger)
+
+    def _ensure_columns(self, conn, table, columns):
+        """Add columns introduced after a database was created."""
+        existing = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+        for name, column_type in columns.items():
+            if name not in existing:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {column_type}')
+
+    def _new_timestamp(self, suffix=""):
+        return datetime.now().strftime("%Y%m%d_%H%M%S") + suffix
+
+    def _unique_timestamp(self, conn, timestamp):
+        """`timestamp`, or with a counter appended if a capture in the same second already took it. Call inside _transaction()."""
+        candidate, counter = timestamp, 1
+        while conn.execute('SELECT 1 FROM activities WHERE timestamp = ?', (candidate,)).fetchone():
+            counter += 1
+            candidate = f"{timestamp}_{counter}"
+        return candidate
+
+    @staticmethod
+    def _filter_values(created_at, active_window):
+        """Values of the indexed filter columns: created_ts, process_name (lowercased) and title."""
+        active_window = active_window or {}
+        return created_at.timestamp(), _process_name(active_window) or None, active_window.get("title")
+
+    def save_activity(self, screenshot_path, active_window, user_apps, frame_hash=None, status=STATUS_PENDING,
+                      monitor=None, region=None):
+        """Insert a captured frame. `monitor` and `region` (left, top, right, bottom) locate a per-monitor crop."""
+        # Frames from several monitors can share a second, so their keys carry the monitor number
+        timestamp = self._new_timestamp(f"_m{monitor}" if monitor is not None else "")
+        created_at = datetime.now(timezone.utc).astimezone()
+        with self._transaction() as conn:
+            timestamp = self._unique_timestamp(conn, timestamp)
+            conn.execute(_INSERT_ACTIVITY, (
+                created_at.isoformat(), timestamp, screenshot_path,
+                json.dumps(active_window), json.dumps(user_apps), status,
+                format(frame_hash, 'x') if frame_hash is not None else None,
+                monitor, json.dumps(list(region)) if region is not None else None,
+                *self._filter_values(created_at, active_window)))
+        return timestamp
+
+    def save_duplicate_activity(self, duplicate_of, active_window, user_apps) -> Optional[str]:
+        """Record that the screen still shows the frame stored for `duplicate_of`, without a new screenshot.
+
+        Returns None, and stores nothing, if the `duplicate_of` row no longer exists.
+        """
+        timestamp = self._new_timestamp()
+        created_at = datetime.now(timezone.utc).astimezone()
+        with self._transaction() as conn:
+            timestamp = self._unique_timestamp(conn, timestamp)
+            cursor = conn.execute(_INSERT_DUPLICATE_ACTIVITY, (
+                created_at.isoformat(), timestamp,
+                json.dumps(active_window), json.dumps(user_apps), STATUS_DUPLICATE,
+                *self._filter_values(created_at, active_window), duplicate_of))
+        return timestamp if cursor.rowcount == 1 else None
+
+    def get_screenshot_path(self, timestamp) -> Optional[str]:
+        row = self._connection().execute('SELECT screenshot_path FROM activities WHERE timestamp = ?', (timestamp,)).fetchone()
+        return row[0] if row else None
+
+    def get_unprocessed_activities(self, limit=None):
+        cursor = self._connection().execute(_SELECT_UNPROCESSED, (STATUS_PENDING, -1 if limit is None else limit))
+        return [self._row_to_activity(row) for row in cursor.fetchall()]
+
+    def _row_to_activity(self, row):
+        activity = dict(zip(ACTIVITY_COLUMNS, row))
+        activity['screenshot'] = activity.pop('screenshot_path')
+        return activity
+
+    @staticmethod
+    def _as_json(value):
+        # Activities read back from the database already hold these columns as JSON text
+        return value if isinstance(value, str) else json.dumps(value)
 
     def update_activity(self, timestamp, activity_data):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE activities
-            SET active_window = ?, user_apps = ?, analysis = ?
-            WHERE timestamp = ?
-        ''', (json.dumps(activity_data['active_window']),
-              json.dumps(activity_data['user_apps']),
-              activity_data['analysis'],
-              timestamp))
-        conn.commit()
-        conn.close()
+        with self._transaction() as conn:
+            conn.execute(_UPDATE_ACTIVITY, (
+                self._as_json(activity_data['active_window']),
+                self._as_json(activity_data['user_apps']),
+                activity_data['analysis'],
+                timestamp))
 
     def mark_activity_as_processed(self, timestamp):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('UPDATE activities SET processed = 1 WHERE timestamp = ?', (timestamp,))
-        conn.commit()
-        conn.close()
+        with self._transaction() as conn:
+            conn.execute(_MARK_PROCESSED, (STATUS_PROCESSED, timestamp))
+
+    def mark_activity_encoded(self, timestamp, error=None):
+        """Finish an activity saved with STATUS_ENCODING: queue it for processing, or dead-letter it if encoding failed."""
+        with self._transaction() as conn:
+            conn.execute(_MARK_ENCODED, (STATUS_FAILED if error else STATUS_PENDING, str(error) if error else None,
+                                         timestamp, STATUS_ENCODING))
+
+    def fail_unfinished_encodings(self) -> int:
+        """Dead-letter activities whose screenshot encoding never finished, e.g. because the tracker was killed."""
+        with self._transaction() as conn:
+            cursor = conn.execute('UPDATE activities SET processed = ?, last_error = ? WHERE processed = ?',
+                                  (STATUS_FAILED, "Screenshot encoding did not finish", STATUS_ENCODING))
+        return cursor.rowcount
+
+    @staticmethod
+    def _filter_conditions(activity_filter: Optional[ActivityFilter], alias: str = ''):
+        """SQL conditions (each starting with AND) and parameters for an ActivityFilter."""
+        if activity_filter is None:
+            return '', []
+        conditions, params = [], []
+        if activity_filter.start_time is not None:
+            conditions.append(f'{alias}created_ts >= ?')
+            params.append(activity_filter.start_time)
+        if activity_filter.end_time is not None:
+            conditions.append(f'{alias}created_ts <= ?')
+            params.append(activity_filter.end_time)
+        if activity_filter.process_names:
+            conditions.append(f'{alias}process_name IN ({", ".join("?" * len(activity_filter.process_names))})')
+            params.extend(activity_filter.process_names)
+        if activity_filter.title:
+            conditions.append(f"casefold({alias}title) LIKE ? ESCAPE '\\'")
+            params.append('%' + re.sub(r'([%_\\])', r'\\\1', casefold_text(activity_filter.title)) + '%')
+        return ''.join(f'\n      AND {condition}' for condition in conditions), params
+
+    def lexical_search(self, match: str, limit: int = 20, activity_filter: Optional[ActivityFilter] = None) -> List[Dict]:
+        """Rank processed activities against an FTS5 MATCH expression with BM25 (lower scores are better).
+
+        Window titles weigh twice as much as analyses.
+        """
+        conditions, params = self._filter_conditions(activity_filter, alias='a.')
+        rows = self._connection().execute(_LEXICAL_SEARCH.format(conditions=conditions),
+                                          (match, STATUS_PROCESSED, *params, limit)).fetchall()
+        return [dict(zip(('timestamp', 'created_at', 'screenshot_path', 'active_window', 'analysis', 'score'), row)) for row in rows]
+
+    def has_matching_activities(self, activity_filter: ActivityFilter) -> bool:
+        """Whether any processed activity passes the filter; answered from the filter indexes."""
+        conditions, params = self._filter_conditions(activity_filter)
+        row = self._connection().execute(f'SELECT 1 FROM activities WHERE processed = ?{conditions} LIMIT 1',
+                                         (STATUS_PROCESSED, *params)).fetchone()
+        return row is not None
+
+    def assign_sessions(self, max_gap: float = 300, max_duration: float = 3600, limit: int = 1000) -> List[int]:
+        """Group processed activities that are not in a session yet into sessions. Returns the ids of new or grown sessions.
+
+        Activities are taken in time order. One continues the latest session when it is in the same
+        application (the same title when the process is unknown), starts at most `max_gap` seconds
+        after the session's last activity and keeps the session under `max_duration` seconds.
+        """
+        with self._transaction() as conn:
+            rows = conn.execute(_SELECT_UNSESSIONED, (STATUS_PROCESSED, limit)).fetchall()
+            if not rows:
+                return []
+            latest = conn.execute(_SELECT_LATEST_SESSION).fetchone()
+            session = dict(zip(('id', 'process_name', 'title', 'start_ts', 'end_ts'), latest)) if latest else None
+            members: Dict[int, List[str]] = {}
+            for timestamp, created_ts, process_name, title in rows:
+                continues = (session is not None
+                             and (process_name or title) == (session['process_name'] or session['title'])
+                             and session['start_ts'] <= created_ts <= session['end_ts'] + max_gap
+                             and created_ts - session['start_ts'] <= max_duration)
+                if continues:
+                    session['end_ts'] = max(session['end_ts'], created_ts)
+                else:
+                    cursor = conn.execute('INSERT INTO sessions (process_name, title, start_ts, end_ts) VALUES (?, ?, ?, ?)',
+                                          (process_name, title, created_ts, created_ts))
+                    session = {'id': cursor.lastrowid, 'process_name': process_name, 'title': title,
+                               'start_ts': created_ts, 'end_ts': created_ts}
+                members.setdefault(session['id'], []).append(timestamp)
+            for session_id, timestamps in members.items():
+                placeholders = ", ".join("?" * len(timestamps))
+                conn.execute(f'UPDATE activities SET session_id = ? WHERE timestamp IN ({placeholders})', (session_id, *timestamps))
+                conn.execute(_REFRESH_SESSION, (session_id,))
+        return list(members)
+
+    def get_stale_sessions(self, limit: int = 64) -> List[Dict]:
+        """Sessions whose summary embedding is missing or older than their latest activities."""
+        rows = self._connection().execute(_SELECT_STALE_SESSIONS, (limit,)).fetchall()
+        return [dict(zip(('id', 'process_name', 'title', 'start_ts', 'end_ts', 'activity_count', 'version'), row)) for row in rows]
+
+    def get_session_activities(self, session_id: int) -> List[Dict]:
+        rows = self._connection().execute(
+            'SELECT timestamp, created_ts, title, analysis FROM activities WHERE session_id = ? ORDER BY created_ts',
+            (session_id,)).fetchall()
+        return [dict(zip(('timestamp', 'created_ts', 'title', 'analysis'), row)) for row in rows]
+
+    def mark_session_embedded(self, session_id: int, version: int, summary: str) -> bool:
+        """Record the summary embedded for `version` of a session. Returns False if the session grew meanwhile."""
+        with self._transaction() as conn:
+            cursor = conn.execute('UPDATE sessions SET summary = ?, embedded_version = ? WHERE id = ? AND version = ?',
+                                  (summary, version, session_id, version))
+        return cursor.rowcount == 1
+
+    def session_horizon(self) -> Optional[float]:
+        """End of the latest session whose embedding is current. Later activities are only in the frame index."""
+        row = self._connection().execute('SELECT MAX(end_ts) FROM sessions WHERE embedded_version = version').fetchone()
+        return row[0]
+
+    def count_matching_activities(self, activity_filter: Optional[ActivityFilter] = None) -> int:
+        """Number of processed activities passing the filter; changes when new ones are processed in its window."""
+        conditions, params = self._filter_conditions(activity_filter)
+        return self._connection().execute(f'SELECT COUNT(*) FROM activities WHERE processed = ?{conditions}',
+                                          (STATUS_PROCESSED, *params)).fetchone()[0]
+
+    def claim_activities(self, worker_id, batch_size=8, lease_seconds=300, max_attempts=5) -> List[Dict]:
+        """Atomically lease up to `batch_size` pending activities to `worker_id`.
+
+        Activities whose lease expired (e.g. the worker crashed) or whose retry backoff
+        has elapsed become claimable again. Every claim counts as an attempt, so an
+        activity that keeps crashing its worker is moved to the dead-letter state
+        (`STATUS_FAILED`) instead of being claimed once it has used up `max_attempts`.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            while True:
+                rows = conn.execute(_SELECT_CLAIMABLE, (STATUS_PENDING, now, now, batch_size)).fetchall()
+                exhausted = [timestamp for timestamp, attempts in rows if (attempts or 0) >= max_attempts]
+                for timestamp in exhausted:
+                    conn.execute(_DEAD_LETTER, (STATUS_FAILED, f"Lease expired after {max_attempts} attempts", timestamp))
+                timestamps = [timestamp for timestamp, attempts in rows if (attempts or 0) < max_attempts]
+                if timestamps or not exhausted:
+                    break
+            if not timestamps:
+                return []
+            placeholders = ", ".join("?" * len(timestamps))
+            conn.execute(f'''
+                UPDATE activities SET lease_owner = ?, lease_expires_at = ?, attempts = COALESCE(attempts, 0) + 1
+                WHERE timestamp IN ({placeholders})
+            ''', (worker_id, now + lease_seconds, *timestamps))
+            rows = conn.execute(f'SELECT {", ".join(ACTIVITY_COLUMNS)} FROM activities WHERE timestamp IN ({placeholders}) ORDER BY created_at',
+                                timestamps).fetchall()
+        return [self._row_to_activity(row) for row in rows]
+
+    def renew_lease(self, timestamps, worker_id, lease_seconds=300) -> int:
+        """Extend the lease on activities still held by `worker_id`. Returns how many were renewed."""
+        if not timestamps:
+            return 0
+        placeholders = ", ".join("?" * len(timestamps))
+        with self._transaction() as conn:
+            cursor = conn.execute(f'''
+                UPDATE activities SET lease_expires_at = ?
+                WHERE lease_owner = ? AND processed = ? AND timestamp IN ({placeholders})
+            ''', (time.time() + lease_seconds, worker_id, STATUS_PENDING, *timestamps))
+        return cursor.rowcount
+
+    def complete_activity(self, timestamp, worker_id) -> bool:
+        """Mark a leased activity as processed. Returns False if the lease was lost to another worker."""
+        with self._transaction() as conn:
+            cursor = conn.execute(_COMPLETE_LEASED, (STATUS_PROCESSED, timestamp, worker_id))
+        return cursor.rowcount == 1
+
+    def fail_activity(self, timestamp, worker_id, error, max_attempts=5, backoff_seconds=30, max_backoff_seconds=3600) -> bool:
+        """Release a leased activity after a failure.
+
+        The activity is retried with exponential backoff, and moved to the dead-letter
+        state (`STATUS_FAILED`) once it has used up `max_attempts`. The attempt itself was
+        counted when the activity was claimed. Returns True if it was dead-lettered.
+        """
+        with self._transaction() as conn:
+            row = conn.execute(_SELECT_ATTEMPTS, (timestamp, worker_id)).fetchone()
+            if row is None:
+                return False
+            attempts = max(row[0] or 0, 1)
+            dead = attempts >= max_attempts
+            next_attempt_at = None if dead else time.time() + min(backoff_seconds * 2 ** (attempts - 1), max_backoff_seconds)
+            conn.execute(_FAIL_LEASED, (STATUS_FAILED if dead else STATUS_PENDING, attempts, next_attempt_at, str(error), timestamp, worker_id))
+        return dead
+
+def _process_name(active_window: Optional[Dict]) -> str:
+    # Vector store metadata cannot hold None
+    return ((active_window or {}).get("process_name") or "").lower()
+
+def _window_title(metadata: Dict) -> Optional[str]:
+    return (json.loads(metadata.get("active_window") or "null") or {}).get("title")
+
+def _store_results(items: List[Dict]) -> List[Dict]:
+    return [{"timestamp": item["id"], "analysis": item["document"], "metadata": item["metadata"], "distance": item["distance"]}
+            for item in items]
 
 class VectorDataManager:
-    def __init__(self, embedding_strategy: EmbeddingStrategy, base_dir=None):
+    """Activity and session embeddings, in the backend named by `backend` or the VECTOR_BACKEND
+    environment variable: "chroma" (the default) or "numpy" (see vector_store.py).
+
+    The NumPy backend also reads VECTOR_DTYPE, VECTOR_IVF_MIN_ROWS (0 keeps search exact) and
+    VECTOR_IVF_NPROBE unless the matching option is passed.
+    """
+
+    def __init__(self, embedding_strategy: EmbeddingStrategy, base_dir=None, backend: Optional[str] = None, **store_options):
         self.base_dir = base_dir or os.path.join(os.getcwd(), 'vector_data')
-        os.makedirs(self.base_dir, exist_ok=True)
-        
-        self.client = chromadb.PersistentClient(path=self.base_dir)
-        self.collection = self.client.get_or_create_collection(name="activities", metadata={"hnsw:space": "cosine"})
+        self.backend = backend or os.environ.get('VECTOR_BACKEND', 'chroma')
+        # Chroma owns the whole directory; other backends keep their files in a subdirectory of it
+        self.store_dir = self.base_dir if self.backend == 'chroma' else os.path.join(self.base_dir, self.backend)
+        os.makedirs(self.store_dir, exist_ok=True)
+        if self.backend == 'numpy':
+            store_options.setdefault('dtype', os.environ.get('VECTOR_DTYPE', 'float32'))
+            store_options.setdefault('ivf_min_rows', int(os.environ.get('VECTOR_IVF_MIN_ROWS', '200000')))
+            store_options.setdefault('nprobe', int(os.environ.get('VECTOR_IVF_NPROBE', '32')))
+
+        self.collection: VectorStore = open_vector_store(self.backend, self.store_dir, "activities", ACTIVITY_FIELDS,
+                                                         "created_at", **store_options)
+        # One summary embedding per session (see session_index.py)
+        self.sessions: VectorStore = open_vector_store(self.backend, self.store_dir, "sessions", SESSION_FIELDS,
+                                                       "start_ts", **store_options)
         
         self.embedding_strategy = embedding_strategy
 
-    def add_activity(self, timestamp: str, created_at: str, screenshot_path: str, active_window: Dict, analysis: str):
-        metadata = {
+    def activity_metadata(self, created_at: str, screenshot_path: str, active_window: Dict) -> Dict:
+        return {
             "created_at": datetime.strptime(created_at, "%Y-%m-%dT%H:%M:%S.%f%z").timestamp(),
             "screenshot_path": screenshot_path,
             "active_window": json.dumps(active_window),
+            # Lowercased so ActivityFilter can match it exactly in a `where` clause
+            "process_name": _process_name(active_window),
         }
-        
-        embedding = self.embedding_strategy.create_embedding(analysis)
-        
-        self.collection.add(
-            ids=[timestamp],
-            embeddings=[embedding],
-            metadatas=[metadata],
-            documents=[analysis]
-        )
+
+    def add_activity(self, timestamp: str, created_at: str, screenshot_path: str, active_window: Dict, analysis: str,
+                     embedding: Optional[List[float]] = None):
+        self.add_activities([{
+            "timestamp": timestamp,
+            "created_at": created_at,
+            "screenshot_path": screenshot_path,
+            "active_window": active_window,
+            "analysis": analysis,
+        }], embeddings=[embedding] if embedding is not None else None)
+
+    def add_activities(self, activities: List[Dict], embeddings: Optional[List[List[float]]] = None, chunk_size: int = 256):
+        """Add many activities, embedding them in one batched call when `embeddings` is not given."""
+        if not activities:
+            return
+        if embeddings is None:
+            embeddings = self.embedding_strategy.create_embeddings([activity["analysis"] for activity in activities])
+
+        for start in range(0, len(activities), chunk_size):
+            chunk = activities[start:start + chunk_size]
+            # Upsert so a retried activity (e.g. after a lost lease) does not fail on a duplicate id
+            self.collection.upsert(
+                ids=[activity["timestamp"] for activity in chunk],
+                embeddings=embeddings[start:start + chunk_size],
+                metadatas=[self.activity_metadata(activity["created_at"], activity["screenshot_path"], activity["active_window"])
+                           for activity in chunk],
+                documents=[activity["analysis"] for activity in chunk],
+            )
 
     def search_activities(self, query: str, n_results: int = 5) -> List[Dict]:
         query_embedding = self.embedding_strategy.create_embedding_retrieval(query)
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=n_results
-        )
-        
-        activities = []
-        for i in range(len(results['ids'][0])):
-            activity = {
-                "timestamp": results['ids'][0][i],
-                "analysis": results['documents'][0][i],
-                "metadata": results['metadatas'][0][i],
-                "distance": results['distances'][0][i]
-            }
-            activities.append(activity)
-        
-        return activities
+        return _store_results(self.collection.query(query_embedding, n_results))
 
     def get_all_activities(self) -> List[Dict]:
-        results = self.collection.get()
-        
-        activities = []
-        for i in range(len(results['ids'])):
-            activity = {
-                "timestamp": results['ids'][i],
-                "analysis": results['documents'][i],
-                "metadata": results['metadatas'][i]
-            }
-            activities.append(activity)
-        
-        return activities
+        return [{"timestamp": item["id"], "analysis": item["document"], "metadata": item["metadata"]}
+                for item in self.collection.get()]
 
-    def search_activities_with_filters(self, 
-                                       query: str, 
-                                       start_time: Optional[datetime] = None, 
-                                       end_time: Optional[datetime] = None, 
+    def search_activities_with_filters(self,
+                                       query: str,
+                                       activity_filter: Optional[ActivityFilter] = None,
                                        n_results: int = 5) -> List[Dict]:
         query_embedding = self.embedding_strategy.create_embedding(query)
-        
-        where_clause = {}
-        
-        # Add time filter if start_time and end_time are provided
-        if start_time and end_time:
-            where_clause["$and"] = [
-                {"created_at": {"$gte": start_time}},
-                {"created_at": {"$lte": end_time}}
-            ]
-                
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=n_results,
-            where=where_clause if where_clause else None
+        return self.query_by_embedding(query_embedding, activity_filter, n_results)
+
+    async def asearch_activities_with_filters(self,
+                                              query: str,
+                                              activity_filter: Optional[ActivityFilter] = None,
+                                              n_results: int = 5) -> List[Dict]:
+        """Async variant of `search_activities_with_filters`; the vector query runs on the blocking executor."""
+        query_embedding = await self.embedding_strategy.acreate_embedding(query)
+        return await run_blocking(self.query_by_embedding, query_embedding, activity_filter, n_results)
+
+    def query_by_embedding(self,
+                           query_embedding: List[float],
+                           activity_filter: Optional[ActivityFilter] = None,
+                           n_results: int = 5) -> List[Dict]:
+        """Nearest activities to `query_embedding`. The filter is applied inside the vector store, before ranking."""
+        where = activity_filter.to_where() if activity_filter else None
+        return self._query_activities(query_embedding, n_results, where, activity_filter)
+
+    def _query_activities(self, query_embedding: List[float], n_results: int, where: Optional[Dict],
+                          activity_filter: Optional[ActivityFilter]) -> List[Dict]:
+        """Query the activity vectors, then keep those whose window title passes the filter.
+
+        Vector stores cannot match the title case-insensitively, so with a title filter the
+        query fetches four times as many results at a time until enough of them match.
+        """
+        if activity_filter is None or not activity_filter.title:
+            return _store_results(self.collection.query(query_embedding, n_results, where=where))
+        total = self.collection.count()
+        fetch = n_results * 4
+        while True:
+            items = self.collection.query(query_embedding, min(fetch, total), where=where) if total else []
+            matching = [item for item in items if activity_filter.matches_title(_window_title(item["metadata"]))]
+            if len(matching) >= n_results or len(items) < fetch or fetch >= total:
+                return _store_results(matching[:n_results])
+            fetch *= 4
+
+    def add_sessions(self, sessions: List[Dict], embeddings: List[List[float]]):
+        """Upsert session summaries; each session dict has id, process_name, start_ts, end_ts, activity_count and summary."""
+        if not sessions:
+            return
+        self.sessions.upsert(
+            ids=[str(session["id"]) for session in sessions],
+            embeddings=embeddings,
+            metadatas=[{
+                "process_name": session["process_name"] or "",
+                "start_ts": session["start_ts"],
+                "end_ts": session["end_ts"],
+                "activity_count": session["activity_count"],
+            } for session in sessions],
+            documents=[session["summary"] for session in sessions],
         )
-        
-        activities = []
-        for i in range(len(results['ids'][0])):
-            activity = {
-                "timestamp": results['ids'][0][i],
-                "analysis": results['documents'][0][i],
-                "metadata": results['metadatas'][0][i],
-                "distance": results['distances'][0][i],
-            }
-            activities.append(activity)
-        
-        return activities
\ No newline at end of file
+
+    def query_sessions(self, query_embedding: List[float], activity_filter: Optional[ActivityFilter] = None,
+                       n_results: int = 5) -> List[Dict]:
+        results = self.sessions.query(
+            query_embedding,
+            n_results,
+            where=activity_filter.to_session_where() if activity_filter else None,
+        )
+        return [{"id": int(item["id"]), "summary": item["document"], **item["metadata"], "distance": item["distance"]}
+                for item in results]
+
+    def query_within_sessions(self, query_embedding: List[float], sessions: List[Dict], after: Optional[float] = None,
+                              activity_filter: Optional[ActivityFilter] = None, n_results: int = 5) -> List[Dict]:
+        """Frame-level search restricted to the time span and application of `sessions`, plus frames newer than `after`."""
+        scopes = [{"$and": [{"created_at": {"$gte": session["start_ts"]}},
+                            {"created_at": {"$lte": session["end_ts"]}},
+                            {"process_name": session["process_name"]}]} for session in sessions]
+        if after is not None:
+            scopes.append({"created_at": {"$gt": after}})
+        if not scopes:
+            return []
+        where = scopes[0] if len(scopes) == 1 else {"$or": scopes}
+        user_where = activity_filter.to_where() if activity_filter else None
+        if user_where:
+            where = {"$and": [where, user_where]}
+        return self._query_activities(query_embedding, n_results, where, activity_filter)
+
+    def ensure_filter_metadata(self, chunk_size: int = 1000) -> int:
+        """Add `process_name` to vectors stored before it was part of the metadata. Returns how many were updated.
+
+        Runs once per vector store; a marker file in `store_dir` records that it is done.
+        """
+        marker = os.path.join(self.store_dir, FILTER_METADATA_MARKER)
+        if os.path.exists(marker):
+            return 0
+        updated = 0
+        offset = 0
+        while True:
+            items = self.collection.get(limit=chunk_size, offset=offset)
+            if not items:
+                break
+            stale = [item for item in items if "process_name" not in item["metadata"]]
+            if stale:
+                self.collection.update_metadata(
+                    [item["id"] for item in stale],
+                    [{**item["metadata"], "process_name": _process_name(json.loads(item["metadata"].get("active_window") or "null"))}
+                     for item in stale],
+                )
+                updated += len(stale)
+            offset += len(items)
+        with open(marker, 'w') as f:
+            f.write(str(updated))
+        return updated
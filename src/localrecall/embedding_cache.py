@@ -0,0 +1,194 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Dict, Optional
+from .embedding_processor import EmbeddingStrategy
+from .utils import ensure_dir, run_blocking
+
+TASK_DOCUMENT = "document"
+TASK_QUERY = "query"
+
+class CachedEmbeddingStrategy(EmbeddingStrategy):
+    """Wraps an EmbeddingStrategy with an in-memory LRU backed by an on-disk SQLite store.
+
+    Entries are keyed by (model name, task type, hash of the whitespace-normalized text),
+    so captions or queries that only differ in spacing share one embedding.
+    """
+
+    def __init__(self, strategy: EmbeddingStrategy, cache_dir: Optional[str] = None,
+                 max_memory_entries: int = 4096, max_disk_mb: int = 512):
+        self.strategy = strategy
+        self.model_name = getattr(strategy, "model_name", type(strategy).__name__)
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_mb * 1024 * 1024
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_eviction = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        cache_dir = cache_dir or os.path.join(os.getcwd(), 'data')
+        ensure_dir(cache_dir)
+        self.db_path = os.path.join(cache_dir, 'embedding_cache.db')
+        self._conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        self._conn.execute('PRAGMA synchronous = NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB,
+                last_used REAL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)')
+
+    @contextmanager
+    def _transaction(self):
+        """Run the block in one transaction, rolled back on error so the shared connection stays usable. Caller holds the lock."""
+        self._conn.execute('BEGIN')
+        try:
+            yield self._conn
+        except BaseException:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._conn.execute('COMMIT')
+
+    def _key(self, task: str, text: str) -> str:
+        normalized = " ".join(text.split())
+        digest = hashlib.sha256(normalized.encode()).hexdigest()
+        return f"{self.model_name}:{task}:{digest}"
+
+    def _remember(self, key: str, embedding: List[float]):
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _lookup_memory(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            embedding = self._memory.get(key)
+            if embedding is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+            return embedding
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                embedding = self._memory.get(key)
+                if embedding is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = embedding
+            self.memory_hits += len(found)
+
+            missing = [key for key in keys if key not in found]
+            if not missing:
+                return found
+            placeholders = ", ".join("?" * len(missing))
+            rows = self._conn.execute(f'SELECT key, vector FROM embeddings WHERE key IN ({placeholders})', missing).fetchall()
+            if rows:
+                self._conn.execute(f'UPDATE embeddings SET last_used = ? WHERE key IN ({placeholders})',
+                                   (time.time(), *[key for key, _ in rows]))
+            for key, vector in rows:
+                embedding = array('f', vector).tolist()
+                self._remember(key, embedding)
+                found[key] = embedding
+            self.disk_hits += len(rows)
+            self.misses += len(set(keys) - set(found))
+        return found
+
+    def _store(self, entries: Dict[str, List[float]]):
+        now = time.time()
+        with self._lock:
+            for key, embedding in entries.items():
+                self._remember(key, embedding)
+            with self._transaction() as conn:
+                conn.executemany('INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)',
+                                 [(key, array('f', embedding).tobytes(), now) for key, embedding in entries.items()])
+            self._writes_since_eviction += len(entries)
+            if self._writes_since_eviction >= 256:
+                self._writes_since_eviction = 0
+                self._evict()
+
+    def _evict(self):
+        """Drop least recently used rows until the store is back under 90% of its size limit."""
+        with self._transaction() as conn:
+            count, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings').fetchone()
+            if total <= self.max_disk_bytes or not count:
+                return
+            excess_rows = int((total - self.max_disk_bytes * 0.9) / (total / count)) + 1
+            conn.execute('DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)', (excess_rows,))
+
+    def _cached(self, task: str, text: str, create) -> List[float]:
+        key = self._key(task, text)
+        found = self._lookup([key])
+        if key in found:
+            return found[key]
+        embedding = create(text)
+        self._store({key: embedding})
+        return embedding
+
+    def create_embedding(self, text: str) -> List[float]:
+        return self._cached(TASK_DOCUMENT, text, self.strategy.create_embedding)
+
+    def create_embedding_retrieval(self, text: str) -> List[float]:
+        return self._cached(TASK_QUERY, text, self.strategy.create_embedding_retrieval)
+
+    def create_embeddings(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(TASK_DOCUMENT, text) for text in texts]
+        found = self._lookup(list(dict.fromkeys(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        if missing:
+            created = dict(zip(missing, self.strategy.create_embeddings(list(missing.values()))))
+            self._store(created)
+            found.update(created)
+        return [found[key] for key in keys]
+
+    async def _acached(self, task: str, text: str, acreate) -> List[float]:
+        key = self._key(task, text)
+        # Memory hits are answered on the event loop; only disk lookups and misses leave it
+        embedding = self._lookup_memory(key)
+        if embedding is not None:
+            return embedding
+        found = await run_blocking(self._lookup, [key])
+        if key in found:
+            return found[key]
+        embedding = await acreate(text)
+        await run_blocking(self._store, {key: embedding})
+        return embedding
+
+    async def acreate_embedding(self, text: str) -> List[float]:
+        return await self._acached(TASK_DOCUMENT, text, self.strategy.acreate_embedding)
+
+    async def acreate_embedding_retrieval(self, text: str) -> List[float]:
+        return await self._acached(TASK_QUERY, text, self.strategy.acreate_embedding_retrieval)
+
+    async def aclose(self):
+        await self.strategy.aclose()
+
+    def stats(self) -> Dict:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "model": self.model_name,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+    def __repr__(self):
+        return f"CachedEmbeddingStrategy({self.strategy!r})"
@@ -1,10 +1,12 @@
 import os
 import google.generativeai as genai
 from abc import ABC, abstractmethod
-from typing import List
+from typing import List, Optional
 import requests
 import json
-
+import asyncio
+import aiohttp
+from .utils import run_blocking
 
 class EmbeddingStrategy(ABC):
     @abstractmethod
@@ -15,7 +17,27 @@ class EmbeddingStrategy(ABC):
     def create_embedding_retrieval(self, text: str) -> List[float]:
         pass
 
+    @abstractmethod
+    def create_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Embed many documents at once; same task type as `create_embedding`."""
+        pass
+
+    # Async variants for use on an event loop. The defaults run the blocking call in a
+    # worker thread; strategies with a native async client override them.
+    async def acreate_embedding(self, text: str) -> List[float]:
+        return await run_blocking(self.create_embedding, text)
+
+    async def acreate_embedding_retrieval(self, text: str) -> List[float]:
+        return await run_blocking(self.create_embedding_retrieval, text)
+
+    async def aclose(self):
+        pass
+
 class GeminiEmbeddingStrategy(EmbeddingStrategy):
+    model_name = "models/text-embedding-004"
+    # Upper bound on contents per batchEmbedContents request
+    max_batch_size = 100
+
     def __init__(self):
         api_key = os.environ.get("GEMINI_API_KEY")
         if not api_key:
@@ -36,11 +58,48 @@ class GeminiEmbeddingStrategy(EmbeddingStrategy):
             content=text,
         )
         return result['embedding']
-    
+
+    def create_embeddings(self, texts: List[str]) -> List[List[float]]:
+        embeddings = []
+        for start in range(0, len(texts), self.max_batch_size):
+            result = genai.embed_content(
+                model=self.model_name,
+                content=texts[start:start + self.max_batch_size],
+                task_type="semantic_similarity"
+            )
+            embeddings.extend(result['embedding'])
+        return embeddings
+
+    async def acreate_embedding(self, text: str) -> List[float]:
+        result = await genai.embed_content_async(
+            model=self.model_name,
+            content=text,
+            task_type="semantic_similarity"
+        )
+        return result['embedding']
+
+    async def acreate_embedding_retrieval(self, text: str) -> List[float]:
+        result = await genai.embed_content_async(
+            model=self.model_name,
+            content=text,
+        )
+        return result['embedding']
+
 class LocalEmbeddingStrategy(EmbeddingStrategy):
-    def __init__(self, base_url: str = "http://localhost:11434", timeout: int = 40):
+    model_name = "mxbai-embed-large"
+
+    def __init__(self, base_url: Optional[str] = None, timeout: int = 40, max_batch_size: int = 64,
+                 max_connections: int = 16):
+        # Same server the ollama client talks to (OLLAMA_HOST), unless given explicitly
+        base_url = base_url or os.environ.get("OLLAMA_HOST") or "http://localhost:11434"
+        if "://" not in base_url:
+            base_url = f"http://{base_url}"
         self.base_url = base_url.rstrip('/')
         self.timeout = timeout
+        self.max_batch_size = max_batch_size
+        self.max_connections = max_connections
+        self._async_session = None
+        self._session_loop = None
         self._check_service_availability()
 
     def _check_service_availability(self):
@@ -102,5 +161,71 @@ class LocalEmbeddingStrategy(EmbeddingStrategy):
         except Exception as e:
             raise Exception(f"Failed to create embedding. Error: {str(e)}")
 
+    def create_embeddings(self, texts: List[str]) -> List[List[float]]:
+        if any(not text.strip() for text in texts):
+            raise ValueError("Input text cannot be empty or whitespace only.")
+
+        url = f"{self.base_url}/api/embed"
+        headers = {
+            "Content-Type": "application/json"
+        }
+
+        embeddings = []
+        try:
+            for start in range(0, len(texts), self.max_batch_size):
+                batch = texts[start:start + self.max_batch_size]
+                payload = json.dumps({
+                    "model": self.model_name,
+                    "input": batch
+                })
+                response = requests.post(url, headers=headers, data=payload, timeout=self.timeout)
+                response.raise_for_status()
+                batch_embeddings = response.json().get("embeddings")
+
+                if not isinstance(batch_embeddings, list) or len(batch_embeddings) != len(batch):
+                    raise ValueError("Invalid embeddings format received from the server.")
+
+                embeddings.extend(batch_embeddings)
+            return embeddings
+
+        except Exception as e:
+            raise Exception(f"Failed to create embeddings. Error: {str(e)}")
+
+    def _session(self) -> aiohttp.ClientSession:
+        """Keep-alive session shared by all async calls on the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._async_session is None or self._async_session.closed or self._session_loop is not loop:
+            self._async_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            self._session_loop = loop
+        return self._async_session
+
+    async def acreate_embedding(self, text: str) -> List[float]:
+        if not text.strip():
+            raise ValueError("Input text cannot be empty or whitespace only.")
+
+        try:
+            async with self._session().post(f"{self.base_url}/api/embeddings",
+                                            json={"model": self.model_name, "prompt": text}) as response:
+                response.raise_for_status()
+                embedding = (await response.json()).get("embedding")
+
+            if not embedding or not isinstance(embedding, list):
+                raise ValueError("Invalid embedding format received from the server.")
+
+            return embedding
+
+        except Exception as e:
+            raise Exception(f"Failed to create embedding. Error: {str(e)}")
+
+    async def acreate_embedding_retrieval(self, text: str) -> List[float]:
+        return await self.acreate_embedding(text)
+
+    async def aclose(self):
+        if self._async_session is not None and not self._async_session.closed:
+            await self._async_session.close()
+
     def __repr__(self):
         return f"LocalEmbeddingStrategy(base_url='{self.base_url}')"
\ No newline at end of file
@@ -1,11 +1,81 @@
 import os
 from cryptography.fernet import Fernet, InvalidToken
+from cryptography.exceptions import InvalidTag
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 import base64
+import hashlib
+import io
+import struct
 import tempfile
+from typing import Iterator
 from .utils import load_env_variables
 
+# Binary container: header, then AES-256-GCM chunks of `chunk_size` plaintext bytes (the last
+# one may be shorter or empty). Each chunk's nonce is the header's random prefix, a chunk
+# counter and a last-chunk flag, and the header is authenticated with every chunk, so chunks
+# cannot be reordered, dropped or truncated without decryption failing.
+CONTAINER_MAGIC = b"LRAE"
+CONTAINER_VERSION = 1
+DEFAULT_CHUNK_SIZE = 64 * 1024
+TAG_SIZE = 16
+_HEADER = struct.Struct(">4sB8sI7s")  # magic, version, key id, chunk size, nonce prefix
+
+def _chunk_nonce(prefix: bytes, counter: int, final: bool) -> bytes:
+    return prefix + struct.pack(">I", counter) + (b"\x01" if final else b"\x00")
+
+class EncryptedWriter(io.RawIOBase):
+    """File-like object that encrypts everything written to it into the chunked container format."""
+
+    def __init__(self, fileobj, aead: AESGCM, key_id: bytes, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self._file = fileobj
+        self._aead = aead
+        self._chunk_size = chunk_size
+        self._prefix = os.urandom(7)
+        self._header = _HEADER.pack(CONTAINER_MAGIC, CONTAINER_VERSION, key_id, chunk_size, self._prefix)
+        self._buffer = bytearray()
+        self._counter = 0
+        self.bytes_written = len(self._header)
+        self._file.write(self._header)
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        # Keep at least one byte back so the last chunk is always written by close()
+        while len(self._buffer) > self._chunk_size:
+            self._emit(bytes(self._buffer[:self._chunk_size]), final=False)
+            del self._buffer[:self._chunk_size]
+        return len(data)
+
+    def _emit(self, chunk: bytes, final: bool):
+        ciphertext = self._aead.encrypt(_chunk_nonce(self._prefix, self._counter, final), chunk, self._header)
+        self._file.write(ciphertext)
+        self.bytes_written += len(ciphertext)
+        self._counter += 1
+
+    def close(self):
+        if not self.closed:
+            self._emit(bytes(self._buffer), final=True)
+            self._buffer.clear()
+            self._file.close()
+        super().close()
+
+    def abort(self):
+        """Close the underlying file without writing the final chunk, leaving an undecryptable file."""
+        if not self.closed:
+            self._file.close()
+        super().close()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
 class EncryptionManager:
     def __init__(self, password=os.environ.get('ENCRYPTION_PASSWORD'), salt_file='encryption_salt.bin'):
         if not password:
@@ -29,39 +99,142 @@ class EncryptionManager:
             salt=salt,
             iterations=100000,
         )
-        key = base64.urlsafe_b64encode(kdf.derive(password.encode()))
+        master_key = kdf.derive(password.encode())
+        key = base64.urlsafe_b64encode(master_key)
         self.fernet = Fernet(key)
 
-    def encrypt_file(self, file_path):
+        # Separate subkey for the chunked container so the Fernet key is never reused with another cipher
+        aead_key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"localrecall-aead-v1").derive(master_key)
+        self.aead = AESGCM(aead_key)
+        self.key_id = hashlib.sha256(aead_key).digest()[:8]
+
+    def open_encrypted_writer(self, encrypted_file_path, chunk_size=DEFAULT_CHUNK_SIZE) -> EncryptedWriter:
+        """Return a file-like writer that streams encrypted chunks to `encrypted_file_path`."""
+        return EncryptedWriter(open(encrypted_file_path, 'wb'), self.aead, self.key_id, chunk_size)
+
+    def encrypt_file(self, file_path, chunk_size=DEFAULT_CHUNK_SIZE):
         try:
-            with open(file_path, 'rb') as file:
-                data = file.read()
-            encrypted_data = self.fernet.encrypt(data)
-            with open(file_path + '.encrypted', 'wb') as file:
-                file.write(encrypted_data)
+            with open(file_path, 'rb') as source, self.open_encrypted_writer(file_path + '.encrypted', chunk_size) as writer:
+                while True:
+                    data = source.read(chunk_size)
+                    if not data:
+                        break
+                    writer.write(data)
             os.remove(file_path)
         except Exception as e:
             raise RuntimeError(f"Encryption failed: {str(e)}")
 
-    def decrypt_file(self, encrypted_file_path, decrypted_file_path=None):
+    def is_container(self, encrypted_file_path) -> bool:
+        with open(encrypted_file_path, 'rb') as file:
+            return file.read(len(CONTAINER_MAGIC)) == CONTAINER_MAGIC
+
+    def _read_header(self, file):
+        header = file.read(_HEADER.size)
+        if len(header) != _HEADER.size:
+            raise ValueError("Decryption failed: Truncated header.")
+        magic, version, key_id, chunk_size, prefix = _HEADER.unpack(header)
+        if magic != CONTAINER_MAGIC or version != CONTAINER_VERSION:
+            raise ValueError(f"Decryption failed: Unsupported container version {version}.")
+        if key_id != self.key_id:
+            raise ValueError("Decryption failed: The file was encrypted with a different key.")
+        return header, chunk_size, prefix
+
+    def _iter_container(self, file, first_only=False) -> Iterator[bytes]:
+        header, chunk_size, prefix = self._read_header(file)
+        block_size = chunk_size + TAG_SIZE
+        counter = 0
+        current = file.read(block_size)
+        while True:
+            # Look ahead to learn whether `current` is the last chunk
+            upcoming = file.read(1 if first_only else block_size)
+            final = not upcoming
+            try:
+                yield self.aead.decrypt(_chunk_nonce(prefix, counter, final), current, header)
+            except InvalidTag:
+                raise ValueError("Decryption failed: Invalid token. The encryption key may be incorrect or the data may be corrupted.")
+            if final or first_only:
+                return
+            current = upcoming
+            counter += 1
+
+    def iter_decrypt(self, encrypted_file_path) -> Iterator[bytes]:
+        """Yield the plaintext chunk by chunk. Legacy Fernet files are yielded as a single chunk."""
         try:
             with open(encrypted_file_path, 'rb') as file:
-                encrypted_data = file.read()
-            decrypted_data = self.fernet.decrypt(encrypted_data)
-            
+                if file.read(len(CONTAINER_MAGIC)) == CONTAINER_MAGIC:
+                    file.seek(0)
+                    yield from self._iter_container(file)
+                    return
+                file.seek(0)
+                yield self.fernet.decrypt(file.read())
+        except InvalidToken:
+            raise ValueError("Decryption failed: Invalid token. The encryption key may be incorrect or the data may be corrupted.")
+        except ValueError:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Decryption failed: {str(e)}")
+
+    def decrypt_first_chunk(self, encrypted_file_path) -> bytes:
+        """Decrypt only the first chunk, e.g. to read an image header without decrypting the whole file."""
+        with open(encrypted_file_path, 'rb') as file:
+            if file.read(len(CONTAINER_MAGIC)) != CONTAINER_MAGIC:
+                return next(self.iter_decrypt(encrypted_file_path))
+            file.seek(0)
+            return next(self._iter_container(file, first_only=True))
+
+    def decrypt_to_buffer(self, encrypted_file_path) -> bytearray:
+        """Decrypt into a single mutable buffer in memory; nothing is written to disk."""
+        buffer = bytearray()
+        for chunk in self.iter_decrypt(encrypted_file_path):
+            buffer += chunk
+        return buffer
+
+    def decrypt_to_bytes(self, encrypted_file_path) -> bytes:
+        return b"".join(self.iter_decrypt(encrypted_file_path))
+
+    def decrypt_to_memoryview(self, encrypted_file_path) -> memoryview:
+        """Decrypt in memory and return a view, so callers can slice the plaintext without copying it."""
+        return memoryview(self.decrypt_to_buffer(encrypted_file_path))
+
+    def decrypt_file(self, encrypted_file_path, decrypted_file_path=None):
+        try:
             if not decrypted_file_path:
                 with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
                     decrypted_file_path = temp_file.name
-            
+
             with open(decrypted_file_path, 'wb') as file:
-                file.write(decrypted_data)
-            
+                for chunk in self.iter_decrypt(encrypted_file_path):
+                    file.write(chunk)
+
             return decrypted_file_path
-        except InvalidToken:
-            raise ValueError("Decryption failed: Invalid token. The encryption key may be incorrect or the data may be corrupted.")
+        except ValueError:
+            raise
         except Exception as e:
             raise RuntimeError(f"Decryption failed: {str(e)}")
 
+    def migrate_file(self, encrypted_file_path, chunk_size=DEFAULT_CHUNK_SIZE) -> bool:
+        """Rewrite a legacy Fernet file in place as a chunked container. Returns False if it already was one."""
+        if self.is_container(encrypted_file_path):
+            return False
+        with open(encrypted_file_path, 'rb') as file:
+            try:
+                data = self.fernet.decrypt(file.read())
+            except InvalidToken:
+                raise ValueError("Decryption failed: Invalid token. The encryption key may be incorrect or the data may be corrupted.")
+
+        # Write next to the original and swap atomically, so an interrupted migration never loses the file
+        directory = os.path.dirname(os.path.abspath(encrypted_file_path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.migrating')
+        try:
+            with EncryptedWriter(os.fdopen(fd, 'wb'), self.aead, self.key_id, chunk_size) as writer:
+                writer.write(data)
+            os.replace(temp_path, encrypted_file_path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return True
+
     def encrypt_string(self, text):
         return self.fernet.encrypt(text.encode()).decode()
 
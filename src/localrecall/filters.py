@@ -0,0 +1,138 @@
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple, Union
+
+_UNITS = {
+    "s": 1, "sec": 1, "secs": 1, "second": 1, "seconds": 1,
+    "m": 60, "min": 60, "mins": 60, "minute": 60, "minutes": 60,
+    "h": 3600, "hr": 3600, "hrs": 3600, "hour": 3600, "hours": 3600,
+    "d": 86400, "day": 86400, "days": 86400,
+    "w": 604800, "week": 604800, "weeks": 604800,
+}
+_RELATIVE = re.compile(r"^(?:last|past)?\s*(\d+(?:\.\d+)?)?\s*([a-z]+)$")
+
+def casefold_text(text: Optional[str]) -> str:
+    """Unicode case folding for title matching (SQLite's own LIKE only folds ASCII)."""
+    return (text or "").casefold()
+
+@dataclass(frozen=True)
+class ActivityFilter:
+    """Restricts retrieval to a time range (epoch seconds), process names and a window title substring.
+
+    The title matches case-insensitively against the window title on every path, with Unicode
+    case folding (`casefold_text`): in SQL through a registered `casefold()` function, and via
+    `matches_title` over vector search results.
+    """
+    start_time: Optional[float] = None
+    end_time: Optional[float] = None
+    process_names: Tuple[str, ...] = ()
+    title: Optional[str] = None
+
+    def is_empty(self) -> bool:
+        return self.start_time is None and self.end_time is None and not self.process_names and not self.title
+
+    def to_where(self) -> Optional[Dict]:
+        """Chroma `where` clause over the activity metadata."""
+        clauses = []
+        if self.start_time is not None:
+            clauses.append({"created_at": {"$gte": self.start_time}})
+        if self.end_time is not None:
+            clauses.append({"created_at": {"$lte": self.end_time}})
+        if len(self.process_names) == 1:
+            clauses.append({"process_name": self.process_names[0]})
+        elif self.process_names:
+            clauses.append({"process_name": {"$in": list(self.process_names)}})
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    def to_session_where(self) -> Optional[Dict]:
+        """Chroma `where` clause over session metadata: sessions overlapping the time range, in one of the processes."""
+        clauses = []
+        if self.start_time is not None:
+            clauses.append({"end_ts": {"$gte": self.start_time}})
+        if self.end_time is not None:
+            clauses.append({"start_ts": {"$lte": self.end_time}})
+        if len(self.process_names) == 1:
+            clauses.append({"process_name": self.process_names[0]})
+        elif self.process_names:
+            clauses.append({"process_name": {"$in": list(self.process_names)}})
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    def matches_title(self, window_title: Optional[str]) -> bool:
+        """Whether a window title contains the title filter, ignoring case (always True without one)."""
+        return not self.title or casefold_text(self.title) in casefold_text(window_title)
+
+def _parse_time(value: Union[str, int, float, None]) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if not isinstance(value, str):
+        raise ValueError(f"Invalid time {value!r}, expected ISO 8601 or epoch seconds")
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise ValueError(f"Invalid time '{value}', expected ISO 8601 or epoch seconds")
+
+def parse_relative_range(text: str, now: Optional[float] = None) -> Tuple[float, float]:
+    """Parse "today", "yesterday", or "[last] <n> <unit>" (e.g. "last 2 hours", "30m") into (start, end) epoch seconds."""
+    now = time.time() if now is None else now
+    text = text.strip().lower()
+    midnight = datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0)
+    if text == "today":
+        return midnight.timestamp(), now
+    if text == "yesterday":
+        return (midnight - timedelta(days=1)).timestamp(), midnight.timestamp()
+
+    match = _RELATIVE.match(text)
+    if not match or match.group(2) not in _UNITS:
+        raise ValueError(f"Invalid relative range '{text}', expected e.g. 'last 2 hours', '30m', 'today'")
+    amount = float(match.group(1) or 1)
+    return now - amount * _UNITS[match.group(2)], now
+
+def parse_filters(filters: Optional[Dict], now: Optional[float] = None) -> ActivityFilter:
+    """
+    Build an ActivityFilter from the chat request's `filters` payload.
+
+    Recognised keys: `start_time` and `end_time` (ISO 8601 or epoch seconds), `last` (a relative
+    range such as "last 2 hours" or "today"), `process_name` (one name or a list, case-insensitive)
+    and `title` (window title substring).
+
+    Raises:
+        ValueError: If a value has the wrong type, cannot be parsed, or the range is empty.
+    """
+    if not filters:
+        return ActivityFilter()
+    unknown = set(filters) - {"start_time", "end_time", "last", "process_name", "title"}
+    if unknown:
+        raise ValueError(f"Unknown filters: {sorted(unknown)}")
+
+    for key in ("last", "title"):
+        if filters.get(key) is not None and not isinstance(filters[key], str):
+            raise ValueError(f"Filter '{key}' must be a string")
+    process_names = filters.get("process_name") or ()
+    if isinstance(process_names, str):
+        process_names = (process_names,)
+    if not isinstance(process_names, (list, tuple)) or not all(isinstance(name, str) for name in process_names):
+        raise ValueError("Filter 'process_name' must be a string or a list of strings")
+
+    start_time = _parse_time(filters.get("start_time"))
+    end_time = _parse_time(filters.get("end_time"))
+    if filters.get("last"):
+        relative_start, relative_end = parse_relative_range(filters["last"], now)
+        start_time = max(start_time, relative_start) if start_time is not None else relative_start
+        end_time = min(end_time, relative_end) if end_time is not None else relative_end
+    if start_time is not None and end_time is not None and start_time > end_time:
+        raise ValueError("start_time must not be after end_time")
+
+    return ActivityFilter(
+        start_time=start_time,
+        end_time=end_time,
+        process_names=tuple(sorted({name.strip().lower() for name in process_names if name.strip()})),
+        title=(filters.get("title") or "").strip() or None,
+    )
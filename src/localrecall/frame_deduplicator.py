@@ -0,0 +1,55 @@
+from collections import deque
+from typing import Optional
+from PIL import Image
+
+class FrameDeduplicator:
+    """Detects near-identical frames with a difference hash (dHash) on a downsampled grayscale image."""
+
+    def __init__(self, threshold=5, history_size=8, hash_size=8):
+        self.threshold = threshold
+        self.hash_size = hash_size
+        # (frame_hash, reference) pairs of the most recent stored frames
+        self.recent_frames = deque(maxlen=history_size)
+
+    def compute_hash(self, frame) -> int:
+        # Shrink before converting to grayscale, so only a few pixels are ever converted
+        size = (self.hash_size + 1, self.hash_size)
+        if isinstance(frame, Image.Image):
+            img = frame.resize(size, Image.BOX, reducing_gap=2.0)
+        else:
+            # Wrap mss's raw BGRA buffer without copying it; the channels are swapped back after shrinking
+            small = Image.frombuffer("RGBX", frame.size, frame.raw, "raw", "RGBX", 0, 1).resize(size, Image.BOX, reducing_gap=2.0)
+            blue, green, red, _ = small.split()
+            img = Image.merge("RGB", (red, green, blue))
+        img = img.convert("L")
+
+        pixels = img.tobytes()
+        width = self.hash_size + 1
+
+        frame_hash = 0
+        for row in range(self.hash_size):
+            offset = row * width
+            for col in range(self.hash_size):
+                frame_hash = (frame_hash << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+        return frame_hash
+
+    @staticmethod
+    def hamming_distance(hash_a: int, hash_b: int) -> int:
+        return bin(hash_a ^ hash_b).count("1")
+
+    def find_duplicate(self, frame_hash: int) -> Optional[str]:
+        """Return the reference of the closest recent frame within the threshold, if any."""
+        best_reference, best_distance = None, None
+        for recent_hash, reference in self.recent_frames:
+            distance = self.hamming_distance(frame_hash, recent_hash)
+            if distance <= self.threshold and (best_distance is None or distance < best_distance):
+                best_reference, best_distance = reference, distance
+        return best_reference
+
+    def remember(self, frame_hash: int, reference: str):
+        self.recent_frames.append((frame_hash, reference))
+
+    def forget(self, reference: str):
+        """Stop matching frames against `reference`, e.g. because its activity is gone."""
+        self.recent_frames = deque(((frame_hash, kept) for frame_hash, kept in self.recent_frames if kept != reference),
+                                   maxlen=self.recent_frames.maxlen)
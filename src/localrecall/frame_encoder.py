@@ -0,0 +1,166 @@
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional
+from PIL import Image
+from .encryption_manager import EncryptionManager
+from .utils import thumbnail_path
+
+# Longest side of the preview stored with every capture
+THUMBNAIL_SIZE = 320
+
+class FrameCodec(ABC):
+    """Encodes a PIL image into a writable file object."""
+    name = None
+    extension = None
+
+    @abstractmethod
+    def encode(self, image: Image.Image, fileobj):
+        pass
+
+class PngCodec(FrameCodec):
+    name = "png"
+    extension = "png"
+
+    def __init__(self, compress_level: int = 1):
+        # Level 1 is several times faster than zlib's default and only slightly larger on screen content
+        self.compress_level = compress_level
+
+    def encode(self, image, fileobj):
+        image.save(fileobj, format="PNG", compress_level=self.compress_level)
+
+class JpegCodec(FrameCodec):
+    name = "jpeg"
+    extension = "jpg"
+
+    def __init__(self, quality: int = 85, optimize: bool = False):
+        self.quality = quality
+        self.optimize = optimize
+
+    def encode(self, image, fileobj):
+        image.save(fileobj, format="JPEG", quality=self.quality, optimize=self.optimize)
+
+class WebpCodec(FrameCodec):
+    name = "webp"
+    extension = "webp"
+    # libwebp `method`: 0 is fastest, 6 gives the smallest files
+    PRESETS = {"fast": 0, "balanced": 4, "small": 6}
+
+    def __init__(self, quality: int = 80, preset: str = "fast", lossless: bool = False):
+        if preset not in self.PRESETS:
+            raise ValueError(f"Unknown WebP preset '{preset}', expected one of {sorted(self.PRESETS)}")
+        self.quality = quality
+        self.method = self.PRESETS[preset]
+        self.lossless = lossless
+
+    def encode(self, image, fileobj):
+        image.save(fileobj, format="WEBP", quality=self.quality, method=self.method, lossless=self.lossless)
+
+CODECS = {codec.name: codec for codec in (PngCodec, JpegCodec, WebpCodec)}
+
+def make_codec(name: str, quality: Optional[int] = None, preset: Optional[str] = None) -> FrameCodec:
+    if name not in CODECS:
+        raise ValueError(f"Unknown codec '{name}', expected one of {sorted(CODECS)}")
+    if name == "png":
+        return PngCodec()
+    kwargs = {}
+    if quality is not None:
+        kwargs["quality"] = quality
+    if name == "webp" and preset is not None:
+        kwargs["preset"] = preset
+    return CODECS[name](**kwargs)
+
+def frame_to_image(frame, resize_factor: float = 1.0) -> Image.Image:
+    """Turn an mss screenshot (or a PIL image) into an RGB image, optionally downscaled."""
+    if isinstance(frame, Image.Image):
+        image = frame
+    else:
+        # Decode straight from mss's BGRA buffer; `.rgb`/`.bgra` would each make a full copy first
+        image = Image.frombuffer("RGB", frame.size, frame.raw, "raw", "BGRX", 0, 1)
+    if resize_factor != 1.0:
+        new_size = tuple(int(dim * resize_factor) for dim in image.size)
+        # reducing_gap box-filters most of the way down before LANCZOS, which is much cheaper
+        image = image.resize(new_size, Image.LANCZOS, reducing_gap=2.0)
+    return image
+
+def make_thumbnail(image: Image.Image, size: int = THUMBNAIL_SIZE) -> Image.Image:
+    """Downscale `image` so its longest side is at most `size` pixels."""
+    scale = size / max(image.size)
+    if scale >= 1:
+        return image
+    new_size = tuple(max(1, int(dim * scale)) for dim in image.size)
+    return image.resize(new_size, Image.BILINEAR, reducing_gap=2.0)
+
+def write_thumbnail(encryption_manager: EncryptionManager, image: Image.Image, path: str,
+                    codec: Optional[FrameCodec] = None, size: int = THUMBNAIL_SIZE) -> int:
+    """Encrypt a thumbnail of `image` to `path`. Returns the encrypted size."""
+    with encryption_manager.open_encrypted_writer(path) as writer:
+        (codec or WebpCodec(quality=70)).encode(make_thumbnail(image, size), writer)
+    return writer.bytes_written
+
+class FrameEncoder:
+    """Encodes frames on a background pool, streaming each one straight into an encrypted file.
+
+    No plaintext image is ever written to disk. Unless `thumbnail_size` is None, a small
+    encrypted WebP preview is written next to each frame (see utils.thumbnail_path) so
+    chat and UI previews never decrypt the full image. Per-codec CPU time and output size
+    are tracked and available from `stats()`.
+    """
+
+    def __init__(self, encryption_manager: EncryptionManager, codec: FrameCodec, resize_factor: float = 1.0, workers: int = 2,
+                 thumbnail_size: Optional[int] = THUMBNAIL_SIZE):
+        self.encryption_manager = encryption_manager
+        self.codec = codec
+        self.resize_factor = resize_factor
+        self.thumbnail_size = thumbnail_size
+        self.thumbnail_codec = WebpCodec(quality=70)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="encoder")
+        self._stats_lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def encode(self, frame, encrypted_path: str) -> str:
+        """Encode and encrypt `frame` to `encrypted_path` on the calling thread."""
+        start = time.thread_time()
+        preview_path = thumbnail_path(encrypted_path)
+        try:
+            image = frame_to_image(frame, self.resize_factor)
+            with self.encryption_manager.open_encrypted_writer(encrypted_path) as writer:
+                self.codec.encode(image, writer)
+            self._record(self.codec.name, time.thread_time() - start, writer.bytes_written)
+            if self.thumbnail_size:
+                start = time.thread_time()
+                size = write_thumbnail(self.encryption_manager, image, preview_path, self.thumbnail_codec, self.thumbnail_size)
+                self._record("thumbnail", time.thread_time() - start, size)
+        except Exception:
+            for path in (encrypted_path, preview_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+        return encrypted_path
+
+    def submit(self, frame, encrypted_path: str) -> Future:
+        return self.executor.submit(self.encode, frame, encrypted_path)
+
+    def _record(self, name: str, cpu_seconds: float, size: int):
+        with self._stats_lock:
+            stats = self._stats.setdefault(name, {"captures": 0, "cpu_seconds": 0.0, "bytes": 0})
+            stats["captures"] += 1
+            stats["cpu_seconds"] += cpu_seconds
+            stats["bytes"] += size
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Per codec (and "thumbnail"): number of captures, mean CPU milliseconds and mean encrypted bytes per capture."""
+        with self._stats_lock:
+            return {
+                name: {
+                    "captures": stats["captures"],
+                    "cpu_ms_per_capture": 1000 * stats["cpu_seconds"] / stats["captures"],
+                    "bytes_per_capture": stats["bytes"] / stats["captures"],
+                }
+                for name, stats in self._stats.items()
+            }
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait)
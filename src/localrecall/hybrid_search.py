@@ -0,0 +1,199 @@
+import asyncio
+import json
+import re
+from typing import Dict, List, Optional, Tuple
+from .data_manager import DataManager, VectorDataManager
+from .filters import ActivityFilter
+from .session_index import SessionIndex
+from .utils import run_blocking
+
+SOURCE_LEXICAL = "lexical"
+SOURCE_VECTOR = "vector"
+
+_QUERY_TERM = re.compile(r'"[^"]+"|[^\s"]+')
+_WORD = re.compile(r'[^\W_]+')
+# Separators that make a term an identifier: snake_case, paths, URLs, e-mail addresses, #tags
+_IDENTIFIER_SEPARATOR = re.compile(r'[^\W_][_/\\@#]|[_/\\@#][^\W_]')
+# A dotted name ending in a 2-5 character extension or domain, e.g. main.py or example.com
+_DOTTED_NAME = re.compile(r'^[^\W_]{2,}(?:[.-][^\W_]+)*\.[^\W\d_][^\W_]{1,4}$')
+_LETTER_DIGIT = re.compile(r'(?<=[^\W\d_])(?=\d)|(?<=\d)(?=[^\W\d_])')
+_STOPWORDS = frozenset("""
+a about an and are as at be been by can could did do does for from had has have how i if in is it its me my of on or
+our she so than that the their them then there these they this to us was we were what when where which who why will
+with would you your s t d ll m re ve didn don doesn isn wasn weren won wouldn couldn
+""".split())
+
+def _is_code(term: str) -> bool:
+    """Whether an unquoted term looks like an identifier rather than a word.
+
+    Apostrophes and hyphens inside ordinary words ("what's", "e-mail") and plain word+number
+    tokens ("3pm", "mp3") do not count; hyphenated codes with digits ("INC-4521"), names with
+    identifier separators and tokens that switch between letters and digits more than once
+    ("ab12cd") do.
+    """
+    term = term.strip(".,;:!?()[]{}'")
+    if _IDENTIFIER_SEPARATOR.search(term) or _DOTTED_NAME.match(term):
+        return True
+    words = _WORD.findall(term)
+    if "-" in term and len(words) > 1 and any(ch.isdigit() for ch in term) and any(ch.isalpha() for ch in term):
+        return True
+    return any(len(_LETTER_DIGIT.findall(word)) >= 2 for word in words)
+
+def fts_query(text: str) -> Tuple[Optional[str], List[str]]:
+    """Turn a free-text question into an FTS5 MATCH expression.
+
+    Every term becomes a quoted phrase and the phrases are OR-ed, so BM25 does the ranking;
+    stopwords are left out unless the question has nothing else. Quoted phrases and terms
+    that look like identifiers (file names, URLs, snake_case, ticket codes) are also returned
+    as "exact" terms; they are what the lexical index is much better at than embeddings.
+
+    Returns:
+        (expression or None if the text has no searchable words, exact terms)
+    """
+    phrases, stop_phrases, exact = [], [], []
+    for term in _QUERY_TERM.findall(text):
+        words = _WORD.findall(term)
+        if not words:
+            continue
+        phrase = " ".join(words)
+        quoted = term.startswith('"')
+        if quoted or _is_code(term):
+            exact.append(phrase)
+        elif all(word.lower() in _STOPWORDS for word in words):
+            if phrase not in stop_phrases:
+                stop_phrases.append(phrase)
+            continue
+        if phrase not in phrases:
+            phrases.append(phrase)
+    phrases = phrases or stop_phrases
+    if not phrases:
+        return None, exact
+    return " OR ".join(f'"{phrase}"' for phrase in phrases), exact
+
+def contains_phrase(text: Optional[str], phrase: str) -> bool:
+    """Whether `text` has the words of `phrase` in a row, compared the way FTS5 tokenises (case-insensitive)."""
+    words = " ".join(_WORD.findall((text or "").lower()))
+    return f" {phrase.lower()} " in f" {words} "
+
+class HybridSearcher:
+    """Combines BM25 over the SQLite FTS5 index with the vector store search.
+
+    Both result lists are fused with reciprocal-rank fusion: a document scores
+    sum(1 / (rrf_k + rank)) over the lists it appears in. When the query contains exact
+    terms the lexical search runs first, and if its best hit contains one of them and beats
+    the runner-up's BM25 score by `confident_ratio` (or is the only hit) the answer is
+    returned without an embedding call. Otherwise both searches run concurrently.
+
+    With a SessionIndex the vector half is its two-stage session-then-frame search.
+    An ActivityFilter is pushed down into both searches. When no activity passes it, the
+    search returns nothing without embedding the query.
+    """
+
+    def __init__(self, data_manager: DataManager, vector_data_manager: VectorDataManager, rrf_k: int = 60,
+                 candidates: int = 20, confident_ratio: float = 1.5, session_index: Optional[SessionIndex] = None):
+        self.data_manager = data_manager
+        self.vector_data_manager = vector_data_manager
+        self.session_index = session_index
+        self.rrf_k = rrf_k
+        self.candidates = candidates
+        self.confident_ratio = confident_ratio
+        self.lexical_only = 0
+        self.hybrid = 0
+        self.filtered_out = 0
+
+    def _lexical(self, match: Optional[str], activity_filter: Optional[ActivityFilter] = None) -> List[Dict]:
+        if not match:
+            return []
+        rows = self.data_manager.lexical_search(match, self.candidates, activity_filter)
+        return [
+            {
+                "timestamp": row["timestamp"],
+                "analysis": row["analysis"],
+                "metadata": self.vector_data_manager.activity_metadata(row["created_at"], row["screenshot_path"],
+                                                                        json.loads(row["active_window"] or "null")),
+                "bm25": row["score"],
+            }
+            for row in rows
+        ]
+
+    def _vector(self, query: str, activity_filter: Optional[ActivityFilter]) -> List[Dict]:
+        if self.session_index is not None:
+            return self.session_index.search(query, activity_filter, self.candidates)
+        return self.vector_data_manager.search_activities_with_filters(query, activity_filter, self.candidates)
+
+    async def _avector(self, query: str, activity_filter: Optional[ActivityFilter]) -> List[Dict]:
+        if self.session_index is not None:
+            return await self.session_index.asearch(query, activity_filter, self.candidates)
+        return await self.vector_data_manager.asearch_activities_with_filters(query, activity_filter, self.candidates)
+
+    def _confident(self, lexical: List[Dict], exact: List[str]) -> bool:
+        if not exact or not lexical:
+            return False
+        # The best hit must contain one of the exact terms itself, not just score on other words
+        top = lexical[0]
+        title = json.loads(top["metadata"].get("active_window") or "null") or {}
+        if not any(contains_phrase(top["analysis"], phrase) or contains_phrase(title.get("title"), phrase) for phrase in exact):
+            return False
+        # bm25() is negative and lower is better
+        return len(lexical) == 1 or lexical[0]["bm25"] <= self.confident_ratio * lexical[1]["bm25"]
+
+    def _fuse(self, lexical: List[Dict], vector: List[Dict], n_results: int) -> List[Dict]:
+        fused: Dict[str, Dict] = {}
+        for source, documents in ((SOURCE_LEXICAL, lexical), (SOURCE_VECTOR, vector)):
+            for rank, document in enumerate(documents, start=1):
+                entry = fused.setdefault(document["timestamp"], {**document, "distance": None, "score": 0.0, "sources": []})
+                entry["score"] += 1 / (self.rrf_k + rank)
+                entry["sources"].append(source)
+                if "distance" in document:
+                    entry["distance"] = document["distance"]
+        return sorted(fused.values(), key=lambda document: document["score"], reverse=True)[:n_results]
+
+    def _lexical_answer(self, lexical: List[Dict], n_results: int) -> List[Dict]:
+        self.lexical_only += 1
+        return self._fuse(lexical, [], n_results)
+
+    def _excludes_everything(self, activity_filter: Optional[ActivityFilter]) -> bool:
+        if activity_filter is None or activity_filter.is_empty():
+            return False
+        if self.data_manager.has_matching_activities(activity_filter):
+            return False
+        self.filtered_out += 1
+        return True
+
+    def search(self, query: str, activity_filter: Optional[ActivityFilter] = None, n_results: int = 5) -> List[Dict]:
+        if self._excludes_everything(activity_filter):
+            return []
+        match, exact = fts_query(query)
+        lexical = self._lexical(match, activity_filter)
+        if self._confident(lexical, exact):
+            return self._lexical_answer(lexical, n_results)
+        self.hybrid += 1
+        vector = self._vector(query, activity_filter)
+        return self._fuse(lexical, vector, n_results)
+
+    async def asearch(self, query: str, activity_filter: Optional[ActivityFilter] = None, n_results: int = 5) -> List[Dict]:
+        if await run_blocking(self._excludes_everything, activity_filter):
+            return []
+        match, exact = fts_query(query)
+        if exact:
+            # Likely answerable lexically; only pay for the embedding if it is not
+            lexical = await run_blocking(self._lexical, match, activity_filter)
+            if self._confident(lexical, exact):
+                return self._lexical_answer(lexical, n_results)
+            vector = await self._avector(query, activity_filter)
+        else:
+            lexical, vector = await asyncio.gather(
+                run_blocking(self._lexical, match, activity_filter),
+                self._avector(query, activity_filter),
+            )
+        self.hybrid += 1
+        return self._fuse(lexical, vector, n_results)
+
+    def stats(self) -> Dict:
+        total = self.lexical_only + self.hybrid
+        return {
+            "lexical_only": self.lexical_only,
+            "hybrid": self.hybrid,
+            "filtered_out": self.filtered_out,
+            "lexical_only_rate": self.lexical_only / total if total else 0.0,
+        }
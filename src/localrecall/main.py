@@ -1,31 +1,60 @@
 import argparse
+import os
 import threading
 from .activity_tracker import ActivityTracker
 from .vision_processor import VisionProcessor
+from .processing_pipeline import ProcessingPipeline
+from .activity_notifier import ActivityNotifier, ActivityWaiter
+from .session_index import SessionIndex
 from .utils import load_env_variables
-import time
 import uvicorn
 from .chat_api import app as api_app
 
-def run_tracker(compress=False, compress_quality=85, resize_factor=1.0):
-    tracker = ActivityTracker(compress=compress, compress_quality=compress_quality, resize_factor=resize_factor)
+def run_tracker(compress=False, compress_quality=85, resize_factor=1.0, dedup=True, dedup_threshold=5, dedup_history=8,
+                notifier=None, interval=30, min_interval=2, max_interval=300, idle_threshold=60, codec=None, webp_preset="fast",
+                encoder_workers=2, per_monitor=False, tile_size=256):
+    tracker = ActivityTracker(interval=interval, compress=compress, compress_quality=compress_quality, resize_factor=resize_factor,
+                              dedup=dedup, dedup_threshold=dedup_threshold, dedup_history=dedup_history, notifier=notifier,
+                              min_interval=min_interval, max_interval=max_interval, idle_threshold=idle_threshold,
+                              codec=codec, webp_preset=webp_preset, encoder_workers=encoder_workers,
+                              per_monitor=per_monitor, tile_size=tile_size)
     print("Starting activity tracking...")
     tracker.run()
 
-def run_processor(strategy="google"):
-    processor = VisionProcessor(strategy)
+def run_processor(strategy="google", worker_id=None, batch_size=8, lease_seconds=300, max_attempts=5, pipeline_options=None,
+                  notifier=None, max_idle=30, sessions=True, session_gap=300):
+    processor = VisionProcessor(strategy, worker_id=worker_id, batch_size=batch_size,
+                                lease_seconds=lease_seconds, max_attempts=max_attempts)
+    waiter = ActivityWaiter(processor.data_manager, notifier, max_idle=max_idle)
+    session_index = SessionIndex(processor.data_manager, processor.vector_data_manager, max_gap=session_gap) if sessions else None
+    if pipeline_options is not None:
+        processor = ProcessingPipeline(processor, **pipeline_options)
     print("Processing unprocessed activities...")
     try:
         while True:
-            processor.process_unprocessed_activities()
-            if strategy == "local":
-                continue
-            time.sleep(10)
+            waiter.mark()
+            # Keep going while there is work; sleep until the tracker stores something new otherwise
+            if not processor.process_unprocessed_activities():
+                if session_index is not None:
+                    update_sessions(session_index)
+                waiter.wait()
     except Exception as e:
         print(f"Error: {str(e)}")
+    finally:
+        if pipeline_options is not None:
+            processor.shutdown()
     print("Processing complete.")
 
-def run_api_server(host="0.0.0.0", port=11011):
+def update_sessions(session_index):
+    """Index sessions while the processor is idle; a failure here must not stop processing."""
+    try:
+        session_index.update()
+    except Exception as e:
+        print(f"Warning: could not update the session index: {str(e)}")
+
+def run_api_server(host="127.0.0.1", port=11011):
+    if host not in ("127.0.0.1", "localhost", "::1") and not os.environ.get("API_TOKEN"):
+        print(f"Warning: the API serves decrypted screenshots on {host} without API_TOKEN; anyone who can reach it can read them")
     uvicorn.run(api_app, host=host, port=port)
 
 def main():
@@ -34,29 +63,88 @@ def main():
     parser.add_argument("--process", action="store_true", help="Run image processing")
     parser.add_argument("--api", action="store_true", help="Run API server")
     parser.add_argument("--compress", action="store_true", help="Compress screenshots")
-    parser.add_argument("--compress-quality", type=int, default=85, choices=range(1, 101), metavar="[1-100]", help="Compression quality (default: 85)")
+    parser.add_argument("--compress-quality", type=int, default=85, choices=range(1, 101), metavar="[1-100]", help="JPEG/WebP quality (default: 85)")
     parser.add_argument("--resize-factor", type=float, default=1.0, choices=[i/10 for i in range(1, 11)], metavar="[0.1-1.0]", help="Resize factor (default: 1.0)")
+    parser.add_argument("--codec", choices=["png", "jpeg", "webp"], default=None, help="Screenshot codec (default: jpeg with --compress, png otherwise)")
+    parser.add_argument("--webp-preset", choices=["fast", "balanced", "small"], default="fast", help="WebP speed/size trade-off (default: fast)")
+    parser.add_argument("--encoder-workers", type=int, default=2, help="Background threads encoding screenshots (default: 2)")
+    parser.add_argument("--per-monitor", action="store_true", help="Capture each monitor separately and store only the regions that changed")
+    parser.add_argument("--tile-size", type=int, default=256, help="Grid size in pixels that changed regions are snapped to with --per-monitor (default: 256)")
+    parser.add_argument("--no-dedup", action="store_true", help="Store every frame even when the screen has not changed")
+    parser.add_argument("--dedup-threshold", type=int, default=5, help="Max hash bit difference for a frame to count as a duplicate (default: 5)")
+    parser.add_argument("--dedup-history", type=int, default=8, help="Number of recent frames compared against (default: 8)")
+    parser.add_argument("--interval", type=float, default=30, help="Seconds between captures while the user is active (default: 30)")
+    parser.add_argument("--min-interval", type=float, default=2, help="Minimum seconds between captures, even on window switches; at least 1 (default: 2)")
+    parser.add_argument("--max-interval", type=float, default=300, help="Maximum seconds between captures, even when idle (default: 300)")
+    parser.add_argument("--idle-threshold", type=float, default=60, help="Seconds without input before captures back off (default: 60)")
     parser.add_argument("--vision-strategy", choices=["google", "local"], default="google", help="Vision processing strategy (default: google)")
-    parser.add_argument("--api-host", type=str, default="0.0.0.0", help="API server host (default: 0.0.0.0)")
+    parser.add_argument("--worker-id", type=str, default=None, help="Processor worker id used for leases (default: host-pid-random)")
+    parser.add_argument("--batch-size", type=int, default=8, help="Activities claimed per processing batch (default: 8)")
+    parser.add_argument("--lease-seconds", type=int, default=300, help="Lease duration for claimed activities (default: 300)")
+    parser.add_argument("--max-attempts", type=int, default=5, help="Failures before an activity is dead-lettered (default: 5)")
+    parser.add_argument("--pipeline", action="store_true", help="Process several activities concurrently with per-stage worker pools")
+    parser.add_argument("--decrypt-workers", type=int, default=2, help="Concurrent screenshot decryptions with --pipeline (default: 2)")
+    parser.add_argument("--vision-workers", type=int, default=4, help="Concurrent vision requests with --pipeline (default: 4)")
+    parser.add_argument("--embed-workers", type=int, default=4, help="Concurrent embedding requests with --pipeline (default: 4)")
+    parser.add_argument("--embed-batch-size", type=int, default=16, help="Max captions per embedding request with --pipeline (default: 16)")
+    parser.add_argument("--store-workers", type=int, default=1, help="Concurrent DB/vector writers with --pipeline (default: 1)")
+    parser.add_argument("--max-in-flight", type=int, default=16, help="Max activities in progress with --pipeline (default: 16)")
+    parser.add_argument("--max-idle", type=float, default=30, help="Max seconds an idle processor sleeps before re-checking for retries (default: 30)")
+    parser.add_argument("--no-sessions", action="store_true", help="Do not group processed activities into searchable sessions")
+    parser.add_argument("--session-gap", type=float, default=300, help="Max seconds between activities of one session (default: 300)")
+    parser.add_argument("--api-host", type=str, default="127.0.0.1", help="API server host; set API_TOKEN before exposing it (default: 127.0.0.1)")
     parser.add_argument("--api-port", type=int, default=11011, help="API server port (default: 11011)")
 
     args = parser.parse_args()
+    if args.min_interval < 1:
+        parser.error("--min-interval must be at least 1 second")
 
     load_env_variables()
 
     threads = []
+    # When tracking and processing in one process, new frames wake the processor directly
+    notifier = ActivityNotifier() if args.track and args.process else None
 
     if args.track:
         tracker_thread = threading.Thread(target=run_tracker, kwargs={
             "compress": args.compress,
             "compress_quality": args.compress_quality,
-            "resize_factor": args.resize_factor
+            "resize_factor": args.resize_factor,
+            "dedup": not args.no_dedup,
+            "dedup_threshold": args.dedup_threshold,
+            "dedup_history": args.dedup_history,
+            "notifier": notifier,
+            "interval": args.interval,
+            "min_interval": args.min_interval,
+            "max_interval": args.max_interval,
+            "idle_threshold": args.idle_threshold,
+            "codec": args.codec,
+            "webp_preset": args.webp_preset,
+            "encoder_workers": args.encoder_workers,
+            "per_monitor": args.per_monitor,
+            "tile_size": args.tile_size
         })
         threads.append(tracker_thread)
 
     if args.process:
         processor_thread = threading.Thread(target=run_processor, kwargs={
-            "strategy": args.vision_strategy
+            "strategy": args.vision_strategy,
+            "worker_id": args.worker_id,
+            "batch_size": args.batch_size,
+            "lease_seconds": args.lease_seconds,
+            "max_attempts": args.max_attempts,
+            "pipeline_options": {
+                "decrypt_workers": args.decrypt_workers,
+                "vision_workers": args.vision_workers,
+                "embed_workers": args.embed_workers,
+                "embed_batch_size": args.embed_batch_size,
+                "store_workers": args.store_workers,
+                "max_in_flight": args.max_in_flight
+            } if args.pipeline else None,
+            "notifier": notifier,
+            "max_idle": args.max_idle,
+            "sessions": not args.no_sessions,
+            "session_gap": args.session_gap
         })
         threads.append(processor_thread)
 
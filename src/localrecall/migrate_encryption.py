@@ -0,0 +1,43 @@
+import argparse
+import os
+from .encryption_manager import EncryptionManager, DEFAULT_CHUNK_SIZE
+
+def migrate_directory(directory, encryption_manager=None, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False):
+    """Rewrite every legacy Fernet `.encrypted` file under `directory` in the chunked container format."""
+    encryption_manager = encryption_manager or EncryptionManager()
+    counts = {"migrated": 0, "skipped": 0, "failed": 0, "bytes_before": 0, "bytes_after": 0}
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if not name.endswith('.encrypted'):
+                continue
+            path = os.path.join(root, name)
+            try:
+                if encryption_manager.is_container(path):
+                    counts["skipped"] += 1
+                    continue
+                size_before = os.path.getsize(path)
+                if not dry_run:
+                    encryption_manager.migrate_file(path, chunk_size)
+                    counts["bytes_after"] += os.path.getsize(path)
+                counts["bytes_before"] += size_before
+                counts["migrated"] += 1
+            except Exception as e:
+                counts["failed"] += 1
+                print(f"Error migrating {path}: {str(e)}")
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate Fernet-encrypted screenshots to the chunked container format")
+    parser.add_argument("directory", nargs="?", default=os.path.join(os.getcwd(), 'screenshots'),
+                        help="Directory to migrate (default: ./screenshots)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Plaintext bytes per chunk (default: 65536)")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the files that would be migrated")
+    args = parser.parse_args()
+
+    counts = migrate_directory(args.directory, chunk_size=args.chunk_size, dry_run=args.dry_run)
+    print(f"Migrated: {counts['migrated']}, already migrated: {counts['skipped']}, failed: {counts['failed']}")
+    if counts["bytes_after"]:
+        print(f"Size: {counts['bytes_before'] / 1e6:.1f} MB -> {counts['bytes_after'] / 1e6:.1f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import functools
+import io
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict
+from PIL import Image
+from .encryption_manager import EncryptionManager
+from .frame_encoder import write_thumbnail
+from .utils import thumbnail_path
+
+class PreviewLoader:
+    """Decrypts screenshots and their thumbnails in memory, for chat responses and UI previews.
+
+    Thumbnails are what previews should use; the full image is only decrypted when asked for.
+    Captures from before thumbnails existed get one the first time they are previewed. The
+    last `max_cached` decrypted thumbnails stay in memory, so a thumbnail prepared while the
+    answer streams is served without decrypting it again.
+    """
+
+    def __init__(self, encryption_manager: EncryptionManager, max_cached: int = 64):
+        self.encryption_manager = encryption_manager
+        self.max_cached = max_cached
+        self._cache: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._path_locks: Dict[str, threading.Lock] = {}
+
+    def _path_lock(self, path: str) -> threading.Lock:
+        with self._lock:
+            return self._path_locks.setdefault(path, threading.Lock())
+
+    def _decrypt_thumbnail(self, screenshot_path: str) -> bytes:
+        path = thumbnail_path(screenshot_path)
+        if os.path.exists(path):
+            return self.encryption_manager.decrypt_to_bytes(path)
+        # One backfill per thumbnail; concurrent requests wait for it instead of reading a partial file
+        with self._path_lock(path):
+            if not os.path.exists(path):
+                with Image.open(io.BytesIO(self.encryption_manager.decrypt_to_bytes(screenshot_path))) as image:
+                    image.load()
+                    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.thumbnail')
+                    os.close(fd)
+                    try:
+                        write_thumbnail(self.encryption_manager, image.convert("RGB"), temp_path)
+                        os.replace(temp_path, path)
+                    except Exception:
+                        if os.path.exists(temp_path):
+                            os.remove(temp_path)
+                        raise
+            with self._lock:
+                self._path_locks.pop(path, None)
+        return self.encryption_manager.decrypt_to_bytes(path)
+
+    def thumbnail(self, screenshot_path: str) -> bytes:
+        with self._lock:
+            data = self._cache.get(screenshot_path)
+            if data is not None:
+                self._cache.move_to_end(screenshot_path)
+                return data
+        data = self._decrypt_thumbnail(screenshot_path)
+        with self._lock:
+            self._cache[screenshot_path] = data
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+        return data
+
+    def full(self, screenshot_path: str) -> bytes:
+        return self.encryption_manager.decrypt_to_bytes(screenshot_path)
+
+@functools.lru_cache(maxsize=1)
+def shared_preview_loader() -> PreviewLoader:
+    """The process-wide PreviewLoader; key derivation is slow, so it is built once on first use."""
+    return PreviewLoader(EncryptionManager())
@@ -0,0 +1,138 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from .vision_processor import VisionProcessor
+
+class ProcessingPipeline:
+    """Runs decrypt -> vision -> embed -> store for several activities at once.
+
+    Every stage has its own worker pool, so the vision service and the embedding service
+    each see at most their configured number of parallel requests. At most `max_in_flight`
+    activities are leased and in progress at any time; the claim loop blocks when the
+    pipeline is full. The stages of one activity always run in order, so its DB row is
+    updated before its vector is stored and before its lease is completed. While it waits,
+    the claim loop renews the leases of the activities in flight every third of the lease,
+    so a slow vision or embedding service does not let another worker claim them.
+
+    Captions waiting for the embed stage are embedded together, up to `embed_batch_size` per
+    `create_embeddings` call, so a busy embedding service gets batches rather than one request
+    per frame.
+    """
+
+    def __init__(self, processor: VisionProcessor, decrypt_workers=2, vision_workers=4, embed_workers=4,
+                 store_workers=1, max_in_flight=16, embed_batch_size=16):
+        self.processor = processor
+        self.data_manager = processor.data_manager
+        self.stages = {
+            "decrypt": ThreadPoolExecutor(max_workers=decrypt_workers, thread_name_prefix="decrypt"),
+            "vision": ThreadPoolExecutor(max_workers=vision_workers, thread_name_prefix="vision"),
+            "embed": ThreadPoolExecutor(max_workers=embed_workers, thread_name_prefix="embed"),
+            "store": ThreadPoolExecutor(max_workers=store_workers, thread_name_prefix="store"),
+        }
+        # Drives each activity through the stages; sized so a driver never waits for another
+        self.drivers = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="pipeline")
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.in_flight = set()
+        self.in_flight_lock = threading.Lock()
+        self.renew_interval = max(1.0, processor.lease_seconds / 3)
+        self.renewed_at = time.monotonic()
+        self.embed_batch_size = embed_batch_size
+        self.embed_queue = []
+        self.embed_lock = threading.Lock()
+
+    def _run_stage(self, name, fn, *args):
+        return self.stages[name].submit(fn, *args).result()
+
+    def _embed(self, analysis):
+        """Queue `analysis` for the next embedding batch and wait for its vector."""
+        future = Future()
+        with self.embed_lock:
+            self.embed_queue.append((analysis, future))
+        self.stages["embed"].submit(self._embed_batch)
+        return future.result()
+
+    def _embed_batch(self):
+        """Embed the queued captions, up to `embed_batch_size` of them, in one call."""
+        with self.embed_lock:
+            batch = self.embed_queue[:self.embed_batch_size]
+            del self.embed_queue[:self.embed_batch_size]
+        if not batch:
+            # An earlier task already took this caption
+            return
+        try:
+            embeddings = self.processor.embedding_strategy.create_embeddings([analysis for analysis, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), embedding in zip(batch, embeddings):
+            future.set_result(embedding)
+
+    def _process(self, activity):
+        processor = self.processor
+        timestamp = activity['timestamp']
+        try:
+            image = self._run_stage("decrypt", processor.decrypt_screenshot, activity)
+            analysis = self._run_stage("vision", processor.caption_activity, activity, image)
+            embedding = self._embed(analysis)
+            self._run_stage("store", processor.store_activity, activity, analysis, embedding)
+            return self.data_manager.complete_activity(timestamp, processor.worker_id)
+        except Exception as e:
+            processor.fail_activity(activity, e)
+            return False
+        finally:
+            with self.in_flight_lock:
+                self.in_flight.discard(timestamp)
+            self.slots.release()
+
+    def _renew_leases(self):
+        """Extend the leases of in-flight activities once per `renew_interval`."""
+        if time.monotonic() - self.renewed_at < self.renew_interval:
+            return
+        self.renewed_at = time.monotonic()
+        with self.in_flight_lock:
+            timestamps = list(self.in_flight)
+        try:
+            self.data_manager.renew_lease(timestamps, self.processor.worker_id, self.processor.lease_seconds)
+        except Exception as e:
+            print(f"Warning: could not renew leases: {str(e)}")
+
+    def _acquire_slots(self, wanted):
+        """Block until one slot is free, then take up to `wanted` slots without blocking."""
+        while not self.slots.acquire(timeout=self.renew_interval):
+            self._renew_leases()
+        self._renew_leases()
+        acquired = 1
+        while acquired < wanted and self.slots.acquire(blocking=False):
+            acquired += 1
+        return acquired
+
+    def process_unprocessed_activities(self):
+        """Claim and process pending activities until none are claimable. Returns the number processed."""
+        processor = self.processor
+        processed = 0
+        futures = []
+        while True:
+            slots = self._acquire_slots(processor.batch_size)
+            activities = self.data_manager.claim_activities(processor.worker_id, slots, processor.lease_seconds,
+                                                         processor.max_attempts)
+            for _ in range(slots - len(activities)):
+                self.slots.release()
+            if not activities:
+                break
+            with self.in_flight_lock:
+                self.in_flight.update(activity['timestamp'] for activity in activities)
+            futures.extend(self.drivers.submit(self._process, activity) for activity in activities)
+
+            done = [future for future in futures if future.done()]
+            processed += sum(1 for future in done if future.result())
+            futures = [future for future in futures if future not in done]
+
+        while wait(futures, timeout=self.renew_interval).not_done:
+            self._renew_leases()
+        return processed + sum(1 for future in futures if future.result())
+
+    def shutdown(self):
+        self.drivers.shutdown(wait=True)
+        for executor in self.stages.values():
+            executor.shutdown(wait=True)
@@ -1,13 +1,13 @@
 import mss
-import mss.tools
 from datetime import datetime
 import os
-from PIL import Image
+from concurrent.futures import Future
 from .utils import ensure_dir
 from .encryption_manager import EncryptionManager
+from .frame_encoder import FrameEncoder, make_codec
 
 class ScreenshotCapture:
-    def __init__(self, compress=False, compress_quality=85, resize_factor=1.0):
+    def __init__(self, compress=False, compress_quality=85, resize_factor=1.0, codec=None, webp_preset="fast", encoder_workers=2):
         self.sct = mss.mss()
         self.ss_dir = os.path.join(os.getcwd(), 'screenshots')
         ensure_dir(self.ss_dir)
@@ -15,32 +15,48 @@ class ScreenshotCapture:
         self.compress_quality = compress_quality
         self.resize_factor = resize_factor
         self.encryption_manager = EncryptionManager()
+        # --compress without an explicit codec keeps the old JPEG behaviour
+        codec_name = codec or ("jpeg" if compress else "png")
+        self.codec = make_codec(codec_name, quality=compress_quality, preset=webp_preset)
+        self.encoder = FrameEncoder(self.encryption_manager, self.codec, resize_factor=resize_factor, workers=encoder_workers)
+        # Paths handed out during the current second
+        self._issued_second, self._issued_paths = None, set()
+
+    def grab(self):
+        return self.sct.grab(self.sct.monitors[0])
+
+    def grab_monitors(self):
+        """Grab each physical monitor separately. Returns (monitor number, screenshot) pairs, numbered from 1 like mss."""
+        return [(index, self.sct.grab(monitor)) for index, monitor in enumerate(self.sct.monitors[1:], start=1)]
 
     def capture(self):
-        screenshot = self.sct.grab(self.sct.monitors[0])
+        return self.save(self.grab())
+
+    def new_path(self, monitor=None):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        if self.compress:
-            filename = f"screenshot_{timestamp}.jpg"
-            filepath = os.path.join(self.ss_dir, filename)
-            img = Image.frombytes("RGB", screenshot.size, screenshot.rgb)
-            
-            if self.resize_factor != 1.0:
-                new_size = tuple(int(dim * self.resize_factor) for dim in img.size)
-                img = img.resize(new_size, Image.LANCZOS)
-            
-            img.save(filepath, format='JPEG', quality=self.compress_quality, optimize=True)
-        else:
-            filename = f"screenshot_{timestamp}.png"
-            filepath = os.path.join(self.ss_dir, filename)
-            mss.tools.to_png(screenshot.rgb, screenshot.size, output=filepath)
-
-        # Encrypt the screenshot file
-        self.encryption_manager.encrypt_file(filepath)
-        encrypted_filepath = filepath + '.encrypted'
-
-        # Remove the original unencrypted file
-        if os.path.exists(filepath):
-            os.remove(filepath)
-
-        return encrypted_filepath
\ No newline at end of file
+        suffix = f"_m{monitor}" if monitor is not None else ""
+        # Names have one-second resolution; a second capture in the same second gets a counter. Paths
+        # issued earlier in this second count as taken even before the encoder has written them.
+        path, counter = None, 1
+        while path is None or path in self._issued_paths or os.path.exists(path):
+            name = f"screenshot_{timestamp}{suffix}" + (f"_{counter}" if counter > 1 else "")
+            path = os.path.join(self.ss_dir, f"{name}.{self.codec.extension}.encrypted")
+            counter += 1
+        if timestamp != self._issued_second:
+            self._issued_second, self._issued_paths = timestamp, set()
+        self._issued_paths.add(path)
+        return path
+
+    def save(self, screenshot, encrypted_filepath=None):
+        """Encode and encrypt the screenshot on the calling thread. Returns the encrypted file path."""
+        return self.encoder.encode(screenshot, encrypted_filepath or self.new_path())
+
+    def save_async(self, screenshot, encrypted_filepath=None) -> Future:
+        """Encode and encrypt the screenshot on the encoder pool. The future resolves to the encrypted file path."""
+        return self.encoder.submit(screenshot, encrypted_filepath or self.new_path())
+
+    def stats(self):
+        return self.encoder.stats()
+
+    def close(self):
+        self.encoder.shutdown()
@@ -0,0 +1,137 @@
+import re
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Union
+from .data_manager import DataManager, VectorDataManager
+from .filters import ActivityFilter
+from .utils import run_blocking
+
+_TITLE_LINE = re.compile(r"^Current Activity Title:[^\n]*\n?")
+_SPACE = re.compile(r"\s+")
+
+class SessionIndex:
+    """Hierarchical index over activities: sessions first, then the frames inside them.
+
+    `update` (run by the processor when it is idle) groups consecutive processed activities in one
+    application into sessions and embeds an extractive summary of each. `search` finds the closest
+    sessions, then runs the frame-level query only inside them, plus over frames newer than the last
+    indexed session, and keeps at most `per_session` frames per session so the answer is not five
+    adjacent captures of the same thing. Newer frames are capped the same way, grouped by application
+    and `max_gap`. Without any indexed session it is a plain frame search.
+    """
+
+    def __init__(self, data_manager: DataManager, vector_data_manager: VectorDataManager, max_gap: float = 300,
+                 max_duration: float = 3600, sessions_per_query: int = 5, per_session: int = 2,
+                 max_captions: int = 8, max_summary_chars: int = 2000):
+        self.data_manager = data_manager
+        self.vector_data_manager = vector_data_manager
+        self.max_gap = max_gap
+        self.max_duration = max_duration
+        self.sessions_per_query = sessions_per_query
+        self.per_session = per_session
+        self.max_captions = max_captions
+        self.max_summary_chars = max_summary_chars
+        self.session_queries = 0
+        self.frame_queries = 0
+
+    def summarize(self, session: Dict, activities: List[Dict]) -> str:
+        """Extractive summary: application, time span, distinct window titles and a spread of distinct captions."""
+        start = datetime.fromtimestamp(session["start_ts"])
+        end = datetime.fromtimestamp(session["end_ts"])
+        lines = [f"{session['process_name'] or 'Unknown application'} session, {start:%Y-%m-%d %H:%M} to {end:%H:%M}, "
+                 f"{len(activities)} captures"]
+        titles = list(dict.fromkeys(activity["title"] for activity in activities if activity["title"]))
+        if titles:
+            lines.append("Windows: " + "; ".join(titles[:10]))
+
+        captions, seen = [], set()
+        for activity in activities:
+            caption = _SPACE.sub(" ", _TITLE_LINE.sub("", activity["analysis"] or "")).strip()
+            if caption and caption.lower() not in seen:
+                seen.add(caption.lower())
+                captions.append(caption)
+        if len(captions) > self.max_captions:
+            step = len(captions) / self.max_captions
+            captions = [captions[int(index * step)] for index in range(self.max_captions)]
+        lines.extend(f"- {caption}" for caption in captions)
+        return "\n".join(lines)[:self.max_summary_chars]
+
+    def update(self, batch_size: int = 64) -> int:
+        """Assign new activities to sessions and (re-)embed sessions whose summary is stale. Returns how many were embedded."""
+        self.data_manager.assign_sessions(self.max_gap, self.max_duration)
+        embedded = 0
+        while True:
+            sessions = self.data_manager.get_stale_sessions(batch_size)
+            if not sessions:
+                return embedded
+            for session in sessions:
+                session["summary"] = self.summarize(session, self.data_manager.get_session_activities(session["id"]))
+            embeddings = self.vector_data_manager.embedding_strategy.create_embeddings([session["summary"] for session in sessions])
+            self.vector_data_manager.add_sessions(sessions, embeddings)
+            for session in sessions:
+                # A session that grew meanwhile stays stale and is embedded again on the next pass
+                if self.data_manager.mark_session_embedded(session["id"], session["version"], session["summary"]):
+                    embedded += 1
+            if len(sessions) < batch_size:
+                return embedded
+
+    def _session_of(self, frame: Dict, sessions: List[Dict]) -> Optional[int]:
+        metadata = frame["metadata"]
+        for session in sessions:
+            if (session["start_ts"] <= metadata["created_at"] <= session["end_ts"]
+                    and session["process_name"] == metadata.get("process_name", "")):
+                return session["id"]
+        return None
+
+    def _pending_groups(self, frames: List[Dict]) -> Dict[int, Tuple[str, float]]:
+        """Stand-in session keys, by id(frame), for frames outside the retrieved sessions.
+
+        Frames of one application less than `max_gap` seconds apart share a key, roughly as
+        `assign_sessions` will group them once they are indexed.
+        """
+        keys, open_groups = {}, {}
+        for frame in sorted(frames, key=lambda frame: frame["metadata"]["created_at"]):
+            process_name = frame["metadata"].get("process_name", "")
+            created_at = frame["metadata"]["created_at"]
+            key, last_seen = open_groups.get(process_name, (None, None))
+            if key is None or created_at - last_seen > self.max_gap:
+                key = (process_name, created_at)
+            open_groups[process_name] = (key, created_at)
+            keys[id(frame)] = key
+        return keys
+
+    def _limit_per_session(self, frames: List[Dict], sessions: List[Dict], n_results: int) -> List[Dict]:
+        for frame in frames:
+            frame["session_id"] = self._session_of(frame, sessions)
+        pending = self._pending_groups([frame for frame in frames if frame["session_id"] is None])
+        counts: Dict[Union[int, Tuple[str, float]], int] = {}
+        kept = []
+        for frame in frames:
+            key = frame["session_id"] if frame["session_id"] is not None else pending[id(frame)]
+            if counts.get(key, 0) < self.per_session:
+                counts[key] = counts.get(key, 0) + 1
+                kept.append(frame)
+        return kept[:n_results]
+
+    def query(self, query_embedding: List[float], activity_filter: Optional[ActivityFilter] = None,
+              n_results: int = 5) -> List[Dict]:
+        horizon = self.data_manager.session_horizon()
+        if horizon is None:
+            self.frame_queries += 1
+            return self.vector_data_manager.query_by_embedding(query_embedding, activity_filter, n_results)
+        self.session_queries += 1
+        sessions = self.vector_data_manager.query_sessions(query_embedding, activity_filter, self.sessions_per_query)
+        # Over-fetch so the per-session cap still leaves n_results frames
+        frames = self.vector_data_manager.query_within_sessions(query_embedding, sessions, horizon, activity_filter,
+                                                                n_results * self.per_session)
+        return self._limit_per_session(frames, sessions, n_results)
+
+    def search(self, query: str, activity_filter: Optional[ActivityFilter] = None, n_results: int = 5) -> List[Dict]:
+        query_embedding = self.vector_data_manager.embedding_strategy.create_embedding(query)
+        return self.query(query_embedding, activity_filter, n_results)
+
+    async def asearch(self, query: str, activity_filter: Optional[ActivityFilter] = None, n_results: int = 5) -> List[Dict]:
+        query_embedding = await self.vector_data_manager.embedding_strategy.acreate_embedding(query)
+        return await run_blocking(self.query, query_embedding, activity_filter, n_results)
+
+    def stats(self) -> Dict:
+        return {"session_queries": self.session_queries, "frame_queries": self.frame_queries}
@@ -1,15 +1,45 @@
 import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+# Bounded pool for blocking work (vector queries, file decryption, SQLite) started from async code,
+# so a burst of chat requests cannot spawn unbounded threads or starve the event loop.
+BLOCKING_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.environ.get('BLOCKING_IO_WORKERS', '8')), thread_name_prefix="blocking-io")
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run a blocking call on BLOCKING_EXECUTOR without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(BLOCKING_EXECUTOR, functools.partial(fn, *args, **kwargs))
+
+def detect_image_mime(data, default="image/jpeg"):
+    """Guess an image's MIME type from its leading bytes."""
+    header = bytes(data[:12])
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if header.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    return default
+
+def thumbnail_path(screenshot_path):
+    """Encrypted thumbnail stored next to a screenshot: screenshot_X.png.encrypted -> screenshot_X.thumb.webp.encrypted."""
+    base = screenshot_path[:-len(".encrypted")] if screenshot_path.endswith(".encrypted") else screenshot_path
+    return os.path.splitext(base)[0] + ".thumb.webp.encrypted"
+
 def ensure_dir(directory):
     if not os.path.exists(directory):
         os.makedirs(directory, exist_ok=True)
 
-def load_env_variables():
+def load_env_variables(override=False):
     """Load environment variables from .env file in the root directory."""
     root_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     dotenv_path = os.path.join(root_dir, '.env')
-    load_dotenv(dotenv_path)
+    load_dotenv(dotenv_path, override=override)
 
     # Set GEMINI_API_KEY as an environment variable
     gemini_api_key = os.getenv('GEMINI_API_KEY')
@@ -0,0 +1,559 @@
+import functools
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+
+# Rows scored per matrix product; bounds the memory a scan touches at once
+_CHUNK_ROWS = 32768
+
+class VectorStore(ABC):
+    """A named collection of embeddings with their documents and metadata, searched by cosine distance.
+
+    Filters use Chroma's `where` / `where_document` syntax (see ActivityFilter), whatever the backend.
+    """
+
+    @abstractmethod
+    def count(self) -> int:
+        pass
+
+    @abstractmethod
+    def upsert(self, ids: List[str], embeddings: List[List[float]], metadatas: List[Dict], documents: List[str]):
+        pass
+
+    @abstractmethod
+    def query(self, embedding: List[float], n_results: int = 5, where: Optional[Dict] = None,
+              where_document: Optional[Dict] = None) -> List[Dict]:
+        """Nearest items, closest first, as dicts with id, document, metadata and distance."""
+        pass
+
+    @abstractmethod
+    def get(self, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+        """Stored items in insertion order, as dicts with id, document and metadata."""
+        pass
+
+    @abstractmethod
+    def update_metadata(self, ids: List[str], metadatas: List[Dict]):
+        pass
+
+class ChromaVectorStore(VectorStore):
+    def __init__(self, path: str, name: str):
+        # Imported here so the NumPy backend does not pay for loading Chroma
+        import chromadb
+        self.client = chromadb.PersistentClient(path=path)
+        self.collection = self.client.get_or_create_collection(name=name, metadata={"hnsw:space": "cosine"})
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def upsert(self, ids, embeddings, metadatas, documents):
+        self.collection.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+
+    def query(self, embedding, n_results=5, where=None, where_document=None):
+        results = self.collection.query(
+            query_embeddings=[embedding],
+            n_results=n_results,
+            where=where,
+            where_document=where_document,
+        )
+        return [
+            {"id": id_, "document": document, "metadata": metadata, "distance": distance}
+            for id_, document, metadata, distance in zip(results['ids'][0], results['documents'][0],
+                                                         results['metadatas'][0], results['distances'][0])
+        ]
+
+    def get(self, limit=None, offset=0):
+        results = self.collection.get(include=["documents", "metadatas"], limit=limit, offset=offset or None)
+        return [
+            {"id": id_, "document": document, "metadata": metadata}
+            for id_, document, metadata in zip(results['ids'], results['documents'], results['metadatas'])
+        ]
+
+    def update_metadata(self, ids, metadatas):
+        self.collection.update(ids=ids, metadatas=metadatas)
+
+class _Column:
+    """A growable NumPy array; string values are stored as integer codes."""
+
+    def __init__(self, kind: type):
+        self.kind = kind
+        self.data = np.empty(1024, dtype=np.float64 if kind is float else np.int32)
+        self.codes: Dict[str, int] = {}
+
+    def encode(self, values: Sequence) -> np.ndarray:
+        if self.kind is float:
+            return np.array([np.nan if value is None else float(value) for value in values], dtype=np.float64)
+        return np.array([-1 if value is None else self.codes.setdefault(str(value), len(self.codes)) for value in values],
+                        dtype=np.int32)
+
+    def code(self, value) -> int:
+        return self.codes.get(str(value), -2)
+
+    def put(self, start: int, values: Sequence):
+        encoded = self.encode(values)
+        if start + len(encoded) > len(self.data):
+            grown = np.empty(max(2 * len(self.data), start + len(encoded)), dtype=self.data.dtype)
+            grown[:start] = self.data[:start]
+            self.data = grown
+        self.data[start:start + len(encoded)] = encoded
+
+    def set(self, rows: np.ndarray, values: Sequence):
+        self.data[rows] = self.encode(values)
+
+class NumpyVectorStore(VectorStore):
+    """Embeddings in an append-only memory-mapped matrix, with documents and metadata in an SQLite side table.
+
+    Vectors are normalised on insert and stored as float32 or float16 rows of `<name>.vectors`;
+    row i of the matrix is row i of the `items` table in `<name>.sqlite3`. The metadata `fields`
+    that filters use are also kept in memory as columns, so `where` clauses are evaluated with
+    NumPy and search is an exact cosine scan over the rows that pass. Captures are stored in
+    `time_field` order, so a time range first narrows the scan to a slice found by binary search.
+
+    Once a scan would cover at least `ivf_min_rows` rows, a coarse (IVF) index is trained: about
+    sqrt(n) k-means clusters, of which only the `nprobe` nearest to the query are scanned, so
+    search becomes approximate. It is retrained when the store has doubled and saved next to the
+    vectors. `ivf_min_rows=0` disables it and keeps every search exact.
+
+    Writes from several processes are serialised by SQLite's write lock. Rows appended by other
+    processes are picked up before each query; metadata they update in place is only seen after
+    reopening the store.
+    """
+
+    def __init__(self, path: str, name: str, fields: Dict[str, type], time_field: str, dtype: str = "float32",
+                 ivf_min_rows: int = 200_000, nprobe: int = 32):
+        if time_field not in fields:
+            raise ValueError(f"time_field '{time_field}' must be one of the fields")
+        os.makedirs(path, exist_ok=True)
+        self.name = name
+        self.fields = dict(fields)
+        self.time_field = time_field
+        self.ivf_min_rows = ivf_min_rows
+        self.nprobe = nprobe
+        self.db_path = os.path.join(path, f"{name}.sqlite3")
+        self.vectors_path = os.path.join(path, f"{name}.vectors")
+        self.ivf_path = os.path.join(path, f"{name}.ivf.npz")
+        self._local = threading.local()
+        self._lock = threading.RLock()
+
+        self._count = 0
+        self._columns = {field: _Column(kind) for field, kind in self.fields.items()}
+        self._vectors = None
+        self._sorted = True
+        self._time_order = None
+        self._centroids = None
+        self._assignments = np.empty(0, dtype=np.int32)
+        self._trained_rows = 0
+
+        conn = self._connection()
+        columns = "".join(f", {field} {'REAL' if kind is float else 'TEXT'}" for field, kind in self.fields.items())
+        conn.execute('CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)')
+        conn.execute(f'CREATE TABLE IF NOT EXISTS items (row INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, document TEXT, metadata TEXT{columns})')
+        with self._transaction() as conn:
+            info = dict(conn.execute('SELECT key, value FROM info').fetchall())
+            if "dtype" not in info:
+                conn.execute("INSERT INTO info (key, value) VALUES ('dtype', ?)", (np.dtype(dtype).name,))
+                info["dtype"] = np.dtype(dtype).name
+            self.dtype = np.dtype(info["dtype"])
+            self.dim = int(info["dim"]) if "dim" in info else None
+            self._recover(conn)
+        with self._lock:
+            self._refresh()
+        if self.ivf_min_rows:
+            self._load_ivf()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            conn.execute('PRAGMA busy_timeout = 30000')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _rows_of(self, conn, ids: List[str]) -> Dict[str, int]:
+        rows = {}
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            rows.update(conn.execute(f'SELECT id, row FROM items WHERE id IN ({",".join("?" * len(batch))})', batch).fetchall())
+        return rows
+
+    def _row_bytes(self) -> int:
+        return self.dim * self.dtype.itemsize
+
+    def _recover(self, conn):
+        """Make the matrix and the side table agree after a crash between writing one and the other."""
+        rows = conn.execute('SELECT COALESCE(MAX(row) + 1, 0) FROM items').fetchone()[0]
+        if self.dim is None or not os.path.exists(self.vectors_path):
+            return
+        written = os.path.getsize(self.vectors_path) // self._row_bytes()
+        if written < rows:
+            conn.execute('DELETE FROM items WHERE row >= ?', (written,))
+        if os.path.getsize(self.vectors_path) != min(written, rows) * self._row_bytes():
+            with open(self.vectors_path, 'r+b') as f:
+                f.truncate(min(written, rows) * self._row_bytes())
+
+    def _refresh(self):
+        """Load rows appended since the last call, including those written by other processes. Caller holds the lock."""
+        conn = self._connection()
+        if self.dim is None:
+            value = conn.execute("SELECT value FROM info WHERE key = 'dim'").fetchone()
+            if value is None:
+                return
+            self.dim = int(value[0])
+        rows = conn.execute('SELECT COALESCE(MAX(row) + 1, 0) FROM items').fetchone()[0]
+        if rows <= self._count:
+            return
+        names = list(self.fields)
+        new = conn.execute(f'SELECT {", ".join(names)} FROM items WHERE row >= ? ORDER BY row', (self._count,)).fetchall()
+        self._append_columns(self._count, {name: [row[index] for row in new] for index, name in enumerate(names)})
+        self._count = rows
+        self._vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode='r', shape=(rows, self.dim))
+        self._assign_new_rows()
+
+    def _append_columns(self, start: int, values: Dict[str, List]):
+        times = np.asarray([np.nan if value is None else value for value in values[self.time_field]], dtype=np.float64)
+        if len(times):
+            previous = self._columns[self.time_field].data[start - 1] if start else -np.inf
+            self._sorted = self._sorted and previous <= times[0] and bool(np.all(np.diff(times) >= 0))
+        for field, column in self._columns.items():
+            column.put(start, values[field])
+        self._time_order = None
+
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return self._count
+
+    def _normalize(self, embeddings) -> np.ndarray:
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix[None, :]
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def upsert(self, ids, embeddings, metadatas, documents):
+        if not ids:
+            return
+        matrix = self._normalize(embeddings)
+        with self._lock:
+            self._write(ids, matrix, metadatas, documents)
+
+    def _write(self, ids, matrix, metadatas, documents):
+        with self._transaction() as conn:
+            if self.dim is None:
+                self._refresh()
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+                conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('dim', ?)", (str(self.dim),))
+            if matrix.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional embeddings, got {matrix.shape[1]}")
+            # Catch up with rows other processes appended, so new rows get the next free numbers
+            self._refresh()
+
+            existing = self._rows_of(conn, ids)
+            # Later duplicates of an id win, as with Chroma
+            latest = {id_: index for index, id_ in enumerate(ids)}
+            updates = [index for id_, index in latest.items() if id_ in existing]
+            appends = [index for id_, index in latest.items() if id_ not in existing]
+
+            names = list(self.fields)
+            placeholders = ", ".join("?" * (4 + len(names)))
+            with open(self.vectors_path, 'r+b' if os.path.exists(self.vectors_path) else 'w+b') as f:
+                for index in updates:
+                    f.seek(existing[ids[index]] * self._row_bytes())
+                    f.write(matrix[index].astype(self.dtype).tobytes())
+                if appends:
+                    f.seek(self._count * self._row_bytes())
+                    f.write(matrix[appends].astype(self.dtype).tobytes())
+            conn.executemany(
+                f'UPDATE items SET document = ?, metadata = ?{"".join(f", {name} = ?" for name in names)} WHERE row = ?',
+                [(documents[index], json.dumps(metadatas[index]), *[metadatas[index].get(name) for name in names],
+                  existing[ids[index]]) for index in updates])
+            conn.executemany(
+                f'INSERT INTO items (row, id, document, metadata{"".join(f", {name}" for name in names)}) VALUES ({placeholders})',
+                [(self._count + offset, ids[index], documents[index], json.dumps(metadatas[index]),
+                  *[metadatas[index].get(name) for name in names]) for offset, index in enumerate(appends)])
+
+        if updates:
+            rows = np.array([existing[ids[index]] for index in updates])
+            self._set_columns(rows, [metadatas[index] for index in updates])
+            if self._centroids is not None:
+                self._assignments[rows] = self._assign(matrix[updates])
+        self._refresh()
+
+    def _set_columns(self, rows: np.ndarray, metadatas: List[Dict]):
+        for field, column in self._columns.items():
+            column.set(rows, [metadata.get(field) for metadata in metadatas])
+        times = self._columns[self.time_field].data[:self._count]
+        self._sorted = bool(np.all(np.diff(times) >= 0))
+        self._time_order = None
+
+    def update_metadata(self, ids, metadatas):
+        if not ids:
+            return
+        names = list(self.fields)
+        with self._lock, self._transaction() as conn:
+            rows = self._rows_of(conn, ids)
+            pairs = [(rows[id_], metadata) for id_, metadata in zip(ids, metadatas) if id_ in rows]
+            conn.executemany(
+                f'UPDATE items SET metadata = ?{"".join(f", {name} = ?" for name in names)} WHERE row = ?',
+                [(json.dumps(metadata), *[metadata.get(name) for name in names], row) for row, metadata in pairs])
+            self._refresh()
+            if pairs:
+                self._set_columns(np.array([row for row, _ in pairs]), [metadata for _, metadata in pairs])
+
+    def get(self, limit=None, offset=0):
+        results = self._connection().execute('SELECT id, document, metadata FROM items ORDER BY row LIMIT ? OFFSET ?',
+                                             (-1 if limit is None else limit, offset)).fetchall()
+        return [{"id": id_, "document": document, "metadata": json.loads(metadata)} for id_, document, metadata in results]
+
+    def _time_bounds(self, where: Optional[Dict]):
+        """A (low, high) range of `time_field` that every row matching `where` falls into."""
+        if not where:
+            return -np.inf, np.inf
+        if "$and" in where:
+            bounds = [self._time_bounds(clause) for clause in where["$and"]]
+            return max(low for low, _ in bounds), min(high for _, high in bounds)
+        if "$or" in where:
+            bounds = [self._time_bounds(clause) for clause in where["$or"]]
+            return min(low for low, _ in bounds), max(high for _, high in bounds)
+        low, high = -np.inf, np.inf
+        condition = where.get(self.time_field)
+        if condition is None:
+            return low, high
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, value in condition.items():
+            if op in ("$gte", "$gt", "$eq"):
+                low = max(low, value)
+            if op in ("$lte", "$lt", "$eq"):
+                high = min(high, value)
+        return low, high
+
+    def _evaluate(self, where: Dict, rows) -> np.ndarray:
+        """Boolean mask of `rows` (a slice or an index array) matching a Chroma `where` clause."""
+        if "$and" in where:
+            return np.logical_and.reduce([self._evaluate(clause, rows) for clause in where["$and"]])
+        if "$or" in where:
+            return np.logical_or.reduce([self._evaluate(clause, rows) for clause in where["$or"]])
+        mask = None
+        for field, condition in where.items():
+            if field not in self._columns:
+                raise ValueError(f"'{field}' is not a filterable field of the {self.name} vector store")
+            column = self._columns[field]
+            values = column.data[:self._count][rows]
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for op, value in condition.items():
+                if column.kind is str:
+                    value = [column.code(item) for item in value] if op in ("$in", "$nin") else column.code(value)
+                if op == "$eq":
+                    matched = values == value
+                elif op == "$ne":
+                    matched = values != value
+                elif op == "$gt":
+                    matched = values > value
+                elif op == "$gte":
+                    matched = values >= value
+                elif op == "$lt":
+                    matched = values < value
+                elif op == "$lte":
+                    matched = values <= value
+                elif op == "$in":
+                    matched = np.isin(values, value)
+                elif op == "$nin":
+                    matched = ~np.isin(values, value)
+                else:
+                    raise ValueError(f"Unsupported where operator '{op}'")
+                mask = matched if mask is None else mask & matched
+        return mask
+
+    def _document_rows(self, where_document: Dict, first: int, last: int) -> np.ndarray:
+        """Rows in [first, last) whose document matches a Chroma `where_document` clause."""
+        if "$and" in where_document:
+            return functools.reduce(np.intersect1d, [self._document_rows(clause, first, last) for clause in where_document["$and"]])
+        if "$or" in where_document:
+            return functools.reduce(np.union1d, [self._document_rows(clause, first, last) for clause in where_document["$or"]])
+        if "$contains" in where_document:
+            sql, text = 'instr(document, ?) > 0', where_document["$contains"]
+        elif "$not_contains" in where_document:
+            sql, text = 'instr(document, ?) = 0', where_document["$not_contains"]
+        else:
+            raise ValueError(f"Unsupported where_document clause {where_document}")
+        rows = self._connection().execute(f'SELECT row FROM items WHERE row >= ? AND row < ? AND {sql}',
+                                          (first, last, text)).fetchall()
+        return np.array([row for row, in rows], dtype=np.int64)
+
+    def _candidates(self, where: Optional[Dict], where_document: Optional[Dict]):
+        """Rows passing the filters: a slice when they are one contiguous run, else a sorted index array."""
+        times = self._columns[self.time_field].data[:self._count]
+        low, high = self._time_bounds(where)
+        if self._sorted:
+            first = 0 if low == -np.inf else int(np.searchsorted(times, low, side='left'))
+            last = self._count if high == np.inf else int(np.searchsorted(times, high, side='right'))
+            rows = slice(first, max(first, last))
+        else:
+            if self._time_order is None:
+                self._time_order = np.argsort(times, kind='stable')
+            sorted_times = times[self._time_order]
+            first = 0 if low == -np.inf else int(np.searchsorted(sorted_times, low, side='left'))
+            last = self._count if high == np.inf else int(np.searchsorted(sorted_times, high, side='right'))
+            rows = np.sort(self._time_order[first:max(first, last)])
+            first, last = (int(rows[0]), int(rows[-1]) + 1) if len(rows) else (0, 0)
+
+        if where:
+            mask = self._evaluate(where, rows)
+            if not mask.all():
+                rows = (np.arange(rows.start, rows.stop) if isinstance(rows, slice) else rows)[mask]
+        if where_document:
+            matching = self._document_rows(where_document, first, last)
+            rows = np.intersect1d(np.arange(rows.start, rows.stop) if isinstance(rows, slice) else rows, matching)
+        return rows
+
+    def _scan(self, vectors, query: np.ndarray, rows, n_results: int):
+        """Exact top `n_results` of `rows` by dot product with the normalised `query`."""
+        total = rows.stop - rows.start if isinstance(rows, slice) else len(rows)
+        found_rows, found_scores = [], []
+        for offset in range(0, total, _CHUNK_ROWS):
+            if isinstance(rows, slice):
+                chunk_rows = np.arange(rows.start + offset, min(rows.stop, rows.start + offset + _CHUNK_ROWS))
+                block = vectors[chunk_rows[0]:chunk_rows[-1] + 1]
+            else:
+                chunk_rows = rows[offset:offset + _CHUNK_ROWS]
+                block = vectors[chunk_rows]
+            scores = np.asarray(block, dtype=np.float32) @ query
+            if len(scores) > n_results:
+                top = np.argpartition(-scores, n_results - 1)[:n_results]
+                chunk_rows, scores = chunk_rows[top], scores[top]
+            found_rows.append(chunk_rows)
+            found_scores.append(scores)
+        if not found_rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        found_rows, found_scores = np.concatenate(found_rows), np.concatenate(found_scores)
+        order = np.argsort(-found_scores, kind='stable')[:n_results]
+        return found_rows[order], found_scores[order]
+
+    def query(self, embedding, n_results=5, where=None, where_document=None):
+        query = self._normalize(embedding)[0]
+        with self._lock:
+            self._refresh()
+            if not self._count or n_results <= 0:
+                return []
+            if query.shape[0] != self.dim:
+                raise ValueError(f"Expected a {self.dim}-dimensional query, got {query.shape[0]}")
+            rows = self._candidates(where, where_document)
+            vectors = self._vectors
+            total = rows.stop - rows.start if isinstance(rows, slice) else len(rows)
+            probed = None
+            if self.ivf_min_rows and total >= self.ivf_min_rows:
+                self._ensure_ivf()
+                probes = np.argsort(-(self._centroids @ query))[:self.nprobe]
+                assignments = self._assignments[:self._count][rows]
+                probed = (np.arange(rows.start, rows.stop) if isinstance(rows, slice) else rows)[np.isin(assignments, probes)]
+
+        found, scores = (np.empty(0, dtype=np.int64), None) if probed is None else self._scan(vectors, query, probed, n_results)
+        if len(found) < min(n_results, total):
+            # No coarse index, or the probed clusters hold too few matches: scan every candidate
+            found, scores = self._scan(vectors, query, rows, n_results)
+        return self._fetch(found, scores)
+
+    def _fetch(self, rows: np.ndarray, scores: np.ndarray) -> List[Dict]:
+        if not len(rows):
+            return []
+        results = self._connection().execute(
+            f'SELECT row, id, document, metadata FROM items WHERE row IN ({",".join("?" * len(rows))})',
+            [int(row) for row in rows]).fetchall()
+        by_row = {row: (id_, document, metadata) for row, id_, document, metadata in results}
+        return [
+            {"id": by_row[int(row)][0], "document": by_row[int(row)][1], "metadata": json.loads(by_row[int(row)][2]),
+             # Cosine distance, as Chroma reports it
+             "distance": float(1 - score)}
+            for row, score in zip(rows, scores) if int(row) in by_row
+        ]
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(np.asarray(vectors, dtype=np.float32) @ self._centroids.T, axis=1).astype(np.int32)
+
+    def _assign_new_rows(self):
+        """Put rows added since the last call into their nearest cluster. Caller holds the lock."""
+        if self._centroids is None or len(self._assignments) >= self._count:
+            return
+        start = len(self._assignments)
+        assignments = np.empty(self._count, dtype=np.int32)
+        assignments[:start] = self._assignments
+        for offset in range(start, self._count, _CHUNK_ROWS):
+            assignments[offset:offset + _CHUNK_ROWS] = self._assign(self._vectors[offset:offset + _CHUNK_ROWS])
+        self._assignments = assignments
+
+    def _ensure_ivf(self, iterations: int = 10, sample_per_cluster: int = 32):
+        """Train the coarse index (spherical k-means on a sample) if missing or the store has doubled since. Caller holds the lock."""
+        if self._centroids is not None and self._count < 2 * self._trained_rows:
+            return
+        if self._centroids is None:
+            print(f"Training a coarse index for {self.name} ({self._count} rows); searches over {self.ivf_min_rows} "
+                  f"or more rows now scan the {self.nprobe} nearest clusters (set VECTOR_IVF_MIN_ROWS=0 for exact search)")
+        clusters = max(1, min(4096, int(np.sqrt(self._count))))
+        rng = np.random.default_rng(0)
+        sample_rows = np.sort(rng.choice(self._count, size=min(self._count, clusters * sample_per_cluster), replace=False))
+        sample = np.asarray(self._vectors[sample_rows], dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), size=clusters, replace=False)]
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            order = np.argsort(labels, kind='stable')
+            present, starts = np.unique(labels[order], return_index=True)
+            # Clusters that lost all their points keep their previous centroid
+            sums = centroids.copy()
+            sums[present] = np.add.reduceat(sample[order], starts, axis=0)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.where(norms == 0, 1, norms)
+        self._centroids = centroids
+        self._trained_rows = self._count
+        self._assignments = np.empty(0, dtype=np.int32)
+        self._assign_new_rows()
+        np.savez(self.ivf_path, centroids=self._centroids, assignments=self._assignments)
+
+    def _load_ivf(self):
+        if not os.path.exists(self.ivf_path):
+            return
+        try:
+            with np.load(self.ivf_path) as saved:
+                centroids, assignments = saved["centroids"], saved["assignments"]
+        except Exception as e:
+            print(f"Warning: ignoring unreadable coarse index {self.ivf_path}: {str(e)}")
+            return
+        with self._lock:
+            if centroids.shape[1] != self.dim or len(assignments) > self._count:
+                return
+            self._centroids = centroids
+            self._trained_rows = len(assignments)
+            self._assignments = assignments
+            self._assign_new_rows()
+
+# Metadata fields the vector stores filter on, and the field their rows are ordered by
+ACTIVITY_FIELDS = {"created_at": float, "process_name": str}
+SESSION_FIELDS = {"start_ts": float, "end_ts": float, "process_name": str}
+
+BACKENDS = ("chroma", "numpy")
+
+def open_vector_store(backend: str, path: str, name: str, fields: Dict[str, type], time_field: str, **options) -> VectorStore:
+    if backend == "chroma":
+        return ChromaVectorStore(path, name)
+    if backend == "numpy":
+        return NumpyVectorStore(path, name, fields, time_field, **options)
+    raise ValueError(f"Unknown vector store backend '{backend}', expected one of {list(BACKENDS)}")
@@ -3,18 +3,43 @@ import google.generativeai as genai
 from abc import ABC, abstractmethod
 from .data_manager import DataManager, VectorDataManager
 import json
-from typing import List
+from typing import List, Tuple, Union
 from .embedding_processor import GeminiEmbeddingStrategy, LocalEmbeddingStrategy
+from .embedding_cache import CachedEmbeddingStrategy
 import requests
 from typing import Optional
 from .encryption_manager import EncryptionManager
-import tempfile
+from .utils import detect_image_mime
+from PIL import Image
+import io
+import socket
+import uuid
+
+ImageInput = Union[str, bytes, bytearray, memoryview, Image.Image]
 
 class VisionStrategy(ABC):
     @abstractmethod
-    def process_image(self, image_path, prompt):
+    def process_image(self, image: ImageInput, prompt):
+        """Caption an image given as a file path, encoded image bytes or a PIL image."""
         pass
 
+    def load_image(self, image: ImageInput) -> Tuple[bytes, str]:
+        """Return the encoded bytes and MIME type of `image`, reading from disk only for paths."""
+        if isinstance(image, str):
+            if not os.path.exists(image):
+                raise Exception("Error: Image file does not exist")
+            if not os.path.isfile(image):
+                raise Exception("Error: Provided path is not a file")
+            with open(image, "rb") as image_file:
+                data = image_file.read()
+        elif isinstance(image, Image.Image):
+            buffer = io.BytesIO()
+            image.convert("RGB").save(buffer, format="JPEG", quality=95)
+            data = buffer.getvalue()
+        else:
+            data = bytes(image)
+        return data, detect_image_mime(data)
+
     def decrypt_image_from_path(self):
         pass
 
@@ -43,8 +68,10 @@ class GoogleGeminiStrategy(VisionStrategy):
             }
         )
 
-    def process_image(self, image_path, prompt):
-        file = genai.upload_file(image_path, mime_type="image/jpeg")
+    def process_image(self, image, prompt):
+        data, mime_type = self.load_image(image)
+        # Send the image inline with the request instead of uploading it through the Files API first
+        file = {"mime_type": mime_type, "data": data}
         chat_session = self.model.start_chat(
             history=[
                 {
@@ -65,17 +92,12 @@ class LocalModelStrategy(VisionStrategy):
         self.url = url
         self.timeout = timeout
 
-    def process_image(self, image_path: str, prompt: str) -> str:
-        if not os.path.exists(image_path):
-            raise Exception("Error: Image file does not exist")
-
-        if not os.path.isfile(image_path):
-            raise Exception("Error: Provided path is not a file")
+    def process_image(self, image: ImageInput, prompt: str) -> str:
+        data, mime_type = self.load_image(image)
 
         try:
-            with open(image_path, "rb") as image_file:
-                files = {"file": image_file}
-                response = requests.post(self.url, files=files, timeout=self.timeout, data={"action_type": "<MORE_DETAILED_CAPTION>"})
+            files = {"file": ("screenshot." + mime_type.split("/")[1], data, mime_type)}
+            response = requests.post(self.url, files=files, timeout=self.timeout, data={"action_type": "<MORE_DETAILED_CAPTION>"})
             
             response.raise_for_status()  # Raises an HTTPError for bad responses
 
@@ -91,52 +113,86 @@ class LocalModelStrategy(VisionStrategy):
             raise e
 
 class VisionProcessor:
-    def __init__(self, strategy: str = "google"):
+    def __init__(self, strategy: str = "google", worker_id: Optional[str] = None, batch_size: int = 8,
+                 lease_seconds: int = 300, max_attempts: int = 5):
         self.data_manager = DataManager()
         self.encryption_manager = EncryptionManager()
         if strategy == "google":
             self.strategy = GoogleGeminiStrategy()
-            self.embedding_strategy = GeminiEmbeddingStrategy()
+            self.embedding_strategy = CachedEmbeddingStrategy(GeminiEmbeddingStrategy())
         elif strategy == "local":
             self.strategy = LocalModelStrategy()
-            self.embedding_strategy = LocalEmbeddingStrategy()
+            self.embedding_strategy = CachedEmbeddingStrategy(LocalEmbeddingStrategy())
         else:
             raise ValueError("Invalid strategy")
         self.vector_data_manager = VectorDataManager(embedding_strategy=self.embedding_strategy)
-
-    def secure_delete(self, path):
-        """Securely delete a file by overwriting it with random data before unlinking."""
-        if os.path.isfile(path):
-            with open(path, "ba+") as delfile:
-                length = delfile.tell()
-            with open(path, "br+") as delfile:
-                delfile.seek(0)
-                delfile.write(os.urandom(length))
-            os.unlink(path)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
 
     def process_unprocessed_activities(self):
-        activities = self.data_manager.get_unprocessed_activities()
-        for activity in activities:
-            encrypted_screenshot_path = activity['screenshot']
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-                decrypted_screenshot_path = temp_file.name
-
+        """Claim and process batches of pending activities until none are claimable. Returns the number processed."""
+        processed = 0
+        while True:
+            activities = self.data_manager.claim_activities(self.worker_id, self.batch_size, self.lease_seconds, self.max_attempts)
+            if not activities:
+                return processed
+
+            captioned = []
+            for index, activity in enumerate(activities):
+                try:
+                    image = self.decrypt_screenshot(activity)
+                    captioned.append((activity, self.caption_activity(activity, image)))
+                except Exception as e:
+                    self.fail_activity(activity, e)
+
+                remaining = [pending['timestamp'] for pending in activities[index + 1:]]
+                self.data_manager.renew_lease(remaining, self.worker_id, self.lease_seconds)
+
+            if not captioned:
+                continue
+            # Embed and store the whole batch at once
             try:
-                self.encryption_manager.decrypt_file(encrypted_screenshot_path, decrypted_screenshot_path)
-                prompt = self.strategy.generate_prompt(activity=activity)
-                current_activity = json.loads(activity.get("active_window", "{}"))
-                analysis = f"Current Activity Title: {current_activity.get('title', '')}\n" + self.strategy.process_image(decrypted_screenshot_path, prompt)
-                # Update activity with analysis
-                activity['analysis'] = analysis
-                self.data_manager.update_activity(activity['timestamp'], activity)
-                self.data_manager.mark_activity_as_processed(activity['timestamp'])
-                
-                self.vector_data_manager.add_activity(
-                    timestamp=activity['timestamp'],
-                    created_at=activity['created_at'],
-                    screenshot_path=encrypted_screenshot_path,
-                    active_window=json.loads(activity['active_window']),
-                    analysis=analysis
-                )
-            finally:
-                self.secure_delete(decrypted_screenshot_path)
\ No newline at end of file
+                embeddings = self.embedding_strategy.create_embeddings([analysis for _, analysis in captioned])
+                self.store_activities(captioned, embeddings)
+            except Exception as e:
+                for activity, _ in captioned:
+                    self.fail_activity(activity, e)
+                continue
+            processed += sum(1 for activity, _ in captioned if self.data_manager.complete_activity(activity['timestamp'], self.worker_id))
+
+    def fail_activity(self, activity, error):
+        print(f"Error processing activity {activity['timestamp']}: {str(error)}")
+        if self.data_manager.fail_activity(activity['timestamp'], self.worker_id, error, self.max_attempts):
+            print(f"Giving up on activity {activity['timestamp']} after {self.max_attempts} attempts")
+
+    def decrypt_screenshot(self, activity) -> bytes:
+        """Decrypt the activity's screenshot in memory; the plaintext never touches the disk."""
+        return self.encryption_manager.decrypt_to_bytes(activity['screenshot'])
+
+    def caption_activity(self, activity, image: ImageInput):
+        prompt = self.strategy.generate_prompt(activity=activity)
+        current_activity = json.loads(activity.get("active_window", "{}"))
+        return f"Current Activity Title: {current_activity.get('title', '')}\n" + self.strategy.process_image(image, prompt)
+
+    def store_activity(self, activity, analysis, embedding=None):
+        self.store_activities([(activity, analysis)], [embedding] if embedding is not None else None)
+
+    def store_activities(self, captioned, embeddings=None):
+        """Save (activity, analysis) pairs to SQLite and add them to the vector store in bulk."""
+        for activity, analysis in captioned:
+            # Update activity with analysis
+            activity['analysis'] = analysis
+            self.data_manager.update_activity(activity['timestamp'], activity)
+
+        self.vector_data_manager.add_activities([
+            {
+                "timestamp": activity['timestamp'],
+                "created_at": activity['created_at'],
+                "screenshot_path": activity['screenshot'],
+                "active_window": json.loads(activity['active_window']),
+                "analysis": analysis,
+            }
+            for activity, analysis in captioned
+        ], embeddings=embeddings)
@@ -1,3 +1,4 @@
+import win32api
 import win32gui
 import win32process
 import psutil
@@ -26,6 +27,13 @@ class WindowInfo:
                 return {"title": title, "process_name": "Unknown"}
         return None
 
+    @staticmethod
+    def get_idle_seconds():
+        """Seconds since the last keyboard or mouse input."""
+        # Both are 32-bit millisecond tick counts, so mask to survive the ~49 day wraparound
+        idle_ms = (win32api.GetTickCount() - win32api.GetLastInputInfo()) & 0xFFFFFFFF
+        return idle_ms / 1000
+
     @staticmethod
     def get_user_applications():
         def callback(hwnd, windows):